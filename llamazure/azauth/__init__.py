@@ -0,0 +1,3 @@
+from llamazure.azauth.azauth import BearerToken, TokenPolicy, TokenProvider, shared
+
+__all__ = ["TokenProvider", "TokenPolicy", "BearerToken", "shared"]
@@ -0,0 +1,164 @@
+"""Share Azure tokens between clients, refreshing them before they expire"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Set, Tuple
+
+l = logging.getLogger(__name__)
+
+Scopes = Tuple[str, ...]
+
+
+@dataclass
+class TokenPolicy:
+	"""Parameters for refreshing tokens"""
+
+	refresh_before: float = 300  # refresh a token in the background when it expires in less than this many seconds
+	min_validity: float = 30  # a token which expires in less than this many seconds is refreshed before it is used
+	retry_interval: float = 30  # wait this many seconds before retrying a background refresh which failed
+
+
+@dataclass
+class TokenStats:
+	"""Metrics for a TokenProvider"""
+
+	hits: int = 0  # tokens which were served from the cache
+	fetches: int = 0  # tokens fetched from the credential while a caller waited
+	refreshes: int = 0  # tokens fetched from the credential in the background
+	failed_refreshes: int = 0
+
+
+def spawn_daemon(f: Callable[[], None]):
+	"""Run a function in a daemon thread"""
+	threading.Thread(target=f, name="llamazure-token-refresh", daemon=True).start()
+
+
+class TokenProvider:
+	"""
+	Get tokens from an Azure credential, caching them for each scope and refreshing them in the background before they expire.
+
+	A TokenProvider has a `get_token` method like a credential, so you can use it wherever a credential is used.
+	Concurrent callers which need a new token wait for a single call to the credential.
+	Share one TokenProvider between clients so they share tokens. `shared` returns the same TokenProvider for the same credential.
+
+	>>> tokens = TokenProvider(DefaultAzureCredential())
+	>>> graph = Graph.from_credential(tokens)
+	"""
+
+	def __init__(self, credential, policy: TokenPolicy = TokenPolicy(), clock: Callable[[], float] = time.time, spawn: Callable[[Callable[[], None]], Any] = spawn_daemon):
+		self.credential = credential
+		self.policy = policy
+		self.clock = clock
+		self.spawn = spawn  # runs a background refresh
+		self.stats = TokenStats()
+
+		self._lock = threading.Lock()
+		self._tokens: Dict[Scopes, Any] = {}
+		self._fetching: Dict[Scopes, threading.Lock] = {}
+		self._refreshing: Set[Scopes] = set()
+		self._retry_at: Dict[Scopes, float] = {}
+
+	def get_token(self, *scopes: str, **kwargs):
+		"""
+		Get a token for some scopes, like `credential.get_token`.
+		Tokens requested with extra arguments, like `claims` or `tenant_id`, are not cached.
+		"""
+		if kwargs:
+			return self.credential.get_token(*scopes, **kwargs)
+
+		token = self._tokens.get(scopes)
+		if token is not None:
+			remaining = token.expires_on - self.clock()
+			if remaining > self.policy.min_validity:
+				with self._lock:
+					self.stats.hits += 1
+				if remaining <= self.policy.refresh_before:
+					self._refresh_in_background(scopes)
+				return token
+		return self._fetch(scopes, background=False)
+
+	def bearer(self, *scopes: str) -> BearerToken:
+		"""A token for some scopes which is always fresh, for clients which read `.token` for each request"""
+		return BearerToken(self, scopes)
+
+	def _fetch(self, scopes: Scopes, background: bool):
+		"""Fetch a token from the credential. Concurrent fetches for the same scopes wait for the first one"""
+		with self._lock:
+			fetching = self._fetching.setdefault(scopes, threading.Lock())
+		with fetching:
+			token = self._tokens.get(scopes)
+			if token is not None and token.expires_on - self.clock() > self.policy.refresh_before:
+				return token  # fetched while we waited
+			token = self.credential.get_token(*scopes)
+			with self._lock:
+				self._tokens[scopes] = token
+				if background:
+					self.stats.refreshes += 1
+				else:
+					self.stats.fetches += 1
+			return token
+
+	def _refresh_in_background(self, scopes: Scopes):
+		with self._lock:
+			if scopes in self._refreshing or self.clock() < self._retry_at.get(scopes, 0.0):
+				return
+			self._refreshing.add(scopes)
+
+		def refresh():
+			try:
+				self._fetch(scopes, background=True)
+			except Exception:  # pylint: disable=broad-except
+				# the current token is still valid, and it will be fetched while the caller waits once it isn't
+				l.warning("failed to refresh token in the background scopes=%s", scopes, exc_info=True)
+				with self._lock:
+					self.stats.failed_refreshes += 1
+					self._retry_at[scopes] = self.clock() + self.policy.retry_interval
+			finally:
+				with self._lock:
+					self._refreshing.discard(scopes)
+
+		self.spawn(refresh)
+
+
+class BearerToken:
+	"""
+	A token for some scopes which reads the current token from a TokenProvider.
+	Give this to clients which read `token.token` for each request, so they never use an expired token.
+	"""
+
+	def __init__(self, provider: TokenProvider, scopes: Scopes):
+		self.provider = provider
+		self.scopes = scopes
+
+	@property
+	def token(self) -> str:
+		return self.provider.get_token(*self.scopes).token
+
+	@property
+	def expires_on(self) -> int:
+		return self.provider.get_token(*self.scopes).expires_on
+
+
+_shared: weakref.WeakValueDictionary[int, TokenProvider] = weakref.WeakValueDictionary()
+"""TokenProviders by the id of their credential. A provider holds its credential, so the id isn't reused while the provider is alive"""
+_shared_lock = threading.Lock()
+
+
+def shared(credential) -> TokenProvider:
+	"""
+	The TokenProvider for a credential, shared by all clients created from it while any of them are alive.
+	A TokenProvider is its own shared provider.
+	"""
+	if isinstance(credential, TokenProvider):
+		return credential
+	with _shared_lock:
+		provider = _shared.get(id(credential))
+		if provider is None or provider.credential is not credential:
+			provider = TokenProvider(credential)
+			_shared[id(credential)] = provider
+	return provider
@@ -0,0 +1,169 @@
+"""Tests for sharing and refreshing tokens"""
+
+# pylint: disable=protected-access
+import gc
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from azure.core.credentials import AccessToken
+
+from llamazure.azauth.azauth import TokenPolicy, TokenProvider, shared
+
+MGMT = "https://management.azure.com//.default"
+MSGRAPH = "https://graph.microsoft.com/.default"
+
+
+class Clock:
+	def __init__(self):
+		self.now = 1000.0
+
+	def __call__(self) -> float:
+		return self.now
+
+
+class Credential:
+	"""A credential which issues numbered tokens which last for an hour"""
+
+	def __init__(self, clock=time.time, delay: float = 0.0, lifetime: int = 3600):
+		self.clock = clock
+		self.delay = delay
+		self.lifetime = lifetime
+		self.calls: List[tuple] = []
+		self.fail = False
+
+	def get_token(self, *scopes: str, **kwargs) -> AccessToken:
+		time.sleep(self.delay)
+		if self.fail:
+			raise RuntimeError("failed to get a token")
+		self.calls.append(scopes)
+		return AccessToken(f"token{len(self.calls)}", int(self.clock() + self.lifetime))
+
+
+def provider(**kwargs):
+	clock = Clock()
+	cred = Credential(clock, **kwargs)
+	return TokenProvider(cred, TokenPolicy(refresh_before=300, min_validity=30), clock, spawn=lambda f: f()), cred, clock
+
+
+class TestTokenProvider:
+	def test_cached(self):
+		tokens, cred, _ = provider()
+
+		assert tokens.get_token(MGMT) == tokens.get_token(MGMT)
+		assert len(cred.calls) == 1
+		assert (tokens.stats.fetches, tokens.stats.hits) == (1, 1)
+
+	def test_cached_per_scope(self):
+		tokens, cred, _ = provider()
+
+		assert tokens.get_token(MGMT) != tokens.get_token(MSGRAPH)
+		assert cred.calls == [(MGMT,), (MSGRAPH,)]
+
+	def test_refreshed_before_expiry(self):
+		"""Test that a token close to expiring is still used, and a new one is fetched in the background"""
+		tokens, cred, clock = provider()
+		first = tokens.get_token(MGMT)
+
+		clock.now += 3600 - 200
+		assert tokens.get_token(MGMT) == first
+		assert tokens.stats.refreshes == 1
+
+		assert tokens.get_token(MGMT).token == "token2"
+		assert len(cred.calls) == 2
+
+	def test_expired(self):
+		tokens, cred, clock = provider()
+		tokens.get_token(MGMT)
+
+		clock.now += 3600 - 10
+		assert tokens.get_token(MGMT).token == "token2"
+		assert (tokens.stats.fetches, tokens.stats.refreshes) == (2, 0)
+
+	def test_failed_refresh(self):
+		"""Test that a failed background refresh keeps the current token and is retried later"""
+		tokens, cred, clock = provider()
+		first = tokens.get_token(MGMT)
+
+		cred.fail = True
+		clock.now += 3600 - 200
+		assert tokens.get_token(MGMT) == first
+		assert tokens.get_token(MGMT) == first
+		assert tokens.stats.failed_refreshes == 1  # not retried immediately
+
+		cred.fail = False
+		clock.now += 30
+		tokens.get_token(MGMT)
+		assert tokens.get_token(MGMT).token == "token2"
+
+	def test_extra_arguments_are_not_cached(self):
+		tokens, cred, _ = provider()
+
+		tokens.get_token(MGMT)
+		tokens.get_token(MGMT, tenant_id="other")
+
+		assert len(cred.calls) == 2
+
+	def test_concurrent_callers_share_a_fetch(self):
+		cred = Credential(delay=0.1)
+		tokens = TokenProvider(cred)
+		barrier = threading.Barrier(8)
+
+		def get(_):
+			barrier.wait()
+			return tokens.get_token(MGMT)
+
+		with ThreadPoolExecutor(8) as pool:
+			results = list(pool.map(get, range(8)))
+
+		assert len(cred.calls) == 1
+		assert len(set(results)) == 1
+
+	def test_background_thread(self):
+		"""Test refreshing with the default daemon thread"""
+		clock = Clock()
+		cred = Credential(clock)
+		tokens = TokenProvider(cred, clock=clock)
+		tokens.get_token(MGMT)
+
+		clock.now += 3600 - 200
+		tokens.get_token(MGMT)
+		for _ in range(100):
+			if tokens.stats.refreshes:
+				break
+			time.sleep(0.01)
+
+		assert tokens.get_token(MGMT).token == "token2"
+
+
+class TestBearerToken:
+	def test_fresh(self):
+		tokens, _, clock = provider()
+		bearer = tokens.bearer(MGMT)
+
+		assert bearer.token == "token1"
+		clock.now += 3600
+		assert bearer.token == "token2"
+		assert bearer.expires_on == clock.now + 3600
+
+
+class TestShared:
+	def test_same_credential(self):
+		cred = Credential()
+		assert shared(cred) is shared(cred)
+		assert shared(cred) is not shared(Credential())
+
+	def test_provider_is_shared(self):
+		tokens = TokenProvider(Credential())
+		assert shared(tokens) is tokens
+
+	def test_released(self):
+		"""Test that a shared provider is released when no client holds it"""
+		cred = Credential()
+		ref = weakref.ref(shared(cred))
+		gc.collect()
+
+		assert ref() is None
+		assert shared(cred).credential is cred
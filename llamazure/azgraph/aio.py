@@ -0,0 +1,278 @@
+"""Async interface to the Azure Resource Graph"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple, cast
+
+import aiohttp
+
+from llamazure.azauth import shared
+from llamazure.azgraph import codec, kql
+from llamazure.azgraph.azgraph import ARG_URL, SUBSCRIPTIONS_URL, LookupPolicy, RetryPolicy, ShardPolicy, accumulate, merge_shards, next_req, route, shard, skip_to
+from llamazure.azgraph.cache import Cache
+from llamazure.azgraph.models import Req, Res, ResErr, ResMaybe, Table
+from llamazure.azgraph.throttle import Throttle
+
+_DONE = object()
+
+
+class AsyncGraph:
+	"""
+	Access the Azure Resource Graph with asyncio
+
+	This has the same methods as `Graph`, but they are coroutines.
+	At most `concurrency` requests are in flight at once, so you can submit many queries without being throttled.
+
+	>>> async with await AsyncGraph.from_credential(DefaultAzureCredential()) as graph:
+	... 	a, b = await graph.gather_queries([Req("Resources | limit 5", graph.subscriptions), Req("ResourceContainers", graph.subscriptions)])
+	"""
+
+	def __init__(
+		self,
+		token,
+		subscriptions: Tuple[str, ...],
+		retry_policy: RetryPolicy = RetryPolicy(),
+		concurrency: int = 8,
+		url: str = ARG_URL,
+		shard_policy: ShardPolicy = ShardPolicy(),
+		cache: Optional[Cache] = None,
+		throttle: Optional[Throttle] = None,
+		json_backend: Optional[codec.JSONBackend] = None,
+		pipeline: bool = False,
+		lookup_policy: LookupPolicy = LookupPolicy(),
+	):
+		self.token = token
+		self.subscriptions = subscriptions
+		self.retry_policy = retry_policy
+		self.shard_policy = shard_policy
+		self.lookup_policy = lookup_policy
+		self.cache = cache
+		self.throttle = throttle or Throttle()
+		self.json_backend = json_backend or codec.default_backend()
+		self.pipeline = pipeline  # fetch the next page of a query while decoding the current one
+		self.url = url
+
+		self.concurrency = concurrency
+		self._semaphore = asyncio.Semaphore(concurrency)
+		self._session: Optional[aiohttp.ClientSession] = None
+
+	@classmethod
+	async def from_credential(cls, credential, concurrency: int = 8) -> AsyncGraph:
+		"""Create from an Azure credential. Tokens are refreshed and shared like in `Graph.from_credential`"""
+		token = shared(credential).bearer("https://management.azure.com//.default")
+		graph = cls(token, cast(Tuple[str, ...], ()), concurrency=concurrency)
+		graph.subscriptions = await graph._get_subscriptions()
+		return graph
+
+	async def _get_subscriptions(self) -> Tuple[str, ...]:
+		async with self.session.get(SUBSCRIPTIONS_URL, headers=self._headers()) as r:
+			raw = await r.json()
+		return cast(Tuple[str, ...], tuple(s["subscriptionId"] for s in raw["value"]))
+
+	@property
+	def session(self) -> aiohttp.ClientSession:
+		"""The HTTP session. This is created on first use, since it must be created inside the event loop"""
+		if self._session is None:
+			self._session = aiohttp.ClientSession()
+		return self._session
+
+	async def close(self):
+		"""Close the HTTP session"""
+		if self._session is not None:
+			await self._session.close()
+			self._session = None
+
+	async def __aenter__(self) -> AsyncGraph:
+		return self
+
+	async def __aexit__(self, *exc):
+		await self.close()
+
+	def _headers(self):
+		return {"Authorization": f"Bearer {self.token.token}", "Content-Type": "application/json"}
+
+	async def q(self, q: str) -> Any:
+		"""Make a graph query"""
+		res = await self.query(Req(q, self.subscriptions))
+		if isinstance(res, ResErr):
+			raise res.exception()
+		return res.data
+
+	async def q_table(self, q: str) -> Table:
+		"""Make a graph query in the table format, which stores the result as columns"""
+		res = await self.query(Req(q, self.subscriptions, options={"resultFormat": "table"}))
+		if isinstance(res, ResErr):
+			raise res.exception()
+		return res.data
+
+	async def lookup(self, keys: Iterable[str], query: str = "Resources", column: str = "id") -> Dict[str, List[Any]]:
+		"""Look up the rows for many keys, like resource IDs, with as few queries as possible. See `Graph.lookup`"""
+		keys = list(keys)
+		queries = kql.pack_in(query, column, keys, self.lookup_policy.max_query_length, self.lookup_policy.max_keys)
+		return route(keys, column, await asyncio.gather(*(self.q(q) for q in queries)))
+
+	async def _exec_query(self, req) -> ResMaybe:
+		return codec.Decoder(self.json_backend).decode_bytes(req, await self._post(req))
+
+	async def _post(self, req: Req) -> bytes:
+		async with self._semaphore:
+			await self.throttle.acquire_async()
+			try:
+				async with self.session.post(self.url, headers=self._headers(), data=self.json_backend.dumps(codec.encode(req))) as r:
+					raw = await r.read()
+			except BaseException:
+				self.throttle.update(0, {})
+				raise
+			self.throttle.update(r.status, r.headers)
+		return raw
+
+	async def query_single(self, req: Req) -> ResMaybe:
+		"""Make a graph query for a single page"""
+		return await self._retry(req, await self._exec_query(req))
+
+	async def _retry(self, req: Req, res: ResMaybe) -> ResMaybe:
+		"""Retry a request which failed, according to the retry policy"""
+		retries = throttled = 0
+		while isinstance(res, ResErr):
+			if self.retry_policy.throttled(res) and throttled < self.retry_policy.throttled_retries:
+				throttled += 1  # the Throttle waits for the quota to reset before the request is sent again
+			elif retries < self.retry_policy.retries and self.retry_policy.retryable(res):
+				retries += 1
+			else:
+				break
+			res = await self._exec_query(req)
+		return res
+
+	async def query_next(self, req: Req, previous: Res) -> ResMaybe:
+		"""Query the next page in a paginated query"""
+		return await self.query_single(next_req(req, previous))
+
+	async def query_iter(self, req: Req) -> AsyncIterator[ResMaybe]:
+		"""
+		Make a graph query, yielding each page as it arrives.
+		If a page fails, the error is yielded and iteration stops.
+
+		Queries over more subscriptions than `shard_policy.size` are sharded, and pages of different shards are interleaved in the order they arrive.
+		The `shard_policy.workers` is not used, since `concurrency` limits the requests in flight.
+		At most 2 pages per request in flight are buffered, so a slow consumer applies backpressure to the shards.
+		"""
+		shards = shard(req, self.shard_policy.size)
+		if len(shards) == 1:
+			async for res in self._pages(req):
+				yield res
+			return
+
+		pages: asyncio.Queue = asyncio.Queue(maxsize=2 * self.concurrency)
+
+		async def run(s: Req):
+			try:
+				async for res in self._pages(s):
+					await pages.put(res)
+			except asyncio.CancelledError:
+				raise
+			except Exception as e:  # pylint: disable=broad-except
+				await pages.put(e)  # raised by the consumer
+			await pages.put(_DONE)
+
+		tasks = [asyncio.create_task(run(s)) for s in shards]
+		try:
+			done = 0
+			while done < len(tasks):
+				item = await pages.get()
+				if item is _DONE:
+					done += 1
+					continue
+				if isinstance(item, Exception):
+					raise item
+				yield item
+				if isinstance(item, ResErr):
+					return
+		finally:
+			for task in tasks:
+				task.cancel()
+			await asyncio.gather(*tasks, return_exceptions=True)
+
+	async def _query_iter_shard(self, req: Req) -> AsyncIterator[ResMaybe]:
+		res = await self.query_single(req)
+		yield res
+		while isinstance(res, Res) and res.skipToken:
+			res = await self.query_next(req, res)
+			yield res
+
+	async def _query_iter_pipelined(self, req: Req) -> AsyncIterator[ResMaybe]:
+		"""
+		Yield the pages of a query, fetching the next page in a task while the current one is decoded and consumed.
+		The skipToken is found in the raw body of a page, so the next page is requested before the page is decoded.
+		"""
+		decoder = codec.Decoder(self.json_backend)
+		current = req
+		fetching: Optional[asyncio.Task[bytes]] = asyncio.create_task(self._post(current))
+		try:
+			while fetching is not None:
+				raw = await fetching
+				token = codec.peek_skip_token(raw)
+				ahead = skip_to(req, token) if token else None
+				fetching = asyncio.create_task(self._post(ahead)) if ahead else None
+
+				res = decoder.decode_bytes(current, raw)
+				if isinstance(res, ResErr):
+					res = await self._retry(current, res)
+				yield res
+				if not isinstance(res, Res) or not res.skipToken:
+					return
+
+				current = next_req(req, res)
+				if ahead != current:  # the token we found wasn't the real one
+					if fetching is not None:
+						fetching.cancel()
+					fetching = asyncio.create_task(self._post(current))
+		finally:
+			if fetching is not None:
+				fetching.cancel()
+
+	def _pages(self, req: Req) -> AsyncIterator[ResMaybe]:
+		"""The pages of a query for a single shard"""
+		if self.pipeline:
+			return self._query_iter_pipelined(req)
+		return self._query_iter_shard(req)
+
+	async def q_iter(self, q: str) -> AsyncIterator[Any]:
+		"""Make a graph query, yielding each row as its page arrives"""
+		async for res in self.query_iter(Req(q, self.subscriptions)):
+			if isinstance(res, ResErr):
+				raise res.exception()
+			for row in res.data:
+				yield row
+
+	async def query(self, req: Req) -> ResMaybe:
+		"""
+		Make a graph query
+
+		Queries over more subscriptions than `shard_policy.size` are sharded, and the shards are queried concurrently.
+		If the Graph has a cache, results are cached unless `req.bypass_cache` is set.
+		"""
+		if self.cache is not None and not req.bypass_cache:
+			cached = self.cache.get(req)
+			if cached is not None:
+				return cached
+
+		shards = shard(req, self.shard_policy.size)
+		if len(shards) == 1:
+			res = await self._query_shard(req)
+		else:
+			res = merge_shards(req, await asyncio.gather(*(self._query_shard(s) for s in shards)))
+
+		if self.cache is not None and isinstance(res, Res):
+			self.cache.set(req, res)
+		return res
+
+	async def _query_shard(self, req: Req) -> ResMaybe:
+		return accumulate([res async for res in self._pages(req)])
+
+	async def gather_queries(self, reqs: Iterable[Req]) -> List[ResMaybe]:
+		"""
+		Make many graph queries concurrently, returning the results in the same order.
+		Pages of a paginated query are fetched in order, but pages of different queries are fetched concurrently.
+		"""
+		return list(await asyncio.gather(*(self.query(req) for req in reqs)))
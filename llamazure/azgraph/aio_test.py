@@ -0,0 +1,232 @@
+"""Tests for the async Azure Resource Graph client"""
+
+# pylint: disable=redefined-outer-name
+import asyncio
+import time
+
+import pytest
+
+from llamazure.azgraph.aio import AsyncGraph
+from llamazure.azgraph.azgraph import LookupPolicy, RetryPolicy, ShardPolicy
+from llamazure.azgraph.conftest import FakeARG, FakeTables, Token
+from llamazure.azgraph.models import AzureGraphException, Req, Res, ResErr
+
+subscriptions = ("00000000-0000-0000-0000-000000000000",)
+
+
+def run(fake: FakeARG, f, concurrency: int = 8, retries: int = 0, pipeline: bool = False):
+	"""Run a coroutine function with an AsyncGraph for the fake"""
+
+	async def go():
+		async with AsyncGraph(Token(), subscriptions, RetryPolicy(retries), concurrency=concurrency, url=fake.url, pipeline=pipeline) as g:
+			return await f(g)
+
+	return asyncio.run(go())
+
+
+class TestAsyncGraph:
+	def test_q(self, fake_arg: FakeARG):
+		fake_arg.rows = [{"id": "0"}, {"id": "1"}]
+
+		assert run(fake_arg, lambda g: g.q("Resources")) == [{"id": "0"}, {"id": "1"}]
+		assert fake_arg.requests[0]["subscriptions"] == list(subscriptions)
+
+	def test_q_raises(self, fake_arg: FakeARG):
+		fake_arg.fail_next = 1
+
+		with pytest.raises(AzureGraphException):
+			run(fake_arg, lambda g: g.q("Resources"))
+
+	def test_paginated(self, fake_arg: FakeARG):
+		fake_arg.rows = list(range(25))
+		fake_arg.page_size = 10
+
+		res = run(fake_arg, lambda g: g.query(Req("Resources", subscriptions, options={"$skip": 0})))
+
+		assert isinstance(res, Res)
+		assert res.data == list(range(25))
+		assert res.count == 25
+		assert len(fake_arg.requests) == 3
+		assert "$skip" not in fake_arg.requests[1]["options"]
+
+	def test_retries(self, fake_arg: FakeARG):
+		fake_arg.rows = [0]
+		fake_arg.fail_next = 2
+
+		assert run(fake_arg, lambda g: g.q("Resources"), retries=2) == [0]
+
+	def test_too_many_errors(self, fake_arg: FakeARG):
+		fake_arg.fail_next = 10
+
+		res = run(fake_arg, lambda g: g.query(Req("Resources", subscriptions)), retries=2)
+
+		assert isinstance(res, ResErr)
+		assert len(fake_arg.requests) == 3
+
+	def test_q_iter(self, fake_arg: FakeARG):
+		fake_arg.rows = list(range(25))
+		fake_arg.page_size = 10
+
+		async def collect(g: AsyncGraph):
+			return [row async for row in g.q_iter("Resources")]
+
+		assert run(fake_arg, collect) == list(range(25))
+
+	def test_lookup(self, fake_arg: FakeARG):
+		fake_arg.query_rows = FakeTables({"resources": [{"id": f"/r{i}"} for i in range(5)]})
+
+		async def lookup():
+			async with AsyncGraph(Token(), subscriptions, url=fake_arg.url, lookup_policy=LookupPolicy(max_keys=2)) as g:
+				return await g.lookup(["/r0", "/R1", "/r2", "/missing"])
+
+		assert asyncio.run(lookup()) == {"/r0": [{"id": "/r0"}], "/R1": [{"id": "/r1"}], "/r2": [{"id": "/r2"}], "/missing": []}
+		assert len(fake_arg.requests) == 2
+
+
+class TestPipelined:
+	def test_query(self, fake_arg: FakeARG):
+		fake_arg.rows = list(range(25))
+		fake_arg.page_size = 10
+
+		res = run(fake_arg, lambda g: g.query(Req("Resources", subscriptions)), pipeline=True)
+
+		assert isinstance(res, Res)
+		assert res.data == list(range(25))
+		assert len(fake_arg.requests) == 3
+
+	def test_overlaps_fetching_and_consuming(self, fake_arg: FakeARG):
+		pages, delay = 8, 0.05
+		fake_arg.rows = list(range(pages))
+		fake_arg.page_size = 1
+		fake_arg.delay = delay
+
+		async def consume(g: AsyncGraph):
+			async for _ in g.query_iter(Req("Resources", subscriptions)):
+				await asyncio.sleep(delay)
+
+		start = time.perf_counter()
+		run(fake_arg, consume, pipeline=True)
+		elapsed = time.perf_counter() - start
+
+		assert elapsed < pages * 2 * delay * 0.8
+
+	def test_retries(self, fake_arg: FakeARG):
+		fake_arg.rows = list(range(4))
+		fake_arg.page_size = 2
+		fake_arg.fail_next = 1
+
+		assert run(fake_arg, lambda g: g.q("Resources"), retries=1, pipeline=True) == list(range(4))
+
+
+class TestSharded:
+	subscriptions = tuple(f"{i:08}-0000-0000-0000-000000000000" for i in range(5))
+
+	def run(self, fake: FakeARG, f):
+		async def go():
+			async with AsyncGraph(Token(), self.subscriptions, url=fake.url, shard_policy=ShardPolicy(size=2)) as g:
+				return await f(g)
+
+		return asyncio.run(go())
+
+	def test_query(self, fake_arg: FakeARG):
+		fake_arg.rows = list(range(3))
+		fake_arg.page_size = 2
+
+		res = self.run(fake_arg, lambda g: g.query(Req("Resources", self.subscriptions)))
+
+		assert sorted(res.data) == sorted(list(range(3)) * 3)
+		assert res.totalRecords == 9
+		assert sorted(len(r["subscriptions"]) for r in fake_arg.requests) == [1, 1, 2, 2, 2, 2]
+
+	def test_query_iter(self, fake_arg: FakeARG):
+		fake_arg.rows = list(range(3))
+		fake_arg.page_size = 2
+
+		async def collect(g: AsyncGraph):
+			return [res async for res in g.query_iter(Req("Resources", self.subscriptions))]
+
+		pages = self.run(fake_arg, collect)
+		assert len(pages) == 6
+		assert sorted(row for page in pages for row in page.data) == sorted(list(range(3)) * 3)
+
+	def test_query_iter_error(self, fake_arg: FakeARG):
+		fake_arg.fail_next = 1
+
+		async def collect(g: AsyncGraph):
+			return [res async for res in g.query_iter(Req("Resources", self.subscriptions))]
+
+		assert isinstance(self.run(fake_arg, collect)[-1], ResErr)
+
+	def test_query_iter_backpressure(self):
+		"""Test that shards wait for a slow consumer instead of buffering all their pages"""
+		produced = []
+
+		async def pages(req: Req):
+			for i in range(50):
+				produced.append(i)
+				yield Res(req, 50, 1, None, (), [i], skipToken="more")
+
+		async def go():
+			async with AsyncGraph(Token(), self.subscriptions, concurrency=2, shard_policy=ShardPolicy(size=1)) as g:
+				g._pages = pages  # type: ignore
+				it = g.query_iter(Req("Resources", self.subscriptions))
+				await it.__anext__()
+				await asyncio.sleep(0.05)  # let the shards run ahead
+				buffered = len(produced)
+				await it.aclose()
+				await asyncio.sleep(0.05)
+				return buffered, len(produced)
+
+		buffered, after_close = asyncio.run(go())
+
+		assert buffered <= 2 * 2 + 2 * len(self.subscriptions)  # the queue, and a page waiting to be put by each shard
+		assert after_close == buffered  # the shards were stopped
+
+	def test_query_iter_exception(self):
+		async def pages(req: Req):
+			yield Res(req, 1, 1, None, (), [0])
+			raise RuntimeError("connection failed")
+
+		async def go():
+			async with AsyncGraph(Token(), self.subscriptions, shard_policy=ShardPolicy(size=1)) as g:
+				g._pages = pages  # type: ignore
+				return [res async for res in g.query_iter(Req("Resources", self.subscriptions))]
+
+		with pytest.raises(RuntimeError):
+			asyncio.run(go())
+
+
+class TestConcurrency:
+	n = 8
+	delay = 0.2
+
+	def gather(self, g: AsyncGraph):
+		return g.gather_queries([Req(f"Resources | limit {i}", subscriptions) for i in range(self.n)])
+
+	def test_gather_is_concurrent(self, fake_arg: FakeARG):
+		"""Test that gathering queries is faster than making them one after another"""
+		fake_arg.rows = [0]
+		fake_arg.delay = self.delay
+
+		start = time.perf_counter()
+		ress = run(fake_arg, self.gather, concurrency=self.n)
+		elapsed = time.perf_counter() - start
+
+		assert all(isinstance(res, Res) for res in ress)
+		assert elapsed < self.n * self.delay / 2
+		assert fake_arg.max_in_flight > 1
+
+	def test_gather_preserves_order(self, fake_arg: FakeARG):
+		ress = run(fake_arg, self.gather)
+
+		assert [res.req.query for res in ress] == [f"Resources | limit {i}" for i in range(self.n)]
+
+	def test_concurrency_limit(self, fake_arg: FakeARG):
+		fake_arg.rows = list(range(4))
+		fake_arg.page_size = 2
+		fake_arg.delay = 0.05
+
+		ress = run(fake_arg, self.gather, concurrency=2)
+
+		assert all(res.data == list(range(4)) for res in ress)
+		assert fake_arg.max_in_flight <= 2
@@ -3,15 +3,27 @@
 from __future__ import annotations
 
 import dataclasses
-import json
-import operator
-from functools import reduce
-from typing import Any, Tuple, cast
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Tuple, cast
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from llamazure.azgraph import codec
-from llamazure.azgraph.models import Req, Res, ResErr, ResMaybe
+from llamazure.azauth import shared
+from llamazure.azgraph import codec, kql
+from llamazure.azgraph.cache import Cache, cache_key
+from llamazure.azgraph.metrics import Hook, QueryMetrics
+from llamazure.azgraph.models import Req, Res, ResErr, ResMaybe, Table
+from llamazure.azgraph.singleflight import SingleFlight
+from llamazure.azgraph.throttle import Throttle
+
+ARG_URL = "https://management.azure.com/providers/Microsoft.ResourceGraph/resources?api-version=2021-03-01"
+SUBSCRIPTIONS_URL = "https://management.azure.com/subscriptions?api-version=2020-01-01"
 
 
 @dataclasses.dataclass
@@ -19,6 +31,97 @@ class RetryPolicy:
 	"""Parameters and strategies for retrying Azure Resource Graph queries"""
 
 	retries: int = 0  # number of times to retry. This is in addition to the initial try
+	throttled_retries: int = 3  # number of times to retry a throttled request, after waiting for the quota to reset. These are in addition to `retries`
+	permanent_errors: FrozenSet[str] = frozenset({"BadRequest", "InvalidQuery", "AuthorizationFailed", "Forbidden", "InvalidAuthenticationToken", "SubscriptionNotFound"})
+	"""Error codes which won't succeed on retry, like a query with a syntax error"""
+	throttled_errors: FrozenSet[str] = frozenset({"RateLimiting", "TooManyRequests"})
+	"""Error codes of throttled requests"""
+
+	def retryable(self, err: ResErr) -> bool:
+		"""Whether an error might succeed on retry"""
+		return err.code not in self.permanent_errors and not any(d.get("code") in self.permanent_errors for d in err.details or ())
+
+	def throttled(self, err: ResErr) -> bool:
+		"""Whether an error is because the request was throttled"""
+		return err.code in self.throttled_errors
+
+
+@dataclasses.dataclass
+class ShardPolicy:
+	"""
+	Parameters for splitting queries over many subscriptions into shards which are queried concurrently
+
+	Each shard is queried separately, so operators which combine rows, like `summarize`, `limit`, or `order by`, apply to each shard and not to the whole result.
+	"""
+
+	size: int = 1000  # maximum number of subscriptions in each shard. The Azure Resource Graph accepts at most 1000 in one request
+	workers: int = 8  # maximum number of shards to query concurrently
+
+
+class ThrottledRetry(Retry):
+	"""A urllib3 Retry which takes each retry through a Throttle, so that retries spend quota the Throttle knows about"""
+
+	def __init__(self, throttle: Optional[Throttle] = None, **kwargs):
+		super().__init__(**kwargs)
+		self.throttle = throttle
+
+	def new(self, **kwargs) -> ThrottledRetry:
+		new = super().new(**kwargs)
+		new.throttle = self.throttle
+		return new
+
+	def increment(self, *args, **kwargs) -> ThrottledRetry:
+		new = super().increment(*args, **kwargs)  # raises if there are no retries left, and the caller updates the throttle with the last response
+		if self.throttle is not None:
+			response = kwargs.get("response", args[2] if len(args) > 2 else None)
+			if response is not None:
+				self.throttle.update(response.status, response.headers)
+			else:
+				self.throttle.update(0, {})
+			self.throttle.acquire()
+		return new
+
+
+@dataclasses.dataclass
+class SessionPolicy:
+	"""
+	Parameters for the pool of HTTP connections
+
+	The session is shared by all queries of a Graph, so connections are reused instead of opening a new TCP and TLS connection for every page.
+	Unlike the Microsoft Graph client, the session doesn't retry throttled responses (429). The RetryPolicy retries them after the Throttle has waited for the quota.
+	"""
+
+	pool_size: int = 16  # maximum number of connections kept open. Make this at least the number of threads making queries
+	keep_alive: bool = True  # reuse connections between requests
+	retries: int = 3  # number of times to retry failed connections and unavailable responses, before the RetryPolicy. Throttled responses are retried by the RetryPolicy
+	backoff: float = 0.5  # factor for exponential backoff between retries, in seconds
+
+	def session(self, throttle: Optional[Throttle] = None) -> requests.Session:
+		"""Create a session with this policy. If there is a throttle, retries wait for it and update it like other requests"""
+		retry = ThrottledRetry(
+			throttle,
+			total=self.retries,
+			backoff_factor=self.backoff,
+			status_forcelist=(500, 502, 503, 504),
+			allowed_methods=None,  # queries are reads, so they are safe to retry
+			raise_on_status=False,  # return the last response, to be decoded as an error
+			respect_retry_after_header=False,  # otherwise 429s with Retry-After are retried here too. The RetryPolicy retries them after the Throttle waits
+		)
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+		session = requests.Session()
+		session.mount("https://", adapter)
+		session.mount("http://", adapter)
+		if not self.keep_alive:
+			session.headers["Connection"] = "close"
+		return session
+
+
+@dataclasses.dataclass
+class LookupPolicy:
+	"""Parameters for packing lookups of many keys into few queries"""
+
+	max_query_length: int = 64_000  # maximum characters in each query. The Azure Resource Graph rejects queries which are too long
+	max_keys: int = 1000  # maximum keys in each query, so that the rows of a query usually fit in one page
 
 
 class Graph:
@@ -49,25 +152,53 @@ class Graph:
 	... ))
 	"""
 
-	def __init__(self, token, subscriptions: Tuple[str], retry_policy: RetryPolicy = RetryPolicy()):
+	def __init__(
+		self,
+		token,
+		subscriptions: Tuple[str, ...],
+		retry_policy: RetryPolicy = RetryPolicy(),
+		shard_policy: ShardPolicy = ShardPolicy(),
+		session_policy: SessionPolicy = SessionPolicy(),
+		url: str = ARG_URL,
+		cache: Optional[Cache] = None,
+		throttle: Optional[Throttle] = None,
+		json_backend: Optional[codec.JSONBackend] = None,
+		pipeline: bool = False,
+		lookup_policy: LookupPolicy = LookupPolicy(),
+		single_flight: Optional[SingleFlight] = None,
+		hooks: Sequence[Hook] = (),
+	):
 		self.token = token
 		self.subscriptions = subscriptions
 		self.retry_policy = retry_policy
+		self.shard_policy = shard_policy
+		self.lookup_policy = lookup_policy
+		self.throttle = throttle or Throttle()
+		self.session = session_policy.session(self.throttle)
+		self.url = url
+		self.cache = cache
+		self.json_backend = json_backend or codec.default_backend()
+		self.pipeline = pipeline  # fetch the next page of a query while decoding the current one
+		self.single_flight = single_flight  # share one query between concurrent callers making the same request
+		self.hooks: List[Hook] = list(hooks)  # called with the metrics of each query. Metrics are only measured if there are hooks
 
 	@classmethod
-	def from_credential(cls, credential) -> Graph:
-		"""Create from an Azure credential"""
-		token = credential.get_token("https://management.azure.com//.default")
-		subscriptions = cls._get_subscriptions(token)
-		return cls(token, subscriptions)
-
-	@staticmethod
-	def _get_subscriptions(token) -> Tuple[str]:
-		raw = requests.get(
-			"https://management.azure.com/subscriptions?api-version=2020-01-01",
-			headers={"Authorization": f"Bearer {token.token}", "Content-Type": "application/json"},
+	def from_credential(cls, credential, session_policy: SessionPolicy = SessionPolicy()) -> Graph:
+		"""
+		Create from an Azure credential.
+		Tokens are refreshed before they expire, and shared with other clients created from the same credential or `TokenProvider`.
+		"""
+		token = shared(credential).bearer("https://management.azure.com//.default")
+		graph = cls(token, cast(Tuple[str, ...], ()), session_policy=session_policy)
+		graph.subscriptions = graph._get_subscriptions()
+		return graph
+
+	def _get_subscriptions(self) -> Tuple[str, ...]:
+		raw = self.session.get(
+			SUBSCRIPTIONS_URL,
+			headers={"Authorization": f"Bearer {self.token.token}", "Content-Type": "application/json"},
 		).json()
-		return cast(Tuple[str], tuple(s["subscriptionId"] for s in raw["value"]))
+		return cast(Tuple[str, ...], tuple(s["subscriptionId"] for s in raw["value"]))
 
 	def q(self, q: str) -> Any:
 		"""Make a graph query"""
@@ -76,49 +207,365 @@ class Graph:
 			raise res.exception()
 		return res.data
 
-	def _exec_query(self, req) -> ResMaybe:
-		raw = requests.post(
-			"https://management.azure.com/providers/Microsoft.ResourceGraph/resources?api-version=2021-03-01",
-			headers={"Authorization": f"Bearer {self.token.token}", "Content-Type": "application/json"},
-			data=json.dumps(req, cls=codec.Encoder),
-		).json()
-		res = codec.Decoder().decode(req, raw)
+	def q_table(self, q: str) -> Table:
+		"""Make a graph query in the table format, which stores the result as columns"""
+		res = self.query(Req(q, self.subscriptions, options={"resultFormat": "table"}))
+		if isinstance(res, ResErr):
+			raise res.exception()
+		return res.data
+
+	def lookup(self, keys: Iterable[str], query: str = "Resources", column: str = "id") -> Dict[str, List[Any]]:
+		"""
+		Look up the rows for many keys, like resource IDs, with as few queries as possible.
+
+		Keys are packed into queries like `Resources | where id in~ (...)`, as many in each query as the `lookup_policy` allows, and the queries are made concurrently.
+		Returns the rows for each key, with an empty list for keys which have no rows. Keys are compared ignoring case.
+		The query must return the column, so put projections in the query and not after it.
+
+		>>> graph.lookup(["/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/rg0/providers/Microsoft.Storage/storageAccounts/sa0"])
+		"""
+		keys = list(keys)
+		queries = kql.pack_in(query, column, keys, self.lookup_policy.max_query_length, self.lookup_policy.max_keys)
+		if len(queries) <= 1:
+			return route(keys, column, map(self.q, queries))
+		with ThreadPoolExecutor(self.shard_policy.workers) as pool:
+			return route(keys, column, pool.map(self.q, queries))
+
+	def _metrics(self, req: Req) -> Optional[QueryMetrics]:
+		"""Start measuring a query, if there are hooks to report it to"""
+		return QueryMetrics(req.query) if self.hooks else None
+
+	def _report(self, m: Optional[QueryMetrics], res: Optional[ResMaybe]):
+		"""Finish measuring a query and report it to the hooks"""
+		if m is None:
+			return
+		m.finish(res)
+		for hook in self.hooks:
+			hook(m)
+
+	def _exec_query(self, req, m: Optional[QueryMetrics] = None) -> ResMaybe:
+		return self._decode(req, self._post(req, m), m)
+
+	def _decode(self, req: Req, raw: bytes, m: Optional[QueryMetrics] = None) -> ResMaybe:
+		if m is None:
+			return codec.Decoder(self.json_backend).decode_bytes(req, raw)
+		start = time.perf_counter()
+		res = codec.Decoder(self.json_backend).decode_bytes(req, raw)
+		m.record_page(time.perf_counter() - start, res.count if isinstance(res, Res) else 0)
 		return res
 
+	def _post(self, req: Req, m: Optional[QueryMetrics] = None) -> bytes:
+		waited = self.throttle.acquire()
+		start = time.perf_counter() if m is not None else 0.0
+		try:
+			r = self.session.post(
+				self.url,
+				headers={"Authorization": f"Bearer {self.token.token}", "Content-Type": "application/json"},
+				data=self.json_backend.dumps(codec.encode(req)),
+			)
+		except BaseException:
+			self.throttle.update(0, {})
+			raise
+		self.throttle.update(r.status_code, r.headers)
+		if m is not None:
+			m.record_request(time.perf_counter() - start, len(r.content), waited)
+		return r.content
+
 	def query_single(self, req: Req) -> ResMaybe:
-		"""Make a graph query for a single page"""
-		res = self._exec_query(req)
+		"""
+		Make a graph query for a single page
+		Errors are retried according to the retry policy. Throttled requests wait for the quota to reset, and are retried up to `throttled_retries` times besides `retries`.
+		"""
+		m = self._metrics(req)
+		res = self._query_single(req, m)
+		self._report(m, res)
+		return res
 
-		if isinstance(res, ResErr):
-			retries = 0
-			while retries < self.retry_policy.retries and isinstance(res, ResErr):
+	def _query_single(self, req: Req, m: Optional[QueryMetrics]) -> ResMaybe:
+		return self._retry(req, self._exec_query(req, m), m)
+
+	def _retry(self, req: Req, res: ResMaybe, m: Optional[QueryMetrics] = None) -> ResMaybe:
+		"""Retry a request which failed, according to the retry policy"""
+		retries = throttled = 0
+		while isinstance(res, ResErr):
+			if self.retry_policy.throttled(res) and throttled < self.retry_policy.throttled_retries:
+				throttled += 1  # the Throttle waits for the quota to reset before the request is sent again
+			elif retries < self.retry_policy.retries and self.retry_policy.retryable(res):
 				retries += 1
-				res = self._exec_query(req)
+			else:
+				break
+			if m is not None:
+				m.record_retry()
+			res = self._exec_query(req, m)
 		return res
 
 	def query_next(self, req: Req, previous: Res) -> ResMaybe:
 		"""Query the next page in a paginated query"""
-		options = req.options.copy()
-		options["$skipToken"] = previous.skipToken
+		return self.query_single(next_req(req, previous))
+
+	def query_iter(self, req: Req) -> Iterator[ResMaybe]:
+		"""
+		Make a graph query, yielding each page as it arrives.
+		If a page fails, the error is yielded and iteration stops.
+		This lets you process large results with memory for only one page.
+
+		Queries over more subscriptions than `shard_policy.size` are sharded, and pages of different shards are interleaved in the order they arrive.
+		The `req` of each page is the request for its shard.
+		"""
+		m = self._metrics(req)
+		res: Optional[ResMaybe] = None
+		shards = shard(req, self.shard_policy.size)
+		try:
+			if len(shards) == 1:
+				pages = self._pages(req, m)
+			else:
+				pages = merge_threaded([partial(self._pages, s, m) for s in shards], self.shard_policy.workers)
+			for res in pages:
+				yield res
+		except Exception as e:
+			if m is not None:
+				m.error = type(e).__name__
+			raise
+		finally:
+			self._report(m, res)
 
-		# "$skip" overrides "$skipToken", so we need to remove it.
-		# This is fine, since the original skip amount is encoded into the
-		options.pop("$skip", None)
+	def _pages(self, req: Req, m: Optional[QueryMetrics] = None) -> Iterator[ResMaybe]:
+		"""The pages of a query for a single shard"""
+		if self.pipeline:
+			return self._query_iter_pipelined(req, m)
+		return self._query_iter_shard(req, m)
 
-		next_req = dataclasses.replace(req, options=options)
-		return self.query_single(next_req)
+	def _query_iter_shard(self, req: Req, m: Optional[QueryMetrics] = None) -> Iterator[ResMaybe]:
+		res = self._query_single(req, m)
+		yield res
+		while isinstance(res, Res) and res.skipToken:
+			res = self._query_single(next_req(req, res), m)
+			yield res
+
+	def _query_iter_pipelined(self, req: Req, m: Optional[QueryMetrics] = None) -> Iterator[ResMaybe]:
+		"""
+		Yield the pages of a query, fetching the next page in a background thread while the current one is decoded and consumed.
+		The skipToken is found in the raw body of a page, so the next page is requested before the page is decoded.
+		"""
+		with ThreadPoolExecutor(1) as pool:
+			current = req
+			fetching: Optional[Future[bytes]] = pool.submit(self._post, current, m)
+			while fetching is not None:
+				raw = fetching.result()
+				token = codec.peek_skip_token(raw)
+				ahead = skip_to(req, token) if token else None
+				fetching = pool.submit(self._post, ahead, m) if ahead else None
+
+				res = self._decode(current, raw, m)
+				if isinstance(res, ResErr):
+					res = self._retry(current, res, m)
+				yield res
+				if not isinstance(res, Res) or not res.skipToken:
+					return
+
+				current = next_req(req, res)
+				if ahead != current:  # the token we found wasn't the real one
+					if fetching is not None:
+						fetching.cancel()
+					fetching = pool.submit(self._post, current, m)
+
+	def q_iter(self, q: str) -> Iterator[Any]:
+		"""Make a graph query, yielding each row as its page arrives"""
+		for res in self.query_iter(Req(q, self.subscriptions)):
+			if isinstance(res, ResErr):
+				raise res.exception()
+			yield from res.data
 
 	def query(self, req: Req) -> ResMaybe:
-		"""Make a graph query"""
-		ress = []
-		res = self.query_single(req)
+		"""
+		Make a graph query
+
+		Queries over more subscriptions than `shard_policy.size` are sharded, and the shards are queried concurrently.
+		If the Graph has a cache, results are cached unless `req.bypass_cache` is set.
+		If the Graph has a `single_flight`, concurrent callers making the same request share one query.
+		"""
+		m = self._metrics(req)
+		res: Optional[ResMaybe] = None
+		try:
+			res = self._query(req, m)
+		except Exception as e:
+			if m is not None:
+				m.error = type(e).__name__
+			raise
+		finally:
+			self._report(m, res)
+		return res
+
+	def _query(self, req: Req, m: Optional[QueryMetrics]) -> ResMaybe:
+		if self.cache is not None and not req.bypass_cache:
+			cached = self.cache.get(req)
+			if cached is not None:
+				if m is not None:
+					m.cached = True
+				return cached
+
+		if self.single_flight is None:
+			return self._query_fresh(req, m)
+
+		led = False
+
+		def lead() -> ResMaybe:
+			nonlocal led
+			led = True
+			return self._query_fresh(req, m)
+
+		res = self.single_flight.do(cache_key(req), lead)
+		if m is not None:
+			m.shared = not led
+		if isinstance(res, Res) and res.req is not req:
+			res = dataclasses.replace(res, req=req)
+		return res
+
+	def _query_fresh(self, req: Req, m: Optional[QueryMetrics] = None) -> ResMaybe:
+		"""Make a graph query without looking in the cache"""
+		shards = shard(req, self.shard_policy.size)
+		if len(shards) == 1:
+			res = accumulate(self._pages(req, m))
+		else:
+			with ThreadPoolExecutor(self.shard_policy.workers) as pool:
+				res = merge_shards(req, pool.map(lambda s: accumulate(self._pages(s, m)), shards))
+
+		if self.cache is not None and isinstance(res, Res):
+			self.cache.set(req, res)
+		return res
+
+
+def accumulate(ress: Iterable[ResMaybe]) -> ResMaybe:
+	"""
+	Combine the pages of a query into one Res, or return the first error.
+	This extends one list of data instead of adding pages pairwise, which would copy the data for every page.
+	"""
+	last: Optional[Res] = None
+	datas: List[Any] = []
+	count = 0
+	for res in ress:
 		if isinstance(res, ResErr):
 			return res
+		datas.append(res.data)
+		count += res.count
+		last = res
+	if last is None:
+		raise ValueError("no pages to accumulate")
+	return dataclasses.replace(last, count=count, data=concat_data(datas))
 
-		ress.append(res)
-		while res.skipToken:
-			res = self.query_next(req, res)
-			if isinstance(res, ResErr):
-				return res
-			ress.append(res)
-		return reduce(operator.add, ress)
+
+def route(keys: Sequence[str], column: str, datas: Iterable[Any]) -> Dict[str, List[Any]]:
+	"""Route the rows of lookup queries back to the keys which asked for them, ignoring case"""
+	out: Dict[str, List[Any]] = {key: [] for key in keys}
+	requesters: Dict[str, List[str]] = {}  # the same key might be asked for with different cases
+	for key in out:
+		requesters.setdefault(key.lower(), []).append(key)
+	for data in datas:
+		for row in data:
+			value = row.get(column)
+			if not isinstance(value, str):
+				continue
+			for key in requesters.get(value.lower(), ()):
+				out[key].append(row)
+	return out
+
+
+def shard(req: Req, size: int) -> List[Req]:
+	"""Split a request into requests for at most `size` subscriptions each"""
+	if len(req.subscriptions) <= size:
+		return [req]
+	return [dataclasses.replace(req, subscriptions=req.subscriptions[i : i + size]) for i in range(0, len(req.subscriptions), size)]
+
+
+def merge_shards(req: Req, ress: Iterable[ResMaybe]) -> ResMaybe:
+	"""Combine the results of the shards of a request into one Res, or return the first error"""
+	first: Optional[Res] = None
+	datas: List[Any] = []
+	count = total = 0
+	for res in ress:
+		if isinstance(res, ResErr):
+			return res
+		datas.append(res.data)
+		count += res.count
+		total += res.totalRecords
+		first = first or res
+	if first is None:
+		raise ValueError("no shards to merge")
+	return dataclasses.replace(first, req=req, totalRecords=total, count=count, data=concat_data(datas), skipToken=None)
+
+
+def concat_data(datas: Sequence[Any]) -> Any:
+	"""Concatenate the data of pages, which are lists of rows or Tables"""
+	if datas and all(isinstance(data, Table) for data in datas):
+		return Table.concat(datas)
+	out: List[Any] = []
+	for data in datas:
+		out.extend(data)
+	return out
+
+
+_DONE = object()
+
+
+def merge_threaded(sources: Sequence[Callable[[], Iterator[ResMaybe]]], workers: int) -> Iterator[ResMaybe]:
+	"""
+	Consume iterators of pages in a thread pool, yielding pages in the order they arrive.
+	If a page fails, the error is yielded and the other iterators are stopped.
+	At most 2 pages per worker are buffered, so a slow consumer applies backpressure to the workers.
+	"""
+	pages: queue.Queue = queue.Queue(maxsize=2 * workers)
+	stop = threading.Event()
+
+	def put(item):
+		while not stop.is_set():
+			try:
+				pages.put(item, timeout=0.1)
+				return
+			except queue.Full:
+				continue
+
+	def run(source: Callable[[], Iterator[ResMaybe]]):
+		try:
+			for res in source():
+				if stop.is_set():
+					return
+				put(res)
+				if isinstance(res, ResErr):
+					return
+		finally:
+			put(_DONE)
+
+	pool = ThreadPoolExecutor(workers)
+	try:
+		futures = [pool.submit(run, source) for source in sources]
+		done = 0
+		while done < len(sources):
+			item = pages.get()
+			if item is _DONE:
+				done += 1
+				continue
+			yield item
+			if isinstance(item, ResErr):
+				return
+		for future in futures:
+			future.result()  # propagate exceptions from workers
+	finally:
+		stop.set()
+		pool.shutdown(wait=True, cancel_futures=True)
+
+
+def next_req(req: Req, previous: Res) -> Req:
+	"""The request for the page after `previous`"""
+	return skip_to(req, previous.skipToken)
+
+
+def skip_to(req: Req, skip_token: Optional[str]) -> Req:
+	"""The request for the page with a skipToken"""
+	options = req.options.copy()
+	options["$skipToken"] = skip_token
+
+	# "$skip" overrides "$skipToken", so we need to remove it.
+	# This is fine, since the original skip amount is encoded into the
+	options.pop("$skip", None)
+
+	return dataclasses.replace(req, options=options)
@@ -2,10 +2,21 @@
 
 # pylint: disable=redefined-outer-name
 # pylint: disable=protected-access
+import operator
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from typing import List, Type
 from unittest.mock import Mock
 
-from llamazure.azgraph.azgraph import Graph, RetryPolicy
-from llamazure.azgraph.models import Req, Res, ResErr
+import pytest
+
+from llamazure.azgraph import codec
+from llamazure.azgraph.azgraph import Graph, LookupPolicy, RetryPolicy, SessionPolicy, ShardPolicy, route, shard
+from llamazure.azgraph.conftest import FakeARG, FakeTables, Token
+from llamazure.azgraph.models import AzureGraphException, Req, Res, ResErr, ResMaybe
+from llamazure.azgraph.singleflight import SingleFlight
 
 
 def null_graph(retry_policy: RetryPolicy) -> Graph:
@@ -105,3 +116,309 @@ class TestPaginated:
 
 		assert isinstance(res, ResErr)
 		assert g._exec_query.call_count == 3 + self.normal_retry_policy.retries
+
+
+class TestQueryIter:
+	"""Test streaming pages of a query"""
+
+	empty_req = Req("", tuple("00000000-0000-0000-0000-000000000000"))
+	failed_res = ResErr("BadThings", "Bad things happened", ({"code": "BadThings", "message": "Bad things happened"},))
+
+	def pages(self, n: int):
+		return [Res(self.empty_req, n, 1, resultTruncated=None, facets=tuple(), data=[str(i)], skipToken=str(i + 1) if i < n - 1 else None) for i in range(n)]
+
+	def test_pages_are_lazy(self):
+		"""Test that pages are only requested as they are consumed"""
+		g = null_graph(RetryPolicy())
+		g._exec_query = Mock(side_effect=self.pages(3))
+
+		it = g.query_iter(self.empty_req)
+		assert next(it).data == ["0"]
+		assert g._exec_query.call_count == 1
+		assert [res.data for res in it] == [["1"], ["2"]]
+		assert g._exec_query.call_count == 3
+
+	def test_error_stops(self):
+		"""Test that an error is yielded and ends the iteration"""
+		g = null_graph(RetryPolicy())
+		g._exec_query = Mock(side_effect=[self.pages(3)[0], self.failed_res])
+
+		assert list(g.query_iter(self.empty_req))[-1] == self.failed_res
+
+	def test_q_iter(self):
+		g = null_graph(RetryPolicy())
+		g._exec_query = Mock(side_effect=self.pages(3))
+
+		assert list(g.q_iter("")) == ["0", "1", "2"]
+
+	def test_q_iter_raises(self):
+		g = null_graph(RetryPolicy())
+		g._exec_query = Mock(side_effect=[self.pages(3)[0], self.failed_res])
+
+		it = g.q_iter("")
+		assert next(it) == "0"
+		with pytest.raises(AzureGraphException):
+			next(it)
+
+	def test_query_accumulates(self):
+		"""Test that accumulating is the same as adding the pages"""
+		pages = self.pages(50)
+		g = null_graph(RetryPolicy())
+		g._exec_query = Mock(side_effect=pages)
+
+		assert g.query(self.empty_req) == reduce(operator.add, pages)
+
+
+class TestSharded:
+	"""Test splitting queries over many subscriptions"""
+
+	subscriptions = tuple(f"{i:08}-0000-0000-0000-000000000000" for i in range(10))
+	req = Req("", subscriptions)
+
+	@staticmethod
+	def exec_query(req: Req, *_) -> ResMaybe:
+		"""Return 2 pages with each subscription"""
+		if "$skipToken" in req.options:
+			return Res(req, 2 * len(req.subscriptions), len(req.subscriptions), resultTruncated=None, facets=tuple(), data=[f"{s}/1" for s in req.subscriptions])
+		return Res(req, 2 * len(req.subscriptions), len(req.subscriptions), resultTruncated=None, facets=tuple(), data=[f"{s}/0" for s in req.subscriptions], skipToken="1")
+
+	def graph(self, size):
+		g = Graph(None, self.subscriptions, shard_policy=ShardPolicy(size=size, workers=3))
+		g._exec_query = Mock(side_effect=self.exec_query)
+		return g
+
+	def test_shard(self):
+		shards = shard(self.req, 4)
+		assert [len(s.subscriptions) for s in shards] == [4, 4, 2]
+		assert sum((s.subscriptions for s in shards), ()) == self.subscriptions
+
+	def test_small_queries_are_not_sharded(self):
+		g = self.graph(size=10)
+
+		res = g.query(self.req)
+
+		assert g._exec_query.call_count == 2
+		assert res.req.subscriptions == self.subscriptions
+
+	def test_query_merges(self):
+		g = self.graph(size=3)
+
+		res = g.query(self.req)
+
+		assert isinstance(res, Res)
+		assert all(len(call.args[0].subscriptions) <= 3 for call in g._exec_query.call_args_list)
+		assert sorted(res.data) == sorted(f"{s}/{p}" for s in self.subscriptions for p in range(2))
+		assert res.count == res.totalRecords == 20
+		assert res.req == self.req
+		assert res.skipToken is None
+
+	def test_query_iter_streams_all_pages(self):
+		g = self.graph(size=3)
+
+		pages = list(g.query_iter(self.req))
+
+		assert len(pages) == 8
+		assert sorted(row for page in pages for row in page.data) == sorted(f"{s}/{p}" for s in self.subscriptions for p in range(2))
+
+	def test_query_error(self):
+		g = self.graph(size=3)
+		err = ResErr("BadThings", "Bad things happened", ())
+		g._exec_query = Mock(side_effect=lambda req, *_: err if self.subscriptions[3] in req.subscriptions else self.exec_query(req))
+
+		assert g.query(self.req) == err
+		assert list(g.query_iter(self.req))[-1] == err
+
+	def test_query_iter_closed_early(self):
+		"""Test that workers stop when the consumer stops"""
+		g = self.graph(size=1)
+
+		it = g.query_iter(self.req)
+		next(it)
+		it.close()
+
+		assert g._exec_query.call_count < 20
+
+
+class TestSession:
+	"""Test that queries share a pooled session"""
+
+	def test_policy(self):
+		session = SessionPolicy(pool_size=4, retries=2).session()
+		adapter = session.get_adapter("https://management.azure.com")
+
+		assert adapter._pool_maxsize == 4
+		assert adapter.max_retries.total == 2
+
+	def test_pages_reuse_connection(self, fake_arg: FakeARG):
+		fake_arg.rows = list(range(10))
+		fake_arg.page_size = 2
+		g = Graph(Token(), ("00000000-0000-0000-0000-000000000000",), url=fake_arg.url)
+
+		res = g.query(Req("Resources", g.subscriptions))
+
+		assert isinstance(res, Res)
+		assert res.data == list(range(10))
+		assert len(fake_arg.requests) == 5
+		assert len(fake_arg.connections) == 1
+
+
+class TestJSONBackend:
+	@pytest.mark.parametrize("backend_type", [codec.StdlibJSON, codec.OrjsonJSON, codec.MsgspecJSON], ids=lambda b: b.name)
+	def test_query(self, fake_arg: FakeARG, backend_type: Type[codec.JSONBackend]):
+		try:
+			backend = backend_type()
+		except ImportError:
+			pytest.skip(f"{backend_type.name} is not installed")
+		fake_arg.rows = [{"id": str(i)} for i in range(5)]
+		fake_arg.page_size = 2
+		g = Graph(Token(), ("00000000-0000-0000-0000-000000000000",), url=fake_arg.url, json_backend=backend)
+
+		assert g.q("Resources") == fake_arg.rows
+		assert fake_arg.requests[1]["options"] == {"$skipToken": "2"}
+
+
+class TestLookup:
+	"""Test looking up many keys with few queries"""
+
+	subscriptions = ("00000000-0000-0000-0000-000000000000",)
+	ids = [f"/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/rg0/providers/Microsoft.Storage/storageAccounts/sa{i}" for i in range(10)]
+
+	def graph(self, fake_arg: FakeARG, **kwargs) -> Graph:
+		fake_arg.query_rows = FakeTables({"resources": [{"id": i, "name": i.rsplit("/", 1)[1]} for i in self.ids]})
+		return Graph(Token(), self.subscriptions, url=fake_arg.url, **kwargs)
+
+	def test_one_query(self, fake_arg: FakeARG):
+		g = self.graph(fake_arg)
+
+		found = g.lookup(self.ids[:5])
+
+		assert {k: [r["name"] for r in rows] for k, rows in found.items()} == {self.ids[i]: [f"sa{i}"] for i in range(5)}
+		assert len(fake_arg.requests) == 1
+
+	def test_packed(self, fake_arg: FakeARG):
+		g = self.graph(fake_arg, lookup_policy=LookupPolicy(max_keys=4))
+
+		found = g.lookup(self.ids)
+
+		assert all(len(rows) == 1 for rows in found.values())
+		assert len(fake_arg.requests) == 3
+
+	def test_missing_and_case(self, fake_arg: FakeARG):
+		"""Test that keys without rows are empty, and that rows are routed to keys asked for in any case"""
+		g = self.graph(fake_arg)
+		missing = self.ids[0] + "-missing"
+
+		found = g.lookup([self.ids[0].upper(), self.ids[0], missing])
+
+		assert found[self.ids[0].upper()] == found[self.ids[0]] == [{"id": self.ids[0], "name": "sa0"}]
+		assert found[missing] == []
+
+	def test_no_keys(self, fake_arg: FakeARG):
+		assert self.graph(fake_arg).lookup([]) == {}
+		assert len(fake_arg.requests) == 0
+
+
+def test_route():
+	rows = [{"id": "/A", "v": 1}, {"id": "/a", "v": 2}, {"id": "/b", "v": 3}, {"name": "no id"}]
+	assert route(["/a", "/c"], "id", [rows[:2], rows[2:]]) == {"/a": [rows[0], rows[1]], "/c": []}
+
+
+class TestSingleFlight:
+	"""Test that concurrent callers making the same request share one query"""
+
+	subscriptions = ("00000000-0000-0000-0000-000000000000",)
+
+	def run(self, g: Graph, queries: List[str]) -> list:
+		barrier = threading.Barrier(len(queries))
+
+		def q(query: str):
+			barrier.wait()
+			return g.q(query)
+
+		with ThreadPoolExecutor(len(queries)) as pool:
+			return list(pool.map(q, queries))
+
+	def test_shared(self, fake_arg: FakeARG):
+		fake_arg.rows = list(range(25))
+		fake_arg.page_size = 10
+		fake_arg.delay = 0.1
+		g = Graph(Token(), self.subscriptions, url=fake_arg.url, single_flight=SingleFlight())
+
+		results = self.run(g, ["Resources"] * 8)
+
+		assert results == [list(range(25))] * 8
+		assert len(fake_arg.requests) == 3  # one pagination for all callers
+		assert g.single_flight is not None and g.single_flight.stats.shared == 7
+
+	def test_different_queries(self, fake_arg: FakeARG):
+		fake_arg.rows = [0]
+		fake_arg.delay = 0.1
+		g = Graph(Token(), self.subscriptions, url=fake_arg.url, single_flight=SingleFlight())
+
+		self.run(g, ["Resources", "ResourceContainers"])
+
+		assert len(fake_arg.requests) == 2
+
+	def test_without_single_flight(self, fake_arg: FakeARG):
+		fake_arg.rows = [0]
+		fake_arg.delay = 0.1
+		g = Graph(Token(), self.subscriptions, url=fake_arg.url)
+
+		self.run(g, ["Resources"] * 4)
+
+		assert len(fake_arg.requests) == 4
+
+
+class TestPipelined:
+	"""Test fetching the next page while the current one is consumed"""
+
+	subscriptions = ("00000000-0000-0000-0000-000000000000",)
+
+	def test_query(self, fake_arg: FakeARG):
+		fake_arg.rows = list(range(25))
+		fake_arg.page_size = 10
+		g = Graph(Token(), self.subscriptions, url=fake_arg.url, pipeline=True)
+
+		res = g.query(Req("Resources", self.subscriptions, options={"$skip": 0}))
+
+		assert isinstance(res, Res)
+		assert res.data == list(range(25))
+		assert len(fake_arg.requests) == 3  # no page is fetched twice
+		assert "$skip" not in fake_arg.requests[1]["options"]
+
+	def test_overlaps_fetching_and_consuming(self, fake_arg: FakeARG):
+		pages, delay = 8, 0.05
+		fake_arg.rows = list(range(pages))
+		fake_arg.page_size = 1
+		fake_arg.delay = delay
+		g = Graph(Token(), self.subscriptions, url=fake_arg.url, pipeline=True)
+
+		start = time.perf_counter()
+		for _ in g.query_iter(Req("Resources", self.subscriptions)):
+			time.sleep(delay)  # consuming a page takes as long as fetching it
+		elapsed = time.perf_counter() - start
+
+		assert elapsed < pages * 2 * delay * 0.8  # one after another would take the sum
+
+	def test_retries(self, fake_arg: FakeARG):
+		fake_arg.rows = list(range(4))
+		fake_arg.page_size = 2
+		fake_arg.fail_next = 1
+		g = Graph(Token(), self.subscriptions, RetryPolicy(retries=1), url=fake_arg.url, pipeline=True)
+
+		assert g.q("Resources") == list(range(4))
+
+	def test_wrong_peeked_token(self):
+		"""Test that a page is fetched with the real skipToken if data looks like a skipToken"""
+		bodies = {
+			None: b'{"$skipToken": "1", "totalRecords": 2, "count": 1, "resultTruncated": "false", "facets": [], "data": [{"$skipToken": "bogus"}]}',
+			"1": b'{"totalRecords": 2, "count": 1, "resultTruncated": "false", "facets": [], "data": [{"id": "1"}]}',
+			"bogus": b'{"totalRecords": 2, "count": 1, "resultTruncated": "false", "facets": [], "data": [{"id": "bogus"}]}',
+		}
+		g = Graph(None, self.subscriptions, pipeline=True)
+		g._post = Mock(side_effect=lambda r, *_: bodies[r.options.get("$skipToken")])
+
+		res = g.query(Req("Resources", self.subscriptions))
+
+		assert res.data == [{"$skipToken": "bogus"}, {"id": "1"}]
+		assert g._post.call_args_list[-1].args[0].options["$skipToken"] == "1"
@@ -0,0 +1,155 @@
+"""
+Benchmarks for the Azure Resource Graph client
+
+Run with `python -m llamazure.azgraph.bench sessions` to measure the latency of paginated queries against a fake Azure Resource Graph on localhost,
+or `python -m llamazure.azgraph.bench codec` to measure encoding requests and decoding responses with each JSON backend.
+"""
+
+from __future__ import annotations
+
+import json
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Type
+
+import click
+
+from llamazure.azgraph import codec
+from llamazure.azgraph.azgraph import Graph, SessionPolicy
+from llamazure.azgraph.conftest import FakeARG, Token, self_signed_cert, serve
+from llamazure.azgraph.models import Req, Res
+
+SESSION_POLICIES: Dict[str, SessionPolicy] = {
+	"pooled": SessionPolicy(),
+	"unpooled": SessionPolicy(keep_alive=False),
+}
+
+JSON_BACKENDS: List[Type[codec.JSONBackend]] = [codec.StdlibJSON, codec.OrjsonJSON, codec.MsgspecJSON]
+
+
+@dataclass
+class Result:
+	"""Timings of paginating through a query"""
+
+	name: str
+	pages: int
+	seconds: float
+	connections: int
+
+	@property
+	def ms_per_page(self) -> float:
+		return self.seconds * 1000 / self.pages
+
+
+def bench(name: str, session_policy: SessionPolicy, pages: int, rows_per_page: int, tls: Optional[Tuple[str, str]] = None) -> Result:
+	"""Benchmark paginating through a query with a session policy"""
+	fake = FakeARG(rows=[{"id": str(i)} for i in range(pages * rows_per_page)], page_size=rows_per_page)
+	server = serve(fake, tls)
+	try:
+		g = Graph(Token(), ("00000000-0000-0000-0000-000000000000",), session_policy=session_policy, url=fake.url)
+		if tls:
+			g.session.verify = tls[0]
+			g.session.trust_env = False  # otherwise REQUESTS_CA_BUNDLE overrides `verify`
+		start = time.perf_counter()
+		res = g.query(Req("Resources", g.subscriptions))
+		elapsed = time.perf_counter() - start
+		assert isinstance(res, Res) and res.count == pages * rows_per_page
+		return Result(name, pages, elapsed, len(fake.connections))
+	finally:
+		server.shutdown()
+		server.server_close()
+
+
+def fmt_table(results: List[Result]) -> str:
+	"""Format results as a markdown table"""
+	rows = [["session", "pages", "total (ms)", "per page (ms)", "connections"], ["---"] * 5]
+	for r in results:
+		rows.append([r.name, str(r.pages), f"{r.seconds * 1000:.1f}", f"{r.ms_per_page:.2f}", str(r.connections)])
+	return "\n".join("| " + " | ".join(row) + " |" for row in rows)
+
+
+def sample_page(rows: int) -> bytes:
+	"""The body of a page of storage accounts, like the Azure Resource Graph returns"""
+	data = [
+		{
+			"id": f"/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/rg{i % 10}/providers/Microsoft.Storage/storageAccounts/sa{i}",
+			"name": f"sa{i}",
+			"type": "microsoft.storage/storageaccounts",
+			"location": "canadacentral",
+			"resourceGroup": f"rg{i % 10}",
+			"subscriptionId": "00000000-0000-0000-0000-000000000000",
+			"tags": {"env": "prod", "owner": "team0"},
+			"sku": {"name": "Standard_LRS", "tier": "Standard"},
+			"properties": {
+				"provisioningState": "Succeeded",
+				"creationTime": "2023-01-01T00:00:00.0000000Z",
+				"supportsHttpsTrafficOnly": True,
+				"minimumTlsVersion": "TLS1_2",
+				"encryption": {"keySource": "Microsoft.Storage", "services": {"blob": {"enabled": True}, "file": {"enabled": True}}},
+			},
+		}
+		for i in range(rows)
+	]
+	return json.dumps({"totalRecords": rows, "count": rows, "resultTruncated": "false", "facets": [], "data": data, "$skipToken": "token"}).encode()
+
+
+def bench_codec(backend: codec.JSONBackend, pages: int, rows_per_page: int) -> Result:
+	"""Benchmark encoding the request and decoding the response for each page of a query"""
+	body = sample_page(rows_per_page)
+	req = Req("Resources", ("00000000-0000-0000-0000-000000000000",), options={"$skipToken": "token"})
+	decoder = codec.Decoder(backend)
+	start = time.perf_counter()
+	for _ in range(pages):
+		backend.dumps(codec.encode(req))
+		res = decoder.decode_bytes(req, body)
+	elapsed = time.perf_counter() - start
+	assert isinstance(res, Res) and res.count == rows_per_page
+	return Result(backend.name, pages, elapsed, 0)
+
+
+def fmt_codec_table(results: List[Result]) -> str:
+	"""Format results of codec benchmarks as a markdown table"""
+	rows = [["backend", "pages", "total (ms)", "per page (ms)"], ["---"] * 4]
+	for r in results:
+		rows.append([r.name, str(r.pages), f"{r.seconds * 1000:.1f}", f"{r.ms_per_page:.2f}"])
+	return "\n".join("| " + " | ".join(row) + " |" for row in rows)
+
+
+def installed_backends() -> List[codec.JSONBackend]:
+	"""The JSON backends which are installed"""
+	out = []
+	for backend in JSON_BACKENDS:
+		try:
+			out.append(backend())
+		except ImportError:
+			continue
+	return out
+
+
+@click.group()
+def main():
+	"""Benchmarks for the Azure Resource Graph client"""
+
+
+@main.command()
+@click.option("--pages", type=int, default=200, help="Number of pages in the query.")
+@click.option("--rows-per-page", type=int, default=100)
+@click.option("--tls/--no-tls", default=True, help="Serve HTTPS with a self-signed certificate. The TLS handshake is most of the cost of a new connection.")
+def sessions(pages, rows_per_page, tls):
+	"""Benchmark HTTP session policies"""
+	with tempfile.TemporaryDirectory() as d:
+		cert = self_signed_cert(d) if tls else None
+		click.echo(fmt_table([bench(name, policy, pages, rows_per_page, cert) for name, policy in SESSION_POLICIES.items()]))
+
+
+@main.command(name="codec")
+@click.option("--pages", type=int, default=100, help="Number of pages to encode and decode.")
+@click.option("--rows-per-page", type=int, default=1000)
+def codec_(pages, rows_per_page):
+	"""Benchmark JSON backends"""
+	click.echo(fmt_codec_table([bench_codec(backend, pages, rows_per_page) for backend in installed_backends()]))
+
+
+if __name__ == "__main__":
+	main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,25 @@
+"""Test the benchmarks run"""
+
+from click.testing import CliRunner
+
+from llamazure.azgraph import codec
+from llamazure.azgraph.bench import SESSION_POLICIES, bench, bench_codec, main
+
+
+def test_pooled_session_reuses_connections():
+	assert bench("pooled", SESSION_POLICIES["pooled"], pages=5, rows_per_page=2).connections == 1
+	assert bench("unpooled", SESSION_POLICIES["unpooled"], pages=5, rows_per_page=2).connections == 5
+
+
+def test_main():
+	res = CliRunner().invoke(main, ["sessions", "--pages", "3", "--rows-per-page", "2"])
+	assert res.exit_code == 0, res.output
+	assert "pooled" in res.output
+
+
+def test_codec():
+	assert bench_codec(codec.StdlibJSON(), pages=2, rows_per_page=3).pages == 2
+
+	res = CliRunner().invoke(main, ["codec", "--pages", "2", "--rows-per-page", "3"])
+	assert res.exit_code == 0, res.output
+	assert "| json |" in res.output
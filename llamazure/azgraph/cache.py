@@ -0,0 +1,219 @@
+"""Cache the results of Azure Resource Graph queries"""
+
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from llamazure.azgraph import codec
+from llamazure.azgraph.models import Req, Res
+
+Entry = Tuple[float, Res]  # the time the entry expires, and the result
+
+
+@dataclass
+class CacheStats:
+	"""Metrics for a cache"""
+
+	hits: int = 0
+	misses: int = 0
+	expirations: int = 0  # entries which were found but had expired. These are also misses
+	evictions: int = 0  # entries removed to stay within the size bound
+
+	@property
+	def hit_rate(self) -> float:
+		"""The fraction of lookups which were hits"""
+		lookups = self.hits + self.misses
+		return self.hits / lookups if lookups else 0.0
+
+
+def cache_key(req: Req) -> str:
+	"""
+	The key for a request.
+	Requests for the same query, subscriptions, management group, facets, and options have the same key. The order of subscriptions doesn't matter.
+	"""
+	return json.dumps([req.query, sorted(req.subscriptions), req.managementGroupId, req.facets, req.options], sort_keys=True, cls=codec.Encoder)
+
+
+class Cache(ABC):
+	"""
+	A cache of query results with a time-to-live and a maximum number of entries.
+	Only successful results are cached.
+	"""
+
+	def __init__(self, ttl: float = 60, max_entries: int = 1024, clock: Callable[[], float] = time.time):
+		self.ttl = ttl
+		self.max_entries = max_entries
+		self.clock = clock
+		self.stats = CacheStats()
+		self._lock = threading.Lock()
+
+	def get(self, req: Req) -> Optional[Res]:
+		"""Get the cached result of a request, if it has not expired"""
+		key = cache_key(req)
+		with self._lock:
+			entry = self._load(key)
+			if entry is None:
+				self.stats.misses += 1
+				return None
+			expires, res = entry
+			if expires <= self.clock():
+				self._delete(key)
+				self.stats.expirations += 1
+				self.stats.misses += 1
+				return None
+			self.stats.hits += 1
+		return dataclasses.replace(res, req=req)
+
+	def set(self, req: Req, res: Res):
+		"""Cache the result of a request"""
+		key = cache_key(req)
+		with self._lock:
+			self._store(key, (self.clock() + self.ttl, res))
+			self.stats.evictions += self._evict()
+
+	@abstractmethod
+	def _load(self, key: str) -> Optional[Entry]:
+		"""Load an entry"""
+
+	@abstractmethod
+	def _store(self, key: str, entry: Entry):
+		"""Store an entry"""
+
+	@abstractmethod
+	def _delete(self, key: str):
+		"""Delete an entry"""
+
+	@abstractmethod
+	def _evict(self) -> int:
+		"""Evict the least recently used entries until there are at most `max_entries`. Returns the number evicted"""
+
+	@abstractmethod
+	def clear(self):
+		"""Remove all entries"""
+
+	@abstractmethod
+	def __len__(self) -> int:
+		"""The number of entries, including expired entries which haven't been removed"""
+
+
+class MemoryCache(Cache):
+	"""Cache results in memory"""
+
+	def __init__(self, ttl: float = 60, max_entries: int = 1024, clock: Callable[[], float] = time.time):
+		super().__init__(ttl, max_entries, clock)
+		self._entries: OrderedDict[str, Entry] = OrderedDict()
+
+	def _load(self, key: str) -> Optional[Entry]:
+		entry = self._entries.get(key)
+		if entry is not None:
+			self._entries.move_to_end(key)
+		return entry
+
+	def _store(self, key: str, entry: Entry):
+		self._entries[key] = entry
+		self._entries.move_to_end(key)
+
+	def _delete(self, key: str):
+		self._entries.pop(key, None)
+
+	def _evict(self) -> int:
+		evicted = 0
+		while len(self._entries) > self.max_entries:
+			self._entries.popitem(last=False)
+			evicted += 1
+		return evicted
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+
+class DiskCache(Cache):
+	"""
+	Cache results as JSON files in a directory.
+	The cache can be shared between processes. Files are replaced atomically, so readers never see a partial entry.
+	"""
+
+	def __init__(self, directory: str, ttl: float = 60, max_entries: int = 1024, clock: Callable[[], float] = time.time):
+		super().__init__(ttl, max_entries, clock)
+		self.directory = directory
+		os.makedirs(directory, exist_ok=True)
+
+	def _path(self, key: str) -> str:
+		return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+	def _load(self, key: str) -> Optional[Entry]:
+		path = self._path(key)
+		try:
+			with open(path, mode="r", encoding="utf-8") as f:
+				raw = json.load(f)
+		except (FileNotFoundError, json.JSONDecodeError):
+			return None
+		if raw.get("key") != key:  # a hash collision
+			return None
+		os.utime(path)  # the modification time orders entries for eviction
+		fields = raw["res"]
+		fields["data"] = codec.decode_data(fields["data"])
+		return raw["expires"], Res(req=None, **fields)  # type: ignore # the req is replaced by the caller
+
+	def _store(self, key: str, entry: Entry):
+		expires, res = entry
+		fields = {f.name: getattr(res, f.name) for f in dataclasses.fields(res) if f.name != "req"}
+		fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+		try:
+			with os.fdopen(fd, mode="w", encoding="utf-8") as f:
+				json.dump({"key": key, "expires": expires, "res": fields}, f, cls=codec.Encoder)
+			os.replace(tmp, self._path(key))
+		except BaseException:
+			os.remove(tmp)
+			raise
+
+	def _delete(self, key: str):
+		try:
+			os.remove(self._path(key))
+		except FileNotFoundError:
+			pass
+
+	def _entries(self) -> Dict[str, float]:
+		"""The paths of entries, with their modification times"""
+		out = {}
+		for entry in os.scandir(self.directory):
+			if entry.name.endswith(".json"):
+				try:
+					out[entry.path] = entry.stat().st_mtime
+				except FileNotFoundError:
+					pass
+		return out
+
+	def _evict(self) -> int:
+		entries = self._entries()
+		excess = len(entries) - self.max_entries
+		if excess <= 0:
+			return 0
+		for path in sorted(entries, key=entries.__getitem__)[:excess]:
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass
+		return excess
+
+	def clear(self):
+		with self._lock:
+			for path in self._entries():
+				os.remove(path)
+
+	def __len__(self) -> int:
+		return len(self._entries())
@@ -0,0 +1,172 @@
+"""Tests for caching Azure Resource Graph results"""
+
+# pylint: disable=protected-access
+import os
+import time
+from abc import ABC, abstractmethod
+from unittest.mock import Mock
+
+import pytest
+
+from llamazure.azgraph.azgraph import Graph
+from llamazure.azgraph.cache import Cache, DiskCache, MemoryCache, cache_key
+from llamazure.azgraph.models import Req, Res, ResErr
+
+
+class Clock:
+	"""A clock which only moves when told to"""
+
+	def __init__(self):
+		self.now = 1000.0
+
+	def __call__(self) -> float:
+		return self.now
+
+
+def req(query: str = "Resources", **kwargs) -> Req:
+	return Req(query, ("00000000-0000-0000-0000-000000000000", "00000000-0000-0000-0000-000000000001"), **kwargs)
+
+
+def res(r: Req, data=None) -> Res:
+	return Res(r, 1, 1, resultTruncated="false", facets=[], data=data or [{"id": "0"}])  # type: ignore # facets are decoded from JSON
+
+
+class TestCacheKey:
+	def test_subscription_order_does_not_matter(self):
+		assert cache_key(req()) == cache_key(Req("Resources", tuple(reversed(req().subscriptions))))
+
+	def test_bypass_does_not_matter(self):
+		assert cache_key(req()) == cache_key(req(bypass_cache=True))
+
+	def test_options_matter(self):
+		assert cache_key(req()) != cache_key(req(options={"$top": 5}))
+		assert cache_key(req()) != cache_key(req(managementGroupId="mg0"))
+
+
+class ABCTestCache(ABC):
+	"""Tests which every cache backend must pass"""
+
+	@abstractmethod
+	def make(self, tmp_path, clock: Clock, ttl: float = 60, max_entries: int = 10) -> Cache:
+		"""Make a cache"""
+
+	def test_miss_then_hit(self, tmp_path):
+		cache = self.make(tmp_path, Clock())
+		r = req()
+
+		assert cache.get(r) is None
+		cache.set(r, res(r))
+		assert cache.get(r) == res(r)
+		assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+	def test_hit_has_request(self, tmp_path):
+		"""Test that the result of a hit has the request that was made, even if it was cached for a different one"""
+		cache = self.make(tmp_path, Clock())
+		cache.set(req(), res(req()))
+
+		reordered = Req("Resources", tuple(reversed(req().subscriptions)))
+		hit = cache.get(reordered)
+		assert hit is not None
+		assert hit.req == reordered
+
+	def test_expires(self, tmp_path):
+		clock = Clock()
+		cache = self.make(tmp_path, clock, ttl=10)
+		cache.set(req(), res(req()))
+
+		clock.now += 9
+		assert cache.get(req()) is not None
+		clock.now += 1
+		assert cache.get(req()) is None
+		assert cache.stats.expirations == 1
+		assert len(cache) == 0
+
+	def test_evicts_least_recently_used(self, tmp_path):
+		clock = Clock()
+		cache = self.make(tmp_path, clock, max_entries=2)
+		a, b, c = req("a"), req("b"), req("c")
+		cache.set(a, res(a))
+		clock.now += 1
+		cache.set(b, res(b))
+		clock.now += 1
+		cache.get(a)
+		self.tick()
+		cache.set(c, res(c))
+
+		assert cache.get(b) is None
+		assert cache.get(a) is not None
+		assert cache.get(c) is not None
+		assert cache.stats.evictions == 1
+
+	def test_clear(self, tmp_path):
+		cache = self.make(tmp_path, Clock())
+		cache.set(req(), res(req()))
+		cache.clear()
+		assert cache.get(req()) is None
+
+	def tick(self):
+		"""Let the backend's notion of recency move on"""
+
+
+class TestMemoryCache(ABCTestCache):
+	def make(self, tmp_path, clock: Clock, ttl: float = 60, max_entries: int = 10) -> Cache:
+		return MemoryCache(ttl, max_entries, clock)
+
+
+class TestDiskCache(ABCTestCache):
+	def make(self, tmp_path, clock: Clock, ttl: float = 60, max_entries: int = 10) -> Cache:
+		return DiskCache(str(tmp_path / "cache"), ttl, max_entries, clock)
+
+	def tick(self):
+		time.sleep(0.01)  # recency is the modification time of the file
+
+	def test_shared_between_instances(self, tmp_path):
+		clock = Clock()
+		self.make(tmp_path, clock).set(req(), res(req()))
+		assert self.make(tmp_path, clock).get(req()) == res(req())
+
+	def test_failed_store(self, tmp_path):
+		"""Test that a result which can't be stored doesn't leave a temporary file"""
+		cache = self.make(tmp_path, Clock())
+
+		with pytest.raises(TypeError):
+			cache.set(req(), res(req(), data=[object()]))
+
+		assert os.listdir(tmp_path / "cache") == []
+
+
+class TestGraphCache:
+	"""Test that a Graph uses its cache"""
+
+	failed_res = ResErr("BadThings", "Bad things happened", ())
+
+	def graph(self, cache):
+		g = Graph(None, req().subscriptions, cache=cache)
+		g._exec_query = Mock(side_effect=lambda r, *_: res(r))
+		return g
+
+	def test_cached(self):
+		g = self.graph(MemoryCache())
+
+		assert g.query(req()) == g.query(req())
+		assert g._exec_query.call_count == 1
+		assert g.cache.stats.hits == 1
+
+	def test_bypass(self):
+		g = self.graph(MemoryCache())
+		g.query(req())
+
+		g._exec_query.side_effect = lambda r, *_: res(r, data=[{"id": "1"}])
+		fresh = g.query(req(bypass_cache=True))
+
+		assert g._exec_query.call_count == 2
+		assert fresh.data == [{"id": "1"}]
+		assert g.query(req()).data == [{"id": "1"}]  # the fresh result is cached
+
+	def test_errors_are_not_cached(self):
+		g = self.graph(MemoryCache())
+		g._exec_query.side_effect = [self.failed_res, res(req())]
+
+		assert g.query(req()) == self.failed_res
+		assert isinstance(g.query(req()), Res)
+		assert g._exec_query.call_count == 2
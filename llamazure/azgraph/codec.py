@@ -2,30 +2,161 @@
 
 import dataclasses
 import json
-from typing import Any, Dict
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional
 
-from llamazure.azgraph.models import Req, Res, ResErr, ResMaybe
+from llamazure.azgraph.models import Req, Res, ResErr, ResMaybe, Table
+
+_REQ_FIELDS = tuple(f.name for f in dataclasses.fields(Req) if not f.metadata.get("local"))
+_SKIP_TOKEN = re.compile(rb'"\$skipToken"\s*:\s*"([^"\\]*)"')
 
 
 class Encoder(json.JSONEncoder):
 	"""Encode Req for JSON for Azure"""
 
 	def default(self, o: Any) -> Any:
+		if isinstance(o, Table):
+			return o.to_json()
 		if hasattr(type(o), "__dataclass_fields__"):  # inline the check for dataclasses to help mypy
-			return dataclasses.asdict(o)
+			return {f.name: getattr(o, f.name) for f in dataclasses.fields(o) if not f.metadata.get("local")}
 		return super().default(o)
 
 
+def encode(req: Req) -> Dict[str, Any]:
+	"""The body of a request to Azure. This doesn't copy the fields of the request"""
+	return {name: getattr(req, name) for name in _REQ_FIELDS}
+
+
+def plain(o: Any, default: Callable[[Any], Any]) -> Any:
+	"""Replace the values which aren't plain JSON with what `default` makes of them, like `json.JSONEncoder` does"""
+	if isinstance(o, dict):
+		return {k: plain(v, default) for k, v in o.items()}
+	if isinstance(o, (list, tuple)):
+		return [plain(v, default) for v in o]
+	if o is None or isinstance(o, (str, int, float)):
+		return o
+	return plain(default(o), default)
+
+
+class JSONBackend(ABC):
+	"""A JSON library for encoding requests and decoding responses. Backends only need to handle plain JSON values"""
+
+	name: str
+
+	@abstractmethod
+	def dumps(self, o: Any) -> bytes:
+		"""Encode into JSON"""
+
+	@abstractmethod
+	def loads(self, raw: bytes) -> Any:
+		"""Decode from JSON"""
+
+
+class StdlibJSON(JSONBackend):
+	"""JSON with the standard library"""
+
+	name = "json"
+
+	def dumps(self, o: Any) -> bytes:
+		return json.dumps(o, cls=Encoder).encode()
+
+	def loads(self, raw: bytes) -> Any:
+		return json.loads(raw)
+
+
+class OrjsonJSON(JSONBackend):
+	"""JSON with orjson. Install with the `orjson` extra"""
+
+	name = "orjson"
+
+	def __init__(self):
+		import orjson  # pylint: disable=import-outside-toplevel # optional dependency
+
+		self._orjson = orjson
+		self._default = Encoder().default
+		self._option = orjson.OPT_PASSTHROUGH_DATACLASS  # so dataclasses are encoded by the Encoder, without their local fields
+
+	def dumps(self, o: Any) -> bytes:
+		return self._orjson.dumps(o, default=self._default, option=self._option)
+
+	def loads(self, raw: bytes) -> Any:
+		return self._orjson.loads(raw)
+
+
+class MsgspecJSON(JSONBackend):
+	"""JSON with msgspec. Install with the `msgspec` extra"""
+
+	name = "msgspec"
+
+	def __init__(self):
+		import msgspec  # pylint: disable=import-outside-toplevel # optional dependency
+
+		self._encoder = msgspec.json.Encoder()
+		self._decoder = msgspec.json.Decoder()
+		self._default = Encoder().default
+
+	def dumps(self, o: Any) -> bytes:
+		# msgspec encodes dataclasses itself and can't be told not to, so they are replaced by what the Encoder makes of them first
+		return self._encoder.encode(plain(o, self._default))
+
+	def loads(self, raw: bytes) -> Any:
+		return self._decoder.decode(raw)
+
+
+def default_backend() -> JSONBackend:
+	"""The fastest JSON backend which is installed"""
+	for backend in (OrjsonJSON, MsgspecJSON):
+		try:
+			return backend()
+		except ImportError:
+			continue
+	return StdlibJSON()
+
+
 class Decoder:
 	"""Decode Res from JSON from Azure"""
 
+	def __init__(self, backend: JSONBackend = StdlibJSON()):
+		self.backend = backend
+
+	def decode_bytes(self, req: Req, raw: bytes) -> ResMaybe:
+		"""Decode Res from the body of a response from Azure"""
+		return self.decode(req, self.backend.loads(raw))
+
 	def decode(self, req: Req, o: Dict) -> ResMaybe:
 		"""Decode Res from JSON from Azure"""
-		error = o.pop("error", None)
+		error = o.get("error")
 		if error:
 			details_json = error.pop("details", [])
 			details = tuple(detail_json for detail_json in details_json)
 			return ResErr(**error, details=details)
 
-		skip_token = o.pop("$skipToken", None)
-		return Res(req=req, **o, skipToken=skip_token)
+		return Res(
+			req=req,
+			totalRecords=o["totalRecords"],
+			count=o["count"],
+			resultTruncated=o["resultTruncated"],
+			facets=o["facets"],
+			data=decode_data(o["data"]),
+			skipToken=o.get("$skipToken"),
+		)
+
+
+def decode_data(data: Any) -> Any:
+	"""Decode the data of a result, which is a list of rows or, in the table format, a Table"""
+	if isinstance(data, dict) and "columns" in data and "rows" in data:
+		return Table.from_json(data)
+	return data
+
+
+def peek_skip_token(raw: bytes) -> Optional[str]:
+	"""
+	Find the skipToken in the body of a response without decoding it, so the next page can be fetched while this one is decoded.
+	Azure sends the skipToken after the data, so this looks for the last one. The caller must check it against the decoded skipToken.
+	"""
+	i = raw.rfind(b'"$skipToken"')
+	if i == -1:
+		return None
+	m = _SKIP_TOKEN.match(raw, i)
+	return m.group(1).decode() if m else None
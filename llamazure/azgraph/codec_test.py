@@ -1,9 +1,12 @@
 """Test encoding Req and decoding Res and ResErr"""
 
 import json
+from abc import ABC, abstractmethod
 
-from llamazure.azgraph.codec import Decoder, Encoder
-from llamazure.azgraph.models import Req, Res, ResErr
+import pytest
+
+from llamazure.azgraph.codec import Decoder, Encoder, JSONBackend, MsgspecJSON, OrjsonJSON, StdlibJSON, encode
+from llamazure.azgraph.models import Column, Req, Res, ResErr, Table
 
 
 class TestEncoder:
@@ -15,6 +18,14 @@ class TestEncoder:
 		enc = json.dumps(self.empty_req, cls=Encoder)
 		assert enc == '{"query": "", "subscriptions": ["00000000-0000-0000-0000-000000000000"], "facets": [], "managementGroupId": null, "options": {}}'
 
+	def test_local_fields_are_not_sent(self):
+		enc = json.dumps(Req("", ("00000000-0000-0000-0000-000000000000",), bypass_cache=True), cls=Encoder)
+		assert "bypass_cache" not in json.loads(enc)
+
+	def test_encode_matches_encoder(self):
+		req = Req("Resources", ("00000000-0000-0000-0000-000000000000",), options={"$top": 5}, bypass_cache=True)
+		assert json.dumps(encode(req)) == json.dumps(req, cls=Encoder)
+
 
 class TestDecoder:
 	"""Test the Decoder"""
@@ -59,3 +70,79 @@ class TestDecoder:
 		assert isinstance(res, Res)
 		assert len(res.data) == 3
 		assert res.skipToken
+
+	def test_decode_table(self):
+		body = {
+			"totalRecords": 2,
+			"count": 2,
+			"data": {
+				"columns": [{"name": "name", "type": "string"}, {"name": "sku", "type": "object"}],
+				"rows": [["sa0", {"name": "Standard_LRS"}], ["sa1", {"name": "Premium_LRS"}]],
+			},
+			"facets": [],
+			"resultTruncated": "false",
+		}
+		res = Decoder().decode(self.empty_req, body)
+
+		assert isinstance(res, Res)
+		assert res.data == Table((Column("name", "string"), Column("sku", "object")), (["sa0", "sa1"], [{"name": "Standard_LRS"}, {"name": "Premium_LRS"}]))
+
+	def test_table_roundtrip(self):
+		table = Table((Column("name", "string"),), (["sa0", "sa1"],))
+		assert (
+			Decoder().decode(self.empty_req, json.loads(json.dumps({"totalRecords": 2, "count": 2, "data": table, "facets": [], "resultTruncated": "false"}, cls=Encoder))).data
+			== table
+		)
+
+
+class ABCTestJSONBackend(ABC):
+	"""Tests which every JSON backend must pass"""
+
+	empty_req = Req("", ("00000000-0000-0000-0000-000000000000",))
+
+	@abstractmethod
+	def make(self) -> JSONBackend:
+		"""Make the backend, skipping the test if it isn't installed"""
+
+	def test_encode_req(self):
+		assert json.loads(self.make().dumps(encode(self.empty_req))) == json.loads(json.dumps(self.empty_req, cls=Encoder))
+
+	def test_same_as_stdlib(self):
+		"""Test that nested dataclasses are encoded by the Encoder, without their local fields"""
+		nested = Req("Resources", ("00000000-0000-0000-0000-000000000000",), bypass_cache=True)
+		table = Table((Column("name", "string"),), (["sa0"],))
+		req = Req("Resources", ("00000000-0000-0000-0000-000000000000",), options={"nested": nested, "table": table, "list": [nested]})
+
+		encoded = json.loads(self.make().dumps(encode(req)))
+		assert encoded == json.loads(StdlibJSON().dumps(encode(req)))
+		assert "bypass_cache" not in encoded["options"]["nested"]
+
+	def test_decode_bytes(self):
+		body = json.dumps({"totalRecords": 1, "count": 1, "data": [{"id": "0"}], "facets": [], "resultTruncated": "false", "$skipToken": "1"}).encode()
+		res = Decoder(self.make()).decode_bytes(self.empty_req, body)
+
+		assert res == Res(self.empty_req, 1, 1, "false", [], [{"id": "0"}], "1")  # type: ignore # facets are decoded from JSON
+
+	def test_decode_error(self):
+		body = json.dumps({"error": {"code": "BadRequest", "message": "bad", "details": [{"code": "InvalidQuery", "message": "bad"}]}}).encode()
+		res = Decoder(self.make()).decode_bytes(self.empty_req, body)
+
+		assert isinstance(res, ResErr)
+		assert res.details[0]["code"] == "InvalidQuery"
+
+
+class TestStdlibJSON(ABCTestJSONBackend):
+	def make(self) -> JSONBackend:
+		return StdlibJSON()
+
+
+class TestOrjsonJSON(ABCTestJSONBackend):
+	def make(self) -> JSONBackend:
+		pytest.importorskip("orjson")
+		return OrjsonJSON()
+
+
+class TestMsgspecJSON(ABCTestJSONBackend):
+	def make(self) -> JSONBackend:
+		pytest.importorskip("msgspec")
+		return MsgspecJSON()
@@ -0,0 +1,32 @@
+"""Convert results in the table format into NumPy arrays. Install with the `columnar` extra"""
+
+from __future__ import annotations
+
+from typing import Dict
+
+import numpy as np
+
+from llamazure.azgraph.models import Table
+
+DTYPES = {
+	"integer": np.int64,
+	"long": np.int64,
+	"real": np.float64,
+	"double": np.float64,
+	"boolean": np.bool_,
+}
+"""NumPy dtypes for the types of columns. Other types are stored as objects"""
+
+
+def to_arrays(table: Table) -> Dict[str, np.ndarray]:
+	"""
+	Convert each column of a table into an array.
+	Columns of numbers and booleans become arrays of that type, unless they have null values, in which case they are stored as objects like other columns.
+	"""
+	out: Dict[str, np.ndarray] = {}
+	for column, values in zip(table.columns, table.values):
+		dtype = DTYPES.get(column.type, object)
+		if dtype is not object and any(v is None for v in values):
+			dtype = object
+		out[column.name] = np.array(values, dtype=dtype)
+	return out
@@ -0,0 +1,84 @@
+"""Tests for results in the table format"""
+
+import numpy as np
+import pytest
+
+from llamazure.azgraph.azgraph import Graph, RetryPolicy, ShardPolicy, accumulate
+from llamazure.azgraph.cache import DiskCache
+from llamazure.azgraph.columnar import to_arrays
+from llamazure.azgraph.conftest import FakeARG, Token
+from llamazure.azgraph.models import Column, Req, Res, Table
+
+columns = (Column("name", "string"), Column("count", "integer"))
+
+
+def table(names, counts) -> Table:
+	return Table(columns, (list(names), list(counts)))
+
+
+class TestTable:
+	def test_rows_are_dicts(self):
+		t = table(["a", "b"], [1, 2])
+
+		assert len(t) == 2
+		assert t[1] == {"name": "b", "count": 2}
+		assert t.to_dicts() == [{"name": "a", "count": 1}, {"name": "b", "count": 2}]
+
+	def test_column(self):
+		assert table(["a", "b"], [1, 2]).column("count") == [1, 2]
+
+	def test_from_json_empty(self):
+		t = Table.from_json({"columns": [{"name": "name", "type": "string"}], "rows": []})
+		assert len(t) == 0
+		assert t.column("name") == []
+
+	def test_concat(self):
+		assert table(["a"], [1]) + table(["b"], [2]) == table(["a", "b"], [1, 2])
+
+	def test_concat_different_columns(self):
+		with pytest.raises(ValueError):
+			Table.concat([table(["a"], [1]), Table((Column("other", "string"),), (["b"],))])
+
+	def test_accumulate(self):
+		req = Req("Resources", ("00000000-0000-0000-0000-000000000000",))
+		pages = [Res(req, 3, 2, "false", (), table(["a", "b"], [1, 2]), "2"), Res(req, 3, 1, "false", (), table(["c"], [3]))]
+
+		res = accumulate(pages)
+
+		assert isinstance(res, Res)
+		assert res.data == table(["a", "b", "c"], [1, 2, 3])
+		assert res.count == 3
+
+
+class TestArrays:
+	def test_types(self):
+		arrays = to_arrays(table(["a", "b"], [1, 2]))
+
+		assert arrays["count"].dtype == np.int64
+		assert arrays["count"].sum() == 3
+		assert arrays["name"].tolist() == ["a", "b"]
+
+	def test_nulls_are_objects(self):
+		assert to_arrays(table(["a", "b"], [1, None]))["count"].dtype == object
+
+
+class TestGraph:
+	subscriptions = tuple(f"{i:08}-0000-0000-0000-000000000000" for i in range(3))
+
+	def test_q_table(self, fake_arg: FakeARG):
+		fake_arg.rows = [{"id": str(i), "name": f"r{i}"} for i in range(5)]
+		fake_arg.page_size = 2
+		g = Graph(Token(), self.subscriptions, RetryPolicy(), shard_policy=ShardPolicy(size=2), url=fake_arg.url)
+
+		t = g.q_table("Resources")
+
+		assert fake_arg.requests[0]["options"] == {"resultFormat": "table"}
+		assert t.names == ("id", "name")
+		assert sorted(t.column("id")) == sorted([str(i) for i in range(5)] * 2)
+
+	def test_cached_on_disk(self, fake_arg: FakeARG, tmp_path):
+		fake_arg.rows = [{"id": "0"}]
+		g = Graph(Token(), self.subscriptions, url=fake_arg.url, cache=DiskCache(str(tmp_path)))
+
+		assert g.q_table("Resources") == g.q_table("Resources")
+		assert len(fake_arg.requests) == 1
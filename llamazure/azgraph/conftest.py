@@ -0,0 +1,238 @@
+"""A fake Azure Resource Graph for testing clients without Azure"""
+
+import datetime
+import ipaddress
+import json
+import os
+import re
+import ssl
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import pytest
+
+from llamazure.azgraph.throttle import QUOTA_REMAINING, QUOTA_RESETS_AFTER
+
+
+@dataclass
+class Token:
+	"""Shim for an Azure token"""
+
+	token: str = "fake"
+
+
+class Clock:
+	"""A clock which moves when something sleeps"""
+
+	def __init__(self):
+		self.now = 1000.0
+
+	def __call__(self) -> float:
+		return self.now
+
+	def sleep(self, s: float):
+		self.now += s
+
+
+@dataclass
+class FakeARG:
+	"""
+	Serve Azure Resource Graph queries over HTTP on localhost.
+	Every query returns `rows`, paginated by `page_size`, unless `query_rows` is set to compute the rows for a query, like `FakeTables`.
+	Set `fail_next` to return that many errors before succeeding.
+	Set `throttle_next` to return that many 429s with a Retry-After header before succeeding.
+	Set `quota` to throttle requests like the Azure Resource Graph does, with quota headers.
+	"""
+
+	rows: List[Any] = field(default_factory=list)
+	query_rows: Optional[Callable[[str], List[Any]]] = None
+	page_size: int = 1000
+	delay: float = 0.0
+	fail_next: int = 0
+	throttle_next: int = 0
+	quota: Optional[int] = None  # requests allowed in each window of `quota_window` seconds
+	quota_window: float = 1.0
+	url: str = ""
+
+	requests: List[Dict] = field(default_factory=list)
+	connections: Set[Tuple[str, int]] = field(default_factory=set)  # the client addresses which made requests
+	in_flight: int = 0
+	max_in_flight: int = 0
+	throttled: int = 0  # requests which were refused with a 429
+	_window_start: float = 0.0
+	_used: int = 0
+	_lock: threading.Lock = field(default_factory=threading.Lock)
+
+	def respond(self, body: Dict, client: Tuple[str, int] = ("", 0)) -> Tuple[int, Dict[str, str], Dict]:
+		"""Make the response to a query, as the status, headers, and body"""
+		with self._lock:
+			self.requests.append(body)
+			self.connections.add(client)
+			headers = self._spend_quota()
+			throttled = headers.get(QUOTA_REMAINING) == "-1"
+			if throttled:
+				headers[QUOTA_REMAINING] = "0"
+			elif self.throttle_next > 0:
+				self.throttle_next -= 1
+				headers["Retry-After"] = "0"
+				throttled = True
+			if throttled:
+				self.throttled += 1
+				return 429, headers, {"error": {"code": "RateLimiting", "message": "Too many requests", "details": []}}
+			self.in_flight += 1
+			self.max_in_flight = max(self.max_in_flight, self.in_flight)
+			failing = self.fail_next > 0
+			if failing:
+				self.fail_next -= 1
+		try:
+			time.sleep(self.delay)
+			if failing:
+				return 200, headers, {"error": {"code": "BadThings", "message": "Bad things happened", "details": [{"code": "BadThings", "message": "Bad things happened"}]}}
+
+			rows = self.query_rows(body["query"]) if self.query_rows else self.rows
+			options = body.get("options", {})
+			start = int(options.get("$skipToken", options.get("$skip", 0)))
+			end = start + self.page_size
+			page = rows[start:end]
+			data: Any = page
+			if options.get("resultFormat") == "table":
+				names = sorted({k for row in rows for k in row})
+				data = {"columns": [{"name": n, "type": "string"} for n in names], "rows": [[row.get(n) for n in names] for row in page]}
+			res = {"totalRecords": len(rows), "count": len(page), "resultTruncated": "false", "facets": [], "data": data}
+			if end < len(rows):
+				res["$skipToken"] = str(end)
+			return 200, headers, res
+		finally:
+			with self._lock:
+				self.in_flight -= 1
+
+	def _spend_quota(self) -> Dict[str, str]:
+		"""Count a request against the quota, returning the quota headers. The remaining quota is -1 if the request is throttled"""
+		if self.quota is None:
+			return {}
+		now = time.monotonic()
+		if now >= self._window_start + self.quota_window:
+			self._window_start, self._used = now, 0
+		resets_after = self._window_start + self.quota_window - now
+		remaining = self.quota - self._used - 1
+		if remaining >= 0:
+			self._used += 1
+		return {QUOTA_REMAINING: str(max(remaining, -1)), QUOTA_RESETS_AFTER: f"00:00:{resets_after:06.3f}"}
+
+
+@dataclass
+class FakeTables:
+	"""
+	Compute the rows for queries of tables of resources, for `FakeARG.query_rows`.
+	This only understands the parts of KQL which the clients use:
+	the table a query starts with, `where id in~ (...)`, and the time since which `resourcechanges` are queried.
+	Queries of `resourcechanges` return the latest change to each resource, as the `targetResourceId`, `changeType`, and `changeTime`.
+	"""
+
+	tables: Dict[str, List[Dict]] = field(default_factory=dict)
+	queries: List[str] = field(default_factory=list)
+
+	def __call__(self, query: str) -> List[Any]:
+		self.queries.append(query)
+		table = query.split("|", 1)[0].strip().lower()
+		rows = self.tables.get(table, [])
+		if table == "resourcechanges":
+			return self._changes(query, rows)
+
+		ids = re.search(r"where id in~ \((.*)\)", query)
+		if ids:
+			wanted = {i.lower() for i in re.findall(r"'((?:[^'\\]|\\.)*)'", ids.group(1))}
+			rows = [row for row in rows if row["id"].lower() in wanted]
+		return rows
+
+	@staticmethod
+	def _changes(query: str, rows: List[Dict]) -> List[Any]:
+		since = re.search(r"changeTime > datetime\(([^)]*)\)", query)
+		if since:
+			rows = [row for row in rows if row["changeTime"] > since.group(1)]
+		latest: Dict[str, Dict] = {}
+		for row in sorted(rows, key=lambda r: r["changeTime"]):
+			latest[row["targetResourceId"].lower()] = row
+		return list(latest.values())
+
+
+def self_signed_cert(directory: str) -> Tuple[str, str]:
+	"""Create a self-signed certificate for localhost, returning the paths of the certificate and key"""
+	from cryptography import x509
+	from cryptography.hazmat.primitives import hashes, serialization
+	from cryptography.hazmat.primitives.asymmetric import ec
+	from cryptography.x509.oid import NameOID
+
+	key = ec.generate_private_key(ec.SECP256R1())
+	name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+	now = datetime.datetime.now(datetime.timezone.utc)
+	cert = (
+		x509.CertificateBuilder()
+		.subject_name(name)
+		.issuer_name(name)
+		.public_key(key.public_key())
+		.serial_number(x509.random_serial_number())
+		.not_valid_before(now)
+		.not_valid_after(now + datetime.timedelta(days=1))
+		.add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+		.add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+		.sign(key, hashes.SHA256())
+	)
+	certfile, keyfile = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+	with open(certfile, "wb") as f:
+		f.write(cert.public_bytes(serialization.Encoding.PEM))
+	with open(keyfile, "wb") as f:
+		f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+	return certfile, keyfile
+
+
+def serve(fake: FakeARG, tls: Optional[Tuple[str, str]] = None) -> ThreadingHTTPServer:
+	"""
+	Start an HTTP server for the fake in a background thread. This sets the URL of the fake
+	Pass a certificate and key from `self_signed_cert` to serve HTTPS.
+	"""
+
+	class Handler(BaseHTTPRequestHandler):
+		protocol_version = "HTTP/1.1"  # support keep-alive
+		disable_nagle_algorithm = True  # otherwise the body waits for the client to acknowledge the headers
+
+		def do_POST(self):  # pylint: disable=invalid-name
+			body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+			status, headers, res = fake.respond(body, self.client_address)
+			out = json.dumps(res).encode()
+			self.send_response(status)
+			for k, v in headers.items():
+				self.send_header(k, v)
+			self.send_header("Content-Type", "application/json")
+			self.send_header("Content-Length", str(len(out)))
+			self.end_headers()
+			self.wfile.write(out)
+
+		def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+			pass
+
+	class Server(ThreadingHTTPServer):
+		daemon_threads = True
+		request_queue_size = 128  # the default of 5 makes concurrent clients wait for connections to be retried
+
+	server = Server(("127.0.0.1", 0), Handler)
+	if tls:
+		context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+		context.load_cert_chain(*tls)
+		server.socket = context.wrap_socket(server.socket, server_side=True)
+	fake.url = f"{'https' if tls else 'http'}://127.0.0.1:{server.server_address[1]}/providers/Microsoft.ResourceGraph/resources"
+	threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True).start()
+	return server
+
+
+@pytest.fixture
+def fake_arg() -> Iterator[FakeARG]:
+	"""A FakeARG being served"""
+	fake = FakeARG()
+	server = serve(fake)
+	yield fake
+	server.shutdown()
+	server.server_close()
@@ -0,0 +1,50 @@
+"""Build Kusto queries for the Azure Resource Graph"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Iterable, List
+
+
+def kql_string(s: str) -> str:
+	"""Quote a string for KQL"""
+	return "'" + s.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def kql_datetime(t: datetime) -> str:
+	"""Format a datetime for KQL"""
+	return f"datetime({t.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')})"
+
+
+def where_in(query: str, column: str, keys: Iterable[str]) -> str:
+	"""Restrict a query to rows where a column is one of some keys, ignoring case"""
+	return f"{query} | where {column} in~ ({', '.join(kql_string(k) for k in keys)})"
+
+
+def pack_in(query: str, column: str, keys: Iterable[str], max_length: int, max_keys: int) -> List[str]:
+	"""
+	Pack keys into as few `where_in` queries as possible, with at most `max_keys` keys and `max_length` characters in each query.
+	Keys are deduplicated ignoring case, since `in~` ignores case.
+	"""
+	base = len(where_in(query, column, []))
+	queries: List[str] = []
+	chunk: List[str] = []
+	length = base
+	seen = set()
+	for key in keys:
+		folded = key.lower()
+		if folded in seen:
+			continue
+		seen.add(folded)
+
+		quoted = len(kql_string(key))
+		if base + quoted > max_length:
+			raise ValueError(f"key is too long to fit in a query of {max_length} characters: {key}")
+		if chunk and (length + 2 + quoted > max_length or len(chunk) >= max_keys):
+			queries.append(where_in(query, column, chunk))
+			chunk, length = [], base
+		length += quoted + (2 if chunk else 0)  # with the separator if the key isn't the first
+		chunk.append(key)
+	if chunk:
+		queries.append(where_in(query, column, chunk))
+	return queries
@@ -0,0 +1,60 @@
+"""Tests for building Kusto queries"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from llamazure.azgraph.kql import kql_datetime, kql_string, pack_in, where_in
+
+
+def test_quote():
+	assert kql_string("it's") == "'it\\'s'"
+	assert kql_string("a\\b") == "'a\\\\b'"
+
+
+def test_datetime():
+	assert kql_datetime(datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)) == "datetime(2024-01-02T03:04:05.000000Z)"
+
+
+def test_where_in():
+	assert where_in("Resources", "id", ["/a", "/b"]) == "Resources | where id in~ ('/a', '/b')"
+
+
+class TestPack:
+	def test_one_query(self):
+		assert pack_in("Resources", "id", ["/a", "/b"], 1000, 1000) == ["Resources | where id in~ ('/a', '/b')"]
+
+	def test_max_keys(self):
+		assert pack_in("Resources", "id", ["/a", "/b", "/c"], 1000, 2) == [
+			"Resources | where id in~ ('/a', '/b')",
+			"Resources | where id in~ ('/c')",
+		]
+
+	def test_max_length(self):
+		keys = [f"/{i:04}" for i in range(100)]
+		queries = pack_in("Resources", "id", keys, 200, 1000)
+
+		assert len(queries) > 1
+		assert all(len(q) <= 200 for q in queries)
+		assert sum(q.count("'") // 2 for q in queries) == 100
+
+	def test_fills_to_max_length(self):
+		query = where_in("Resources", "id", ["/a", "/b"])
+		assert pack_in("Resources", "id", ["/a", "/b", "/c"], len(query), 1000) == [query, "Resources | where id in~ ('/c')"]
+
+	def test_long_key_after_others(self):
+		"""Test that a key which only fits in a query by itself starts a new query"""
+		long_key = "/" + "a" * 20
+		max_length = len(where_in("Resources", "id", [long_key]))
+
+		assert pack_in("Resources", "id", ["/b", long_key], max_length, 1000) == [where_in("Resources", "id", ["/b"]), where_in("Resources", "id", [long_key])]
+
+	def test_deduplicates_ignoring_case(self):
+		assert pack_in("Resources", "id", ["/a", "/A", "/a"], 1000, 1000) == ["Resources | where id in~ ('/a')"]
+
+	def test_no_keys(self):
+		assert pack_in("Resources", "id", [], 1000, 1000) == []
+
+	def test_key_too_long(self):
+		with pytest.raises(ValueError):
+			pack_in("Resources", "id", ["/" + "a" * 100], 50, 1000)
@@ -0,0 +1,172 @@
+"""Measure the latency and volume of Azure Resource Graph queries"""
+
+from __future__ import annotations
+
+import math
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Sequence
+
+from llamazure.azgraph.models import ResErr, ResMaybe
+
+_LITERALS = re.compile(r"datetime\([^)]*\)|'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+
+def fingerprint(query: str) -> str:
+	"""
+	Normalise a query so that queries which only differ in their literals have the same fingerprint.
+	For example, `Resources | where id in~ ('/a', '/b') | limit 5` becomes `Resources | where id in~ (?) | limit ?`
+	"""
+	q = _LITERALS.sub("?", query)
+	q = _LISTS.sub("(?)", q)
+	return " ".join(q.split())
+
+
+@dataclass
+class QueryMetrics:
+	"""
+	Measurements of one query, over all of its pages and shards.
+	Metrics are recorded from the threads which fetch pages, so recording is thread-safe.
+	"""
+
+	query: str
+	started: float = field(default_factory=time.perf_counter)
+	elapsed: float = 0.0  # seconds from the start of the query until it finished
+	page_latencies: List[float] = field(default_factory=list)  # seconds for each request, from sending it until its whole response arrived. Retries are requests too
+	bytes: int = 0  # size of the bodies of the responses
+	pages: int = 0  # pages decoded
+	rows: int = 0
+	decode_time: float = 0.0  # seconds spent decoding pages
+	retries: int = 0
+	throttle_wait: float = 0.0  # seconds spent waiting for the throttling quota
+	cached: bool = False  # whether the result came from the cache
+	shared: bool = False  # whether the result was shared from the same query in flight
+	error: Optional[str] = None  # the code of the error, or the type of the exception, if the query failed
+
+	_lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+	@property
+	def fingerprint(self) -> str:
+		return fingerprint(self.query)
+
+	def record_request(self, latency: float, size: int, throttle_wait: float):
+		with self._lock:
+			self.page_latencies.append(latency)
+			self.bytes += size
+			self.throttle_wait += throttle_wait
+
+	def record_page(self, decode_time: float, rows: int):
+		with self._lock:
+			self.pages += 1
+			self.rows += rows
+			self.decode_time += decode_time
+
+	def record_retry(self):
+		with self._lock:
+			self.retries += 1
+
+	def finish(self, res: Optional[ResMaybe]):
+		"""Record the end of the query, with its result or its last page"""
+		self.elapsed = time.perf_counter() - self.started
+		if isinstance(res, ResErr):
+			self.error = res.code
+
+
+Hook = Callable[[QueryMetrics], None]
+"""Called with the metrics of each query when it finishes"""
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+	"""The nearest-rank percentile of some values, or 0 if there are none"""
+	if not values:
+		return 0.0
+	ordered = sorted(values)
+	return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+@dataclass
+class Summary:
+	"""Metrics of the queries with one fingerprint"""
+
+	queries: int
+	errors: int
+	cached: int
+	shared: int
+	pages: int
+	rows: int
+	bytes: int
+	retries: int
+	throttle_wait: float
+	decode_time: float
+	elapsed: Dict[int, float]  # percentiles of the time for a whole query
+	page_latency: Dict[int, float]  # percentiles of the time for each request
+
+
+class Aggregator:
+	"""
+	A hook which keeps metrics in memory and summarises them for each query fingerprint.
+	Only the latest `max_samples` queries of each fingerprint are kept.
+
+	>>> metrics = Aggregator()
+	>>> graph.hooks.append(metrics)
+	>>> print(metrics.report())
+	"""
+
+	percentiles = (50, 95, 99)
+
+	def __init__(self, max_samples: int = 10_000):
+		self.max_samples = max_samples
+		self._lock = threading.Lock()
+		self._samples: Dict[str, Deque[QueryMetrics]] = {}
+
+	def __call__(self, metrics: QueryMetrics):
+		key = metrics.fingerprint
+		with self._lock:
+			if key not in self._samples:
+				self._samples[key] = deque(maxlen=self.max_samples)
+			self._samples[key].append(metrics)
+
+	def clear(self):
+		with self._lock:
+			self._samples.clear()
+
+	def summary(self) -> Dict[str, Summary]:
+		"""Summarise the metrics of each fingerprint"""
+		with self._lock:
+			samples = {k: list(v) for k, v in self._samples.items()}
+		return {k: self._summarise(v) for k, v in samples.items()}
+
+	def _summarise(self, samples: List[QueryMetrics]) -> Summary:
+		elapsed = [m.elapsed for m in samples]
+		latencies = [latency for m in samples for latency in m.page_latencies]
+		return Summary(
+			queries=len(samples),
+			errors=sum(m.error is not None for m in samples),
+			cached=sum(m.cached for m in samples),
+			shared=sum(m.shared for m in samples),
+			pages=sum(m.pages for m in samples),
+			rows=sum(m.rows for m in samples),
+			bytes=sum(m.bytes for m in samples),
+			retries=sum(m.retries for m in samples),
+			throttle_wait=sum(m.throttle_wait for m in samples),
+			decode_time=sum(m.decode_time for m in samples),
+			elapsed={p: percentile(elapsed, p) for p in self.percentiles},
+			page_latency={p: percentile(latencies, p) for p in self.percentiles},
+		)
+
+	def report(self) -> str:
+		"""Format the summary of each fingerprint as a markdown table, slowest first"""
+		ps = self.percentiles
+		header = ["query", "queries", "errors", "pages", "rows", "kB", "retries", "throttle (ms)", "decode (ms)"]
+		header += [f"p{p} (ms)" for p in ps] + [f"page p{p} (ms)" for p in ps]
+		rows = [header, ["---"] * len(header)]
+		for key, s in sorted(self.summary().items(), key=lambda kv: kv[1].elapsed[ps[-1]], reverse=True):
+			row = [key.replace("|", "\\|"), str(s.queries), str(s.errors), str(s.pages), str(s.rows), f"{s.bytes / 1000:.1f}", str(s.retries)]
+			row += [f"{s.throttle_wait * 1000:.1f}", f"{s.decode_time * 1000:.1f}"]
+			row += [f"{s.elapsed[p] * 1000:.1f}" for p in ps] + [f"{s.page_latency[p] * 1000:.1f}" for p in ps]
+			rows.append(row)
+		return "\n".join("| " + " | ".join(row) + " |" for row in rows)
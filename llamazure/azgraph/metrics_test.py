@@ -0,0 +1,173 @@
+"""Tests for measuring queries"""
+
+from typing import Generator, List, cast
+
+import pytest
+
+from llamazure.azgraph.azgraph import Graph, RetryPolicy
+from llamazure.azgraph.cache import MemoryCache
+from llamazure.azgraph.conftest import Clock, FakeARG, Token
+from llamazure.azgraph.metrics import Aggregator, QueryMetrics, fingerprint, percentile
+from llamazure.azgraph.models import AzureGraphException, Req, ResErr
+from llamazure.azgraph.throttle import Throttle
+
+subscriptions = ("00000000-0000-0000-0000-000000000000",)
+
+
+class TestFingerprint:
+	def test_literals(self):
+		assert fingerprint("Resources | where name == 'sa0' | limit 5") == "Resources | where name == ? | limit ?"
+
+	def test_lists(self):
+		assert fingerprint("Resources | where id in~ ('/a', '/b')") == fingerprint("Resources | where id in~ ('/c')") == "Resources | where id in~ (?)"
+
+	def test_datetime(self):
+		assert fingerprint("resourcechanges | where changeTime > datetime(2024-01-01T00:00:00.000000Z)") == "resourcechanges | where changeTime > ?"
+
+	def test_whitespace(self):
+		assert fingerprint("Resources\n\t| project   id") == "Resources | project id"
+
+	def test_names_with_digits(self):
+		assert fingerprint("Resources | project sa0") == "Resources | project sa0"
+
+
+def test_percentile():
+	values = [float(i) for i in range(1, 101)]
+	assert [percentile(values, p) for p in (50, 95, 99)] == [50.0, 95.0, 99.0]
+	assert percentile([3.0], 99) == 3.0
+	assert percentile([], 50) == 0.0
+
+
+class TestAggregator:
+	def sample(self, query: str, elapsed: float, error=None) -> QueryMetrics:
+		m = QueryMetrics(query, page_latencies=[elapsed], pages=1, rows=10, bytes=1000, error=error)
+		m.elapsed = elapsed
+		return m
+
+	def test_summary(self):
+		agg = Aggregator()
+		for i in range(1, 101):
+			agg(self.sample(f"Resources | where name == 'sa{i}'", i / 1000))
+		agg(self.sample("ResourceContainers", 1.0, error="BadRequest"))
+
+		summary = agg.summary()
+
+		s = summary["Resources | where name == ?"]
+		assert (s.queries, s.pages, s.rows, s.bytes, s.errors) == (100, 100, 1000, 100_000, 0)
+		assert s.elapsed == {50: 0.05, 95: 0.095, 99: 0.099}
+		assert summary["ResourceContainers"].errors == 1
+
+	def test_keeps_latest_samples(self):
+		agg = Aggregator(max_samples=3)
+		for i in range(10):
+			agg(self.sample("Resources", i))
+		assert agg.summary()["Resources"].elapsed[50] == 8
+
+	def test_report(self):
+		agg = Aggregator()
+		agg(self.sample("Resources | limit 5", 0.01))
+		agg(self.sample("ResourceContainers", 0.5))
+
+		lines = agg.report().splitlines()
+
+		assert "p50 (ms)" in lines[0] and "p99 (ms)" in lines[0]
+		assert lines[2].startswith("| ResourceContainers |")  # slowest first
+		assert lines[3].startswith("| Resources \\| limit ? |")
+
+
+class TestGraph:
+	def graph(self, fake_arg: FakeARG, **kwargs) -> "tuple[Graph, List[QueryMetrics]]":
+		reported: List[QueryMetrics] = []
+		g = Graph(Token(), subscriptions, url=fake_arg.url, hooks=[reported.append], **kwargs)
+		return g, reported
+
+	@pytest.mark.parametrize("pipeline", [False, True])
+	def test_query(self, fake_arg: FakeARG, pipeline: bool):
+		fake_arg.rows = list(range(25))
+		fake_arg.page_size = 10
+		g, reported = self.graph(fake_arg, pipeline=pipeline)
+
+		g.q("Resources")
+
+		(m,) = reported
+		assert (m.pages, m.rows, m.retries, m.error) == (3, 25, 0, None)
+		assert len(m.page_latencies) == 3
+		assert m.bytes > 0
+		assert m.decode_time > 0
+		assert m.elapsed >= sum(m.page_latencies) if not pipeline else m.elapsed > 0
+
+	def test_retries(self, fake_arg: FakeARG):
+		fake_arg.rows = [0]
+		fake_arg.fail_next = 2
+		g, reported = self.graph(fake_arg, retry_policy=RetryPolicy(retries=2))
+
+		g.q("Resources")
+
+		(m,) = reported
+		assert (m.pages, m.retries, len(m.page_latencies), m.error) == (3, 2, 3, None)
+
+	def test_error(self, fake_arg: FakeARG):
+		fake_arg.fail_next = 1
+		g, reported = self.graph(fake_arg)
+
+		with pytest.raises(AzureGraphException):
+			g.q("Resources")
+
+		assert reported[0].error == "BadThings"
+
+	def test_throttle_wait(self, fake_arg: FakeARG):
+		fake_arg.rows = [0]
+		clock = Clock()
+		throttle = Throttle(clock, clock.sleep)
+		throttle.update(429, {"Retry-After": "3"})
+		g, reported = self.graph(fake_arg, throttle=throttle)
+
+		g.q("Resources")
+
+		assert reported[0].throttle_wait == 3.0
+
+	def test_q_iter(self, fake_arg: FakeARG):
+		fake_arg.rows = list(range(25))
+		fake_arg.page_size = 10
+		g, reported = self.graph(fake_arg)
+
+		rows = cast(Generator, g.q_iter("Resources"))
+		next(rows)
+		assert not reported  # reported when the stream finishes
+		rows.close()
+
+		(m,) = reported
+		assert (m.pages, m.rows, m.error) == (1, 10, None)
+
+	def test_cached(self, fake_arg: FakeARG):
+		fake_arg.rows = [0]
+		g, reported = self.graph(fake_arg, cache=MemoryCache())
+
+		g.q("Resources")
+		g.q("Resources")
+
+		assert [(m.cached, m.pages) for m in reported] == [(False, 1), (True, 0)]
+
+	def test_aggregator(self, fake_arg: FakeARG):
+		fake_arg.rows = [0]
+		agg = Aggregator()
+		g = Graph(Token(), subscriptions, url=fake_arg.url, hooks=[agg])
+
+		for name in ("sa0", "sa1"):
+			g.q(f"Resources | where name == '{name}'")
+
+		assert agg.summary()["Resources | where name == ?"].queries == 2
+
+	def test_no_hooks(self, fake_arg: FakeARG):
+		"""Test that nothing is measured without hooks"""
+		g = Graph(Token(), subscriptions, url=fake_arg.url)
+		assert g._metrics(Req("Resources", subscriptions)) is None
+
+	def test_query_single(self, fake_arg: FakeARG):
+		fake_arg.rows = [0]
+		g, reported = self.graph(fake_arg)
+
+		res = g.query_single(Req("Resources", subscriptions))
+
+		assert not isinstance(res, ResErr)
+		assert reported[0].pages == 1
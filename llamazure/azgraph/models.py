@@ -3,8 +3,9 @@
 from __future__ import annotations
 
 import dataclasses
+import itertools
 from dataclasses import dataclass, field
-from typing import Any, Dict, Optional, Tuple, TypedDict, Union
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, TypedDict, Union
 
 
 class AzureGraphException(RuntimeError):
@@ -26,6 +27,10 @@ class Req:
 	managementGroupId: Optional[str] = None
 	options: Dict = field(default_factory=dict)
 
+	bypass_cache: bool = field(
+		default=False, metadata={"local": True}
+	)  # query Azure even if the result is cached. The fresh result is still cached. Local fields are not sent to Azure
+
 
 @dataclass(frozen=True)
 class Res:
@@ -50,6 +55,82 @@ class Res:
 		return self.data
 
 
+@dataclass(frozen=True)
+class Column:
+	"""A column of a Table"""
+
+	name: str
+	type: str
+
+
+@dataclass(frozen=True)
+class Table:
+	"""
+	The data of a result in the table format, stored as a list of values for each column.
+
+	Request this format with `options={"resultFormat": "table"}`. The names of columns are sent once instead of in every row,
+	which makes results with many columns smaller and faster to decode.
+	Rows are only converted to dicts when you iterate over the table or index it.
+	"""
+
+	columns: Tuple[Column, ...]
+	values: Tuple[List[Any], ...]  # the values of each column, in the order of `columns`
+
+	@classmethod
+	def from_json(cls, o: Dict) -> Table:
+		"""Decode from the table format of the Azure Resource Graph, which has a list of columns and a list of rows"""
+		columns = tuple(Column(c["name"], c["type"]) for c in o["columns"])
+		rows = o["rows"]
+		if rows:
+			values = tuple(map(list, zip(*rows)))
+		else:
+			values = tuple([] for _ in columns)
+		return cls(columns, values)
+
+	def to_json(self) -> Dict:
+		"""Encode into the table format of the Azure Resource Graph"""
+		return {"columns": [{"name": c.name, "type": c.type} for c in self.columns], "rows": [list(row) for row in zip(*self.values)]}
+
+	@classmethod
+	def concat(cls, tables: Sequence[Table]) -> Table:
+		"""Concatenate the rows of tables with the same columns"""
+		first = tables[0]
+		for table in tables[1:]:
+			if table.names != first.names:
+				raise ValueError(f"cannot concatenate tables with different columns {first.names} and {table.names}")
+		values = tuple(list(itertools.chain.from_iterable(table.values[i] for table in tables)) for i in range(len(first.columns)))
+		return cls(first.columns, values)
+
+	@property
+	def names(self) -> Tuple[str, ...]:
+		"""The names of the columns"""
+		return tuple(c.name for c in self.columns)
+
+	def column(self, name: str) -> List[Any]:
+		"""The values of a column"""
+		return self.values[self.names.index(name)]
+
+	def to_dicts(self) -> List[Dict[str, Any]]:
+		"""Convert into a list of rows, as returned by the default format"""
+		return list(self)
+
+	def __len__(self) -> int:
+		return len(self.values[0]) if self.values else 0
+
+	def __iter__(self) -> Iterator[Dict[str, Any]]:
+		names = self.names
+		for row in zip(*self.values):
+			yield dict(zip(names, row))
+
+	def __getitem__(self, i: int) -> Dict[str, Any]:
+		return {c.name: values[i] for c, values in zip(self.columns, self.values)}
+
+	def __add__(self, other):
+		if not isinstance(other, Table):
+			raise TypeError(type(other))
+		return Table.concat([self, other])
+
+
 @dataclass(frozen=True)
 class ResErr:
 	"""Azure Resource Graph error response"""
@@ -0,0 +1,65 @@
+"""Share one Azure Resource Graph query between concurrent callers making the same request"""
+
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class FlightStats:
+	"""Metrics for coalescing calls"""
+
+	flights: int = 0  # calls which were made
+	shared: int = 0  # calls which waited for a call in flight instead of being made
+
+	@property
+	def shared_rate(self) -> float:
+		"""The fraction of calls which were shared"""
+		calls = self.flights + self.shared
+		return self.shared / calls if calls else 0.0
+
+
+class SingleFlight:
+	"""
+	Coalesce concurrent calls with the same key, so that only one is made and all callers receive its result or its exception.
+	This only covers calls which overlap. A call which starts after the previous one finished is made again, so use a cache to reuse results.
+	A SingleFlight is thread-safe. Callers share the result object, so don't modify it.
+	"""
+
+	def __init__(self):
+		self.stats = FlightStats()
+		self._lock = threading.Lock()
+		self._flights: Dict[str, Future] = {}
+
+	def do(self, key: str, f: Callable[[], T]) -> T:
+		"""Call `f`, or wait for the call in flight with the same key"""
+		with self._lock:
+			flight = self._flights.get(key)
+			leader = flight is None
+			if flight is None:
+				flight = self._flights[key] = Future()
+				self.stats.flights += 1
+			else:
+				self.stats.shared += 1
+		if not leader:
+			return flight.result()
+
+		try:
+			res = f()
+		except BaseException as e:
+			self._land(key)
+			flight.set_exception(e)
+			raise
+		self._land(key)
+		flight.set_result(res)
+		return res
+
+	def _land(self, key: str):
+		"""Finish a flight, so that later calls are made again"""
+		with self._lock:
+			del self._flights[key]
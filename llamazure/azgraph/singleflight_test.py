@@ -0,0 +1,74 @@
+"""Tests for coalescing concurrent calls"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from llamazure.azgraph.singleflight import SingleFlight
+
+
+def gated(release: threading.Event, calls: list, value):
+	"""A call which doesn't finish until it is released"""
+
+	def f():
+		calls.append(value)
+		release.wait(5)
+		return value
+
+	return f
+
+
+def wait_for_waiters(flight: SingleFlight, n: int):
+	"""Wait until n calls are waiting for flights"""
+	for _ in range(500):
+		if flight.stats.shared >= n:
+			return
+		threading.Event().wait(0.01)
+	raise TimeoutError
+
+
+class TestSingleFlight:
+	def test_concurrent_calls_are_shared(self):
+		flight = SingleFlight()
+		release, calls = threading.Event(), []
+
+		with ThreadPoolExecutor(5) as pool:
+			futures = [pool.submit(flight.do, "k", gated(release, calls, i)) for i in range(5)]
+			wait_for_waiters(flight, 4)
+			release.set()
+			results = [f.result() for f in futures]
+
+		assert calls == [0]
+		assert results == [0] * 5
+		assert (flight.stats.flights, flight.stats.shared) == (1, 4)
+
+	def test_different_keys_are_not_shared(self):
+		flight = SingleFlight()
+		assert [flight.do(k, lambda k=k: k) for k in "abc"] == ["a", "b", "c"]
+		assert flight.stats.shared == 0
+
+	def test_later_calls_are_made_again(self):
+		flight = SingleFlight()
+		calls = []
+		for i in range(3):
+			flight.do("k", lambda i=i: calls.append(i))
+		assert calls == [0, 1, 2]
+
+	def test_exceptions_are_shared(self):
+		flight = SingleFlight()
+		release = threading.Event()
+
+		def fail():
+			release.wait(5)
+			raise ValueError("failed")
+
+		with ThreadPoolExecutor(3) as pool:
+			futures = [pool.submit(flight.do, "k", fail) for _ in range(3)]
+			wait_for_waiters(flight, 2)
+			release.set()
+			for f in futures:
+				with pytest.raises(ValueError):
+					f.result()
+
+		assert flight.do("k", lambda: "recovered") == "recovered"
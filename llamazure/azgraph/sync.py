@@ -0,0 +1,132 @@
+"""Keep an inventory of resources up to date with the changes recorded by the Azure Resource Graph"""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+
+from llamazure.azgraph.azgraph import Graph
+from llamazure.azgraph.kql import kql_datetime
+
+CHANGE_CREATE = "Create"
+CHANGE_UPDATE = "Update"
+CHANGE_DELETE = "Delete"
+
+
+def changes_query(since: datetime) -> str:
+	"""Query the latest change to each resource since a time"""
+	return (
+		"resourcechanges"
+		" | extend changeTime = todatetime(properties.changeAttributes.timestamp),"
+		" targetResourceId = tolower(tostring(properties.targetResourceId)),"
+		" changeType = tostring(properties.changeType)"
+		f" | where changeTime > {kql_datetime(since)}"
+		" | summarize arg_max(changeTime, changeType) by targetResourceId"
+		" | project targetResourceId, changeType, changeTime"
+	)
+
+
+@dataclass
+class SyncPolicy:
+	"""Parameters for syncing an inventory"""
+
+	overlap: timedelta = timedelta(minutes=5)  # also read changes from this long before the watermark, since changes are recorded late. Applying a change twice is harmless
+	max_age: timedelta = timedelta(days=6)  # refresh everything if the last sync is older than this, since `resourcechanges` only keeps changes for 7 days
+
+
+@dataclass
+class Inventory:
+	"""
+	Rows of resources by their lowercase ID, and the time they are up to date with.
+	Save and load it to sync incrementally between runs.
+	"""
+
+	resources: Dict[str, Any] = field(default_factory=dict)
+	watermark: Optional[datetime] = None
+
+	def save(self, path: str):
+		"""Save to a JSON file. The file is replaced atomically, so a failed save keeps the previous inventory"""
+		raw = {"watermark": self.watermark.isoformat() if self.watermark else None, "resources": self.resources}
+		fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+		try:
+			with os.fdopen(fd, mode="w", encoding="utf-8") as f:
+				json.dump(raw, f)
+			os.replace(tmp, path)
+		except BaseException:
+			os.remove(tmp)
+			raise
+
+	@classmethod
+	def load(cls, path: str) -> Inventory:
+		"""Load from a JSON file. A missing file is an empty inventory, which will be fully refreshed"""
+		try:
+			with open(path, mode="r", encoding="utf-8") as f:
+				raw = json.load(f)
+		except FileNotFoundError:
+			return cls()
+		watermark = datetime.fromisoformat(raw["watermark"]) if raw["watermark"] else None
+		return cls(raw["resources"], watermark)
+
+
+@dataclass
+class SyncResult:
+	"""What a sync changed"""
+
+	full: bool  # whether everything was refreshed
+	upserted: int = 0
+	deleted: int = 0
+
+
+class Sync:
+	"""
+	Sync an inventory of the rows of a query.
+
+	The first sync refreshes everything. Later syncs query `resourcechanges` for the resources which were created, updated, or deleted since the watermark,
+	and only query those resources again. The query must return the `id` column, and should start from a table of resources, like `Resources`.
+
+	>>> sync = Sync(graph, "Resources | project id, name, type, location, tags")
+	>>> inventory = Inventory.load("inventory.json")
+	>>> sync.sync(inventory)
+	>>> inventory.save("inventory.json")
+	"""
+
+	def __init__(self, graph: Graph, query: str = "Resources", policy: SyncPolicy = SyncPolicy(), clock: Callable[[], datetime] = lambda: datetime.now(timezone.utc)):
+		self.graph = graph
+		self.query = query
+		self.policy = policy
+		self.clock = clock
+
+	def sync(self, inventory: Inventory) -> SyncResult:
+		"""Sync incrementally, or refresh everything if the inventory has never been synced or is too old"""
+		if inventory.watermark is None or self.clock() - inventory.watermark > self.policy.max_age:
+			return self.refresh(inventory)
+		return self.incremental(inventory)
+
+	def refresh(self, inventory: Inventory) -> SyncResult:
+		"""Replace the inventory with the current rows of the query"""
+		started = self.clock()  # changes made while we query are read again by the next sync
+		resources = {row["id"].lower(): row for row in self.graph.q_iter(self.query)}
+		deleted = len(inventory.resources.keys() - resources.keys())
+		inventory.resources, inventory.watermark = resources, started
+		return SyncResult(full=True, upserted=len(resources), deleted=deleted)
+
+	def incremental(self, inventory: Inventory) -> SyncResult:
+		"""Apply the changes since the watermark of the inventory"""
+		if inventory.watermark is None:
+			raise ValueError("the inventory has never been synced, so it must be refreshed")
+		started = self.clock()
+		changes = {row["targetResourceId"].lower(): row["changeType"] for row in self.graph.q_iter(changes_query(inventory.watermark - self.policy.overlap))}
+
+		changed = [rid for rid, change in changes.items() if change != CHANGE_DELETE]
+		current = {rid: rows[0] for rid, rows in self.graph.lookup(changed, self.query).items() if rows}
+		# resources which were changed but aren't in the query any more, for example because they were deleted later or no longer match a filter
+		deleted = [rid for rid in changes if rid not in current]
+
+		inventory.resources.update(current)
+		removed = sum(inventory.resources.pop(rid, None) is not None for rid in deleted)
+		inventory.watermark = started
+		return SyncResult(full=False, upserted=len(current), deleted=removed)
@@ -0,0 +1,144 @@
+"""Tests for syncing an inventory from resource changes"""
+
+# pylint: disable=redefined-outer-name
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Tuple
+
+import pytest
+
+from llamazure.azgraph.azgraph import Graph, LookupPolicy
+from llamazure.azgraph.conftest import FakeARG, FakeTables, Token, serve
+from llamazure.azgraph.sync import Inventory, Sync, SyncPolicy
+
+rg = "/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/rg0/providers/Microsoft.Storage/storageAccounts"
+t0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def resource(name: str, **kwargs) -> dict:
+	return {"id": f"{rg}/{name}", "name": name, **kwargs}
+
+
+def change(name: str, change_type: str, at: datetime) -> dict:
+	return {"targetResourceId": f"{rg}/{name}".lower(), "changeType": change_type, "changeTime": at.strftime("%Y-%m-%dT%H:%M:%S.%fZ")}
+
+
+class Clock:
+	def __init__(self):
+		self.now = t0
+
+	def __call__(self) -> datetime:
+		return self.now
+
+
+@pytest.fixture
+def tables() -> Iterator[Tuple[FakeTables, FakeARG]]:
+	tables = FakeTables({"resources": [resource(f"sa{i}") for i in range(5)], "resourcechanges": []})
+	fake = FakeARG(query_rows=tables, page_size=2)
+	server = serve(fake)
+	yield tables, fake
+	server.shutdown()
+	server.server_close()
+
+
+def make_sync(fake: FakeARG, clock: Clock, lookup_policy: LookupPolicy = LookupPolicy(), **kwargs) -> Sync:
+	graph = Graph(Token(), ("00000000-0000-0000-0000-000000000000",), url=fake.url, lookup_policy=lookup_policy)
+	return Sync(graph, "Resources", SyncPolicy(**kwargs), clock)
+
+
+class TestSync:
+	def test_first_sync_refreshes(self, tables):
+		_, fake = tables
+		inventory = Inventory()
+
+		res = make_sync(fake, Clock()).sync(inventory)
+
+		assert res.full
+		assert len(inventory.resources) == 5
+		assert inventory.watermark == t0
+
+	def test_incremental(self, tables):
+		t, fake = tables
+		clock = Clock()
+		sync = make_sync(fake, clock)
+		inventory = Inventory()
+		sync.sync(inventory)
+
+		clock.now = t0 + timedelta(hours=1)
+		t.tables["resources"] = [resource("sa0", location="canadacentral")] + [resource(f"sa{i}") for i in range(2, 5)] + [resource("sa5")]
+		t.tables["resourcechanges"] = [
+			change("sa0", "Update", t0 + timedelta(minutes=10)),
+			change("sa1", "Delete", t0 + timedelta(minutes=20)),
+			change("sa5", "Create", t0 + timedelta(minutes=30)),
+		]
+		t.queries.clear()
+		res = sync.sync(inventory)
+
+		assert not res.full
+		assert (res.upserted, res.deleted) == (2, 1)
+		assert inventory.resources[f"{rg}/sa0".lower()]["location"] == "canadacentral"
+		assert f"{rg}/sa1".lower() not in inventory.resources
+		assert f"{rg}/sa5".lower() in inventory.resources
+		assert inventory.watermark == clock.now
+		assert len(set(t.queries)) == 2  # only the changes and the changed resources are queried
+
+	def test_old_changes_are_skipped(self, tables):
+		t, fake = tables
+		clock = Clock()
+		sync = make_sync(fake, clock, overlap=timedelta(minutes=5))
+		inventory = Inventory()
+		sync.sync(inventory)
+
+		t.tables["resources"][0]["location"] = "changed"
+		t.tables["resourcechanges"] = [change("sa0", "Update", t0 - timedelta(hours=1))]
+		clock.now = t0 + timedelta(hours=1)
+		res = sync.sync(inventory)
+
+		assert res.upserted == 0
+
+	def test_too_old_refreshes(self, tables):
+		_, fake = tables
+		clock = Clock()
+		sync = make_sync(fake, clock, max_age=timedelta(days=6))
+		inventory = Inventory()
+		sync.sync(inventory)
+
+		clock.now = t0 + timedelta(days=7)
+		assert sync.sync(inventory).full
+
+	def test_changes_are_batched(self, tables):
+		t, fake = tables
+		clock = Clock()
+		sync = make_sync(fake, clock, LookupPolicy(max_keys=2))
+		inventory = Inventory()
+		sync.sync(inventory)
+
+		t.tables["resourcechanges"] = [change(f"sa{i}", "Update", t0 + timedelta(minutes=1)) for i in range(5)]
+		t.queries.clear()
+		clock.now = t0 + timedelta(hours=1)
+		res = sync.sync(inventory)
+
+		assert res.upserted == 5
+		assert len(set(t.queries)) == 1 + 3
+
+	def test_persisted(self, tables, tmp_path):
+		_, fake = tables
+		path = str(tmp_path / "inventory.json")
+		sync = make_sync(fake, Clock())
+
+		inventory = Inventory.load(path)
+		sync.sync(inventory)
+		inventory.save(path)
+
+		assert Inventory.load(path) == inventory
+
+	def test_failed_save(self, tmp_path):
+		"""Test that a failed save keeps the previous inventory and doesn't leave a temporary file"""
+		path = str(tmp_path / "inventory.json")
+		Inventory({"0": {}}).save(path)
+
+		with pytest.raises(TypeError):
+			Inventory({"0": object()}).save(path)
+
+		assert Inventory.load(path) == Inventory({"0": {}})
+		assert os.listdir(tmp_path) == ["inventory.json"]
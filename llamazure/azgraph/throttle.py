@@ -0,0 +1,131 @@
+"""Pace requests to stay within the throttling quota of the Azure Resource Graph"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Mapping, Optional
+
+QUOTA_REMAINING = "x-ms-user-quota-remaining"
+QUOTA_RESETS_AFTER = "x-ms-user-quota-resets-after"
+
+
+def parse_duration(s: str) -> float:
+	"""Parse a duration like "00:00:04", "00:00:04.250", or "1.00:00:04" with days into seconds"""
+	hours, minutes, seconds = s.split(":")
+	days, _, hours = hours.rpartition(".")
+	return int(days or 0) * 86400 + int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def parse_retry_after(s: str, now: Optional[datetime] = None) -> Optional[float]:
+	"""Parse a Retry-After header, which is either seconds or an HTTP-date, into seconds. Returns None if it can't be parsed"""
+	try:
+		return max(float(s), 0.0)
+	except ValueError:
+		pass
+	try:
+		when = parsedate_to_datetime(s)
+	except (TypeError, ValueError):
+		return None
+	if when.tzinfo is None:  # "-0000" means UTC
+		when = when.replace(tzinfo=timezone.utc)
+	return max((when - (now or datetime.now(timezone.utc))).total_seconds(), 0.0)
+
+
+class Throttle:
+	"""
+	A token bucket which follows the quota the Azure Resource Graph reports in its response headers.
+
+	Requests spend the remaining quota as fast as they like, and then wait for the quota to reset.
+	After a 429, all requests wait until the time in the Retry-After header.
+	A Throttle is thread-safe, so share one between all clients with the same identity, since the quota is for each user.
+	Until the first response arrives, only one request is made, since we don't know the quota yet. If responses don't have quota headers, requests are not throttled.
+
+	Every `acquire` must be followed by one `update`, with the response or with status 0 if the request failed.
+	"""
+
+	def __init__(self, clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+		self.clock = clock
+		self.sleep = sleep
+		self._lock = threading.Lock()
+
+		self.remaining: Optional[int] = None  # requests we can make before the quota resets. None if we haven't been told
+		self.resets_at = 0.0  # when the quota resets
+		self.quota: Optional[int] = None  # the most remaining requests we've seen, which is the size of the quota
+		self.window = 0.0  # the longest time to reset we've seen, which is the length of the quota window
+		self.blocked_until = 0.0  # no requests until this time, after being throttled
+		self.in_flight = 0  # requests which have been made but not answered. The server might not have counted them yet
+		self.waited = 0.0  # total time spent waiting, for metrics
+		self.probed = False  # whether a response has arrived, so we know whether there is a quota
+		self.poll = 0.01  # how long to wait for the first response
+
+	def _try_acquire(self) -> float:
+		"""Take a token if one is available. Returns 0 if it was taken, or the time to wait before trying again"""
+		with self._lock:
+			now = self.clock()
+			if now < self.blocked_until:
+				return self.blocked_until - now
+			if not self.probed and self.in_flight > 0:
+				return self.poll
+			if self.remaining is not None and self.remaining <= 0 and now >= self.resets_at:
+				# the quota has reset. The responses in the new window will tell us exactly how much we have
+				self.remaining = self.quota
+				self.resets_at = now + self.window
+			if self.remaining is None or self.remaining > 0:
+				if self.remaining is not None:
+					self.remaining -= 1
+				self.in_flight += 1
+				return 0.0
+			return max(self.resets_at - now, 0.0)
+
+	def acquire(self) -> float:
+		"""Wait until a request can be made. Returns the time waited"""
+		waited = 0.0
+		while (wait := self._try_acquire()) > 0:
+			with self._lock:
+				self.waited += wait
+			waited += wait
+			self.sleep(wait)
+		return waited
+
+	async def acquire_async(self) -> float:
+		"""Wait until a request can be made, without blocking the event loop. Returns the time waited"""
+		waited = 0.0
+		while (wait := self._try_acquire()) > 0:
+			with self._lock:
+				self.waited += wait
+			waited += wait
+			await asyncio.sleep(wait)
+		return waited
+
+	def update(self, status: int, headers: Mapping[str, str]):
+		"""Update the quota from the headers of a response"""
+		remaining = headers.get(QUOTA_REMAINING)
+		resets_after = headers.get(QUOTA_RESETS_AFTER)
+		retry_after = headers.get("Retry-After")
+		with self._lock:
+			now = self.clock()
+			self.in_flight = max(self.in_flight - 1, 0)
+			self.probed = self.probed or status != 0
+			if remaining is not None and resets_after is not None:
+				server_remaining = int(remaining)
+				self.quota = max(self.quota or 0, server_remaining + 1)  # the server has counted this request
+				# the server hasn't counted the requests in flight, but we have
+				known = server_remaining - self.in_flight
+				if self.remaining is None or now >= self.resets_at:
+					self.remaining = known  # a new window, so the server knows best
+				else:
+					self.remaining = min(self.remaining, known)  # responses arrive out of order, so trust the lowest
+				self.window = max(self.window, parse_duration(resets_after))
+				self.resets_at = now + parse_duration(resets_after)
+
+			if status == 429:
+				wait = parse_retry_after(retry_after) if retry_after is not None else None
+				if wait is None:
+					wait = parse_duration(resets_after) if resets_after is not None else 1.0
+				self.blocked_until = max(self.blocked_until, now + wait)
+				self.remaining = 0
+				self.resets_at = max(self.resets_at, now + wait)
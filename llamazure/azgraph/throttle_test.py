@@ -0,0 +1,253 @@
+"""Tests for pacing requests to the quota"""
+
+# pylint: disable=protected-access
+import asyncio
+import time
+from datetime import datetime, timezone
+from unittest.mock import Mock
+
+import pytest
+from urllib3 import HTTPResponse
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError
+
+from llamazure.azgraph.aio import AsyncGraph
+from llamazure.azgraph.azgraph import Graph, RetryPolicy, ShardPolicy, ThrottledRetry
+from llamazure.azgraph.conftest import Clock, FakeARG, Token
+from llamazure.azgraph.models import Req, Res, ResErr
+from llamazure.azgraph.throttle import QUOTA_REMAINING, QUOTA_RESETS_AFTER, Throttle, parse_duration, parse_retry_after
+
+
+def quota(remaining: int, resets_after: str = "00:00:05") -> dict:
+	return {QUOTA_REMAINING: str(remaining), QUOTA_RESETS_AFTER: resets_after}
+
+
+def test_parse_duration():
+	assert parse_duration("00:00:04") == 4
+	assert parse_duration("01:02:03.5") == 3723.5
+	assert parse_duration("1.00:00:05") == 86405
+
+
+def test_parse_retry_after():
+	now = datetime(2026, 10, 21, 7, 28, 0, tzinfo=timezone.utc)
+	assert parse_retry_after("3") == 3
+	assert parse_retry_after("Wed, 21 Oct 2026 07:28:05 GMT", now) == 5
+	assert parse_retry_after("Wed, 21 Oct 2026 07:27:00 GMT", now) == 0  # in the past
+	assert parse_retry_after("soon") is None
+
+
+class TestThrottle:
+	def throttle(self):
+		clock = Clock()
+		return Throttle(clock, clock.sleep), clock
+
+	def test_unthrottled_without_headers(self):
+		t, clock = self.throttle()
+		for _ in range(100):
+			t.acquire()
+			t.update(200, {})
+		assert clock.now == 1000.0
+
+	def test_spends_quota_then_waits_for_reset(self):
+		t, clock = self.throttle()
+		t.acquire()
+		t.update(200, quota(2))
+
+		t.acquire()
+		t.acquire()
+		assert clock.now == 1000.0
+		t.acquire()
+		assert clock.now == 1005.0
+
+	def test_counts_requests_in_flight(self):
+		"""Test that requests which the server hasn't answered yet are not spent twice"""
+		t, clock = self.throttle()
+		t.acquire()
+		t.update(200, quota(5))
+		t.acquire()
+		t.acquire()  # in flight
+		t.update(200, quota(1))
+
+		t.acquire()
+		assert clock.now == 1005.0
+
+	def test_out_of_order_responses(self):
+		"""Test that an older response with more quota doesn't give us quota we don't have"""
+		t, clock = self.throttle()
+		t.acquire()
+		t.update(200, quota(10))
+		t.acquire()
+		t.acquire()
+		t.update(200, quota(3))
+		t.update(200, quota(8))
+
+		t.acquire()
+		t.acquire()
+		assert clock.now == 1000.0
+		t.acquire()
+		assert clock.now == 1005.0
+
+	def test_probes_before_the_quota_is_known(self):
+		"""Test that only one request is made until we know whether there is a quota"""
+		t, clock = self.throttle()
+		t.acquire()
+		assert t._try_acquire() > 0
+		t.update(200, {})
+		t.acquire()
+		t.acquire()
+		assert clock.now == 1000.0
+
+	def test_window_resets(self):
+		t, clock = self.throttle()
+		t.acquire()
+		t.update(200, quota(1, "00:00:01"))
+		t.acquire()
+
+		t.acquire()
+		t.acquire()
+		assert clock.now == 1001.0
+		t.acquire()  # the quota is only refilled once for each window
+		assert clock.now == 1002.0
+
+	def test_429_waits_for_retry_after(self):
+		t, clock = self.throttle()
+		t.acquire()
+		t.update(429, {"Retry-After": "3"})
+
+		t.acquire()
+		assert clock.now == 1003.0
+
+	def test_429_with_bad_retry_after(self):
+		"""Test that a Retry-After which can't be parsed falls back to the quota headers"""
+		t, clock = self.throttle()
+		t.acquire()
+		t.update(429, {"Retry-After": "soon", **quota(0, "00:00:02")})
+
+		t.acquire()
+		assert clock.now == 1002.0
+
+	def test_429_waits_for_reset(self):
+		t, clock = self.throttle()
+		t.acquire()
+		t.update(429, quota(0, "00:00:02.500"))
+
+		t.acquire()
+		assert clock.now == 1002.5
+
+	def test_failed_requests_are_not_in_flight(self):
+		t, _ = self.throttle()
+		t.acquire()
+		t.update(0, {})
+		assert t.in_flight == 0
+
+
+class TestRetryable:
+	def test_bad_query_is_not_retried(self):
+		g = Graph(None, ("00000000-0000-0000-0000-000000000000",), RetryPolicy(retries=5))
+		err = ResErr("BadRequest", "Please provide below info", ({"code": "InvalidQuery", "message": "Query is invalid"},))
+		g._exec_query = Mock(return_value=err)
+
+		assert g.query(Req("bad query", g.subscriptions)) == err
+		assert g._exec_query.call_count == 1
+
+	def test_throttled_is_retried(self):
+		err = ResErr("RateLimiting", "Too many requests", ())
+		assert RetryPolicy(retries=1).retryable(err)
+
+	def test_throttled_is_retried_without_retries(self):
+		"""Test that a throttled request is sent again after the Throttle waits, even if other errors aren't retried"""
+		g = Graph(None, ("00000000-0000-0000-0000-000000000000",))
+		ok = Res(Req("Resources", g.subscriptions), 1, 1, None, (), [0])
+		g._exec_query = Mock(side_effect=[ResErr("RateLimiting", "Too many requests", ()), ok])
+
+		assert g.query_single(Req("Resources", g.subscriptions)) == ok
+		assert g._exec_query.call_count == 2
+
+	def test_throttled_retries_are_limited(self):
+		g = Graph(None, ("00000000-0000-0000-0000-000000000000",), RetryPolicy(retries=1, throttled_retries=2))
+		err = ResErr("RateLimiting", "Too many requests", ())
+		g._exec_query = Mock(return_value=err)
+
+		assert g.query_single(Req("Resources", g.subscriptions)) == err
+		assert g._exec_query.call_count == 1 + 2 + 1  # the throttled retries and then the ordinary ones
+
+
+class TestThrottledRetry:
+	"""Test that retries made by the HTTP session go through the Throttle"""
+
+	def test_retry_updates_and_waits(self):
+		throttle = Mock()
+		retry = ThrottledRetry(throttle, total=3, status_forcelist=(503,))
+
+		new = retry.increment("POST", "/", response=HTTPResponse(status=503, headers=quota(0)))
+
+		throttle.update.assert_called_once_with(503, quota(0))
+		throttle.acquire.assert_called_once()
+		assert isinstance(new, ThrottledRetry) and new.throttle is throttle
+
+	def test_connection_error(self):
+		throttle = Mock()
+		retry = ThrottledRetry(throttle, total=3)
+
+		retry.increment("POST", "/", error=ConnectTimeoutError())
+
+		throttle.update.assert_called_once_with(0, {})
+		throttle.acquire.assert_called_once()
+
+	def test_no_retries_left(self):
+		"""Test that the last response is left for the caller to update the Throttle with"""
+		throttle = Mock()
+		retry = ThrottledRetry(throttle, total=0, status_forcelist=(503,))
+
+		with pytest.raises(MaxRetryError):
+			retry.increment("POST", "/", response=HTTPResponse(status=503))
+		throttle.update.assert_not_called()
+
+	def test_session_does_not_retry_throttled(self, fake_arg: FakeARG):
+		"""Test that 429s with Retry-After are only retried by the RetryPolicy, so they aren't retried or waited for twice"""
+		fake_arg.rows = [0]
+		fake_arg.throttle_next = 1
+		g = Graph(Token(), ("00000000-0000-0000-0000-000000000000",), RetryPolicy(retries=0, throttled_retries=0), url=fake_arg.url)
+
+		res = g.query_single(Req("Resources", g.subscriptions))
+
+		assert isinstance(res, ResErr) and res.code == "RateLimiting"
+		assert len(fake_arg.requests) == 1
+
+	def test_graph_session(self):
+		g = Graph(None, ("00000000-0000-0000-0000-000000000000",))
+		assert g.session.get_adapter("https://management.azure.com").max_retries.throttle is g.throttle
+
+
+class TestAgainstQuota:
+	"""Test that clients stay within the quota of a fake ARG"""
+
+	subscriptions = tuple(f"{i:08}-0000-0000-0000-000000000000" for i in range(12))
+
+	def test_sync(self, fake_arg: FakeARG):
+		fake_arg.rows = [0]
+		fake_arg.quota = 4
+		fake_arg.quota_window = 0.3
+		g = Graph(Token(), self.subscriptions, RetryPolicy(retries=3), shard_policy=ShardPolicy(size=1, workers=6), url=fake_arg.url)
+
+		start = time.perf_counter()
+		res = g.query(Req("Resources", self.subscriptions))
+		elapsed = time.perf_counter() - start
+
+		assert isinstance(res, Res)
+		assert res.count == 12
+		assert fake_arg.throttled == 0
+		assert elapsed < 4 * fake_arg.quota_window  # close to the ceiling of 12 requests in 3 windows
+
+	def test_async(self, fake_arg: FakeARG):
+		fake_arg.rows = [0]
+		fake_arg.quota = 4
+		fake_arg.quota_window = 0.3
+
+		async def go():
+			async with AsyncGraph(Token(), self.subscriptions, RetryPolicy(retries=3), concurrency=6, url=fake_arg.url) as g:
+				return await g.gather_queries([Req("Resources", (s,)) for s in self.subscriptions])
+
+		ress = asyncio.run(go())
+
+		assert all(isinstance(res, Res) for res in ress)
+		assert fake_arg.throttled == 0
@@ -11,7 +11,9 @@ from typing import Callable, Dict, List, Optional, Tuple, Type, TypeVar, Union,
 
 import requests
 from pydantic import BaseModel, TypeAdapter, ValidationError
+from requests.auth import AuthBase
 
+from llamazure.azauth import shared
 from llamazure.azrest.models import AzBatch, AzBatchResponse, AzBatchResponses, AzList, AzureError, AzureErrorResponse, BatchReq, Req, Ret_T
 
 l = logging.getLogger(__name__)
@@ -77,6 +79,17 @@ HEADER_RETRY_AFTER = "Retry-After"
 HEADER_RATELIMIT_RETRY_AFTER = re.compile("x-ms-ratelimit-.*-retry-after")
 
 
+class BearerAuth(AuthBase):
+	"""Authenticate each request with the current value of a token, so that a token which is refreshed is used"""
+
+	def __init__(self, token):
+		self.token = token
+
+	def __call__(self, r: requests.PreparedRequest) -> requests.PreparedRequest:
+		r.headers["Authorization"] = f"Bearer {self.token.token}"
+		return r
+
+
 class AzRest:
 	"""Access the Azure HTTP API"""
 
@@ -88,10 +101,12 @@ class AzRest:
 
 	@classmethod
 	def from_credential(cls, credential, token_scope="https://management.azure.com//.default", base_url="https://management.azure.com") -> AzRest:
-		"""Create from an Azure credential"""
-		token = credential.get_token(token_scope)
+		"""
+		Create from an Azure credential.
+		Tokens are refreshed before they expire, and shared with other clients created from the same credential or `TokenProvider`.
+		"""
 		session = requests.Session()
-		session.headers["Authorization"] = f"Bearer {token.token}"
+		session.auth = BearerAuth(shared(credential).bearer(token_scope))
 
 		return cls(session=session, base_url=base_url)
 
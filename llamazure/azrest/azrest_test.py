@@ -2,12 +2,15 @@
 
 import random
 from typing import Dict
+from unittest.mock import Mock
 
 # pylint: disable=redefined-outer-name
 import pytest
+import requests
+from azure.core.credentials import AccessToken
 from pydantic import BaseModel, ValidationError
 
-from llamazure.azrest.azrest import AzRest, RetryPolicy
+from llamazure.azrest.azrest import AzRest, BearerAuth, RetryPolicy
 from llamazure.azrest.models import AzList, AzureError, BatchReq, Req, cast_as, ensure
 
 
@@ -18,6 +21,32 @@ def azr(credential) -> AzRest:
 	return azr
 
 
+class TestAuth:
+	"""Test authenticating requests with fresh tokens"""
+
+	def test_from_credential(self):
+		credential = Mock()
+		credential.get_token.side_effect = [AccessToken("token1", 0), AccessToken("token2", 2**40)]
+		azr = AzRest.from_credential(credential)
+
+		first = azr.session.prepare_request(requests.Request("GET", "https://management.azure.com/subscriptions"))
+		second = azr.session.prepare_request(requests.Request("GET", "https://management.azure.com/subscriptions"))
+
+		assert first.headers["Authorization"] == "Bearer token1"
+		assert second.headers["Authorization"] == "Bearer token2"  # the first one had expired
+
+	def test_token_read_for_each_request(self):
+		token = Mock(token="token1")
+		session = requests.Session()
+		session.auth = BearerAuth(token)
+
+		first = session.prepare_request(requests.Request("GET", "https://example.com"))
+		token.token = "token2"
+		second = session.prepare_request(requests.Request("GET", "https://example.com"))
+
+		assert (first.headers["Authorization"], second.headers["Authorization"]) == ("Bearer token1", "Bearer token2")
+
+
 def sub_req(sub: str) -> Req:
 	return Req.get("test-batch-single", f"{sub}/resourcegroups", "2022-09-01", AzList)
 
@@ -7,7 +7,10 @@ from functools import reduce
 from typing import Any, Dict, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from llamazure.azauth import shared
 from llamazure.msgraph import codec
 from llamazure.msgraph.models import Req, Res, ResErr, ResMaybe
 
@@ -19,20 +22,56 @@ class RetryPolicy:
 	retries: int = 0  # number of times to retry. This is in addition to the initial try
 
 
+@dataclasses.dataclass
+class SessionPolicy:
+	"""
+	Parameters for the pool of HTTP connections and retries of the Microsoft Graph
+
+	Unlike the Azure Resource Graph client, this client has no Throttle to follow a quota,
+	so the session retries throttled responses (429) itself, waiting for the Retry-After header which the Microsoft Graph sends with them.
+	"""
+
+	pool_size: int = 16  # maximum number of connections kept open. Make this at least the number of threads making queries
+	keep_alive: bool = True  # reuse connections between requests
+	retries: int = 3  # number of times to retry failed connections and throttled or unavailable responses, before the RetryPolicy
+	backoff: float = 0.5  # factor for exponential backoff between retries, in seconds
+
+	def session(self) -> requests.Session:
+		"""Create a session with this policy"""
+		retry = Retry(
+			total=self.retries,
+			backoff_factor=self.backoff,
+			status_forcelist=(429, 500, 502, 503, 504),
+			allowed_methods=None,  # queries are reads, so they are safe to retry
+			raise_on_status=False,  # return the last response, to be decoded as an error
+		)
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+		session = requests.Session()
+		session.mount("https://", adapter)
+		session.mount("http://", adapter)
+		if not self.keep_alive:
+			session.headers["Connection"] = "close"
+		return session
+
+
 class Graph:
 	"""
 	Access the Microsoft Graph
 	"""
 
-	def __init__(self, token, retry_policy: RetryPolicy = RetryPolicy()):
+	def __init__(self, token, retry_policy: RetryPolicy = RetryPolicy(), session_policy: SessionPolicy = SessionPolicy()):
 		self.token = token
 		self.retry_policy = retry_policy
+		self.session = session_policy.session()
 
 	@classmethod
-	def from_credential(cls, credential) -> Graph:
-		"""Create from an Azure credential"""
-		token = credential.get_token("https://graph.microsoft.com/.default")
-		return cls(token)
+	def from_credential(cls, credential, session_policy: SessionPolicy = SessionPolicy()) -> Graph:
+		"""
+		Create from an Azure credential.
+		Tokens are refreshed before they expire, and shared with other clients created from the same credential or `TokenProvider`.
+		"""
+		token = shared(credential).bearer("https://graph.microsoft.com/.default")
+		return cls(token, session_policy=session_policy)
 
 	def q(self, q: str) -> Any:
 		"""Make a graph query"""
@@ -42,7 +81,7 @@ class Graph:
 		return res.value
 
 	def _make_http_request(self, req: Req, url: str, params: Optional[Dict] = None) -> ResMaybe:
-		raw = requests.get(
+		raw = self.session.get(
 			url,
 			headers={"Authorization": f"Bearer {self.token.token}"},
 			params=params,
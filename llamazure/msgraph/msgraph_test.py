@@ -4,8 +4,10 @@
 
 from unittest.mock import Mock
 
+from azure.core.credentials import AccessToken
+
 from llamazure.msgraph.models import Req, Res, ResErr
-from llamazure.msgraph.msgraph import Graph, RetryPolicy
+from llamazure.msgraph.msgraph import Graph, RetryPolicy, SessionPolicy
 
 
 def null_graph(retry_policy: RetryPolicy) -> Graph:
@@ -102,3 +104,51 @@ class TestPaginated:
 
 		assert isinstance(res, ResErr)
 		assert g._make_http_request.call_count == 3 + self.normal_retry_policy.retries
+
+
+class TestSession:
+	"""Test that queries share a pooled session"""
+
+	def test_policy(self):
+		session = SessionPolicy(pool_size=4, retries=2).session()
+		adapter = session.get_adapter("https://graph.microsoft.com")
+
+		assert adapter._pool_maxsize == 4
+		assert adapter.max_retries.total == 2
+
+	def test_retries_throttled(self):
+		"""Test that the session retries 429s and waits for Retry-After, since there is no Throttle"""
+		retry = SessionPolicy().session().get_adapter("https://graph.microsoft.com").max_retries
+
+		assert retry.is_retry("GET", 429, has_retry_after=True)
+		assert retry.respect_retry_after_header
+
+	def test_no_keep_alive(self):
+		assert SessionPolicy(keep_alive=False).session().headers["Connection"] == "close"
+
+	def test_pages_use_session(self):
+		g = null_graph(RetryPolicy())
+		g.session = Mock()
+		g.session.get.return_value.json.side_effect = [
+			{"@odata.nextLink": "https://graph.microsoft.com/v1.0/users?$skiptoken=0", "value": [0]},
+			{"value": [1]},
+		]
+
+		res = g.query(Req("users"))
+
+		assert isinstance(res, Res)
+		assert res.value == [0, 1]
+		assert g.session.get.call_count == 2
+
+
+class TestFromCredential:
+	def test_token_is_refreshed(self):
+		"""Test that the Graph reads the current token from a shared provider"""
+		credential = Mock()
+		credential.get_token.side_effect = [AccessToken("token1", 0), AccessToken("token2", 2**40)]
+		g = Graph.from_credential(credential)
+
+		assert g.token.token == "token1"
+		assert g.token.token == "token2"  # the first one had expired
+		assert g.token.token == "token2"
+		assert credential.get_token.call_count == 2
@@ -1,15 +1,15 @@
 """Tests for tools for working with Azure resource IDs"""
 
 from pathlib import Path
-from typing import Optional, Union
+from typing import List, Optional, Union
 from uuid import UUID
 
 import pytest
 from hypothesis import assume, given
-from hypothesis.strategies import uuids
+from hypothesis.strategies import lists, uuids
 
 from llamazure.rid.conftest import az_alnum, st_resource_any, st_resource_base, st_resource_complex, st_rg, st_subscription
-from llamazure.rid.rid import AzObj, Resource, ResourceGroup, SubResource, Subscription, get_chain, parse, parse_chain, serialise, serialise_p
+from llamazure.rid.rid import AzObj, Resource, ResourceGroup, SubResource, Subscription, get_chain, parse, parse_chain, parse_many, serialise, serialise_p
 
 
 class TestRIDParse:
@@ -154,3 +154,31 @@ class TestParseChain:
 		chain_of_parsed = get_chain(res)
 
 		assert parsed_chain == chain_of_parsed
+
+
+class TestParseMany:
+	"""Tests that parsing many resource IDs is the same as parsing each of them"""
+
+	@given(lists(st_resource_any))
+	def test_same_as_parse(self, resources: List[AzObj]):
+		rids = [serialise(r) for r in resources]
+		assert list(parse_many(rids)) == [parse(r) for r in rids]
+
+	@pytest.mark.parametrize(
+		"rid",
+		[
+			"/providers/microsoft.authorization/roledefinitions/<>",
+			"/Subscriptions/fakesub/providers/Microsoft.Authorization/locks/foo",
+			"/subscriptions/fakesub/resourcegroups/testgroup/providers/Microsoft.Storage/storageAccounts/foo/locks/bar/nets/gc",
+			"/subscriptions/mySub/resourceGroups/myRg/providers/Microsoft.Provider1/resourceType1/name1/resourceType2/name2/providers/Microsoft.Provider3/resourceType3/name3",
+			"/subscriptions/s0/resourcegroups/rg0/providers/p/t",
+		],
+	)
+	def test_same_as_parse_odd(self, rid: str):
+		assert list(parse_many([rid])) == [parse(rid)]
+
+	def test_parents_are_shared(self):
+		rg = "/subscriptions/s0/resourceGroups/rg0/providers/Microsoft.Network/virtualNetworks/v0"
+		a, b = parse_many([f"{rg}/subnets/sn0", f"{rg}/subnets/sn1"])
+		assert isinstance(a, SubResource) and isinstance(b, SubResource)
+		assert a.parent is b.parent
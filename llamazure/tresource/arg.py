@@ -0,0 +1,73 @@
+"""Load the results of Azure Resource Graph queries into a Tresource"""
+
+from __future__ import annotations
+
+import itertools
+from typing import Any, Callable, Iterable, Iterator, List, Mapping
+
+from llamazure.rid import mp, rid
+from llamazure.tresource.itresource import ITresourceData
+
+ARGRow = Mapping[str, Any]
+Projection = Callable[[ARGRow], Any]
+Parser = Callable[[Iterable[str]], Iterable[Any]]
+
+
+def whole_row(row: ARGRow) -> ARGRow:
+	"""Use the whole row as the data of a node"""
+	return row
+
+
+def select(*columns: str) -> Projection:
+	"""Use some columns of a row as the data of a node"""
+	return lambda row: {column: row.get(column) for column in columns}
+
+
+def parse_mp(rids: Iterable[str]) -> Iterator[mp.AzObj]:
+	"""Parse resource IDs for materialised-path Tresources, like `TresourceMPData`"""
+	return (mp.parse(r)[1] for r in rids)
+
+
+def chunks(rows: Iterable[ARGRow], size: int) -> Iterator[List[ARGRow]]:
+	"""Split rows into lists of at most `size` rows, taking rows as they are needed"""
+	it = iter(rows)
+	while chunk := list(itertools.islice(it, size)):
+		yield chunk
+
+
+def load(
+	tree: ITresourceData,
+	rows: Iterable[ARGRow],
+	project: Projection = whole_row,
+	parse: Parser = rid.parse_many,
+	batch_size: int = 1000,
+	id_column: str = "id",
+) -> int:
+	"""
+	Load rows of an Azure Resource Graph query into a Tresource, with the projection of each row as the data of its resource.
+	Rows are loaded in batches as they arrive, so only one batch is held in memory besides the Tresource.
+	The IDs of a batch are parsed together with `parse`, which must match the type of Tresource. Use `parse_mp` for materialised-path Tresources.
+	Returns the number of rows loaded.
+	"""
+	loaded = 0
+	for batch in chunks(rows, batch_size):
+		objs = parse([row[id_column] for row in batch])
+		tree.upsert_many(zip(objs, map(project, batch)))
+		loaded += len(batch)
+	return loaded
+
+
+def load_query(
+	tree: ITresourceData,
+	graph,
+	query: str,
+	project: Projection = whole_row,
+	parse: Parser = rid.parse_many,
+	batch_size: int = 1000,
+	id_column: str = "id",
+) -> int:
+	"""
+	Make a query with a `llamazure.azgraph` Graph and load its rows into a Tresource as its pages arrive.
+	The query must return the `id` column. Returns the number of rows loaded.
+	"""
+	return load(tree, graph.q_iter(query), project, parse, batch_size, id_column)
@@ -0,0 +1,78 @@
+"""Test loading Azure Resource Graph results into Tresources"""
+
+from typing import Iterator, List
+
+from llamazure.rid import mp, rid
+from llamazure.tresource.arg import load, load_query, parse_mp, select
+from llamazure.tresource.mp import TresourceMPData
+from llamazure.tresource.tresource import TresourceData
+
+rg = "/subscriptions/00000000-0000-0000-0000-000000000000/resourceGroups/rg0"
+rows = [{"id": f"{rg}/providers/Microsoft.Storage/storageAccounts/sa{i}", "name": f"sa{i}", "location": "canadacentral"} for i in range(5)]
+
+
+def data(tree: TresourceData[dict], resource_id: str):
+	node = tree.nearest_ancestor_with_data(rid.parse(resource_id), include_self=True)
+	assert node is not None
+	return node.data
+
+
+class FakeGraph:
+	"""Stands in for a Graph, yielding rows for a query"""
+
+	def __init__(self, rows: List[dict]):
+		self.rows = rows
+		self.queries: List[str] = []
+
+	def q_iter(self, q: str) -> Iterator[dict]:
+		self.queries.append(q)
+		yield from self.rows
+
+
+class TestLoad:
+	def test_load(self):
+		tree: TresourceData[dict] = TresourceData()
+
+		assert load(tree, rows, batch_size=2) == 5
+
+		assert {rid.serialise(r) for r in tree.res_flat()} == {r["id"].lower() for r in rows}
+		assert data(tree, rows[3]["id"]) == rows[3]
+
+	def test_projection(self):
+		tree: TresourceData[dict] = TresourceData()
+		load(tree, rows, project=select("name"))
+
+		assert data(tree, rows[0]["id"]) == {"name": "sa0"}
+
+	def test_mp(self):
+		tree: TresourceMPData[dict] = TresourceMPData()
+		load(tree, rows, parse=parse_mp)
+
+		assert tree.resources[mp.parse(rows[2]["id"])[0]].data == rows[2]
+
+	def test_bounded(self):
+		"""Test that rows are taken as they are loaded, rather than all at once"""
+		batch_size = 2
+		taken = []
+
+		def stream():
+			for row in rows:
+				taken.append(row)
+				yield row
+
+		loaded = []
+
+		def project(row):
+			loaded.append(row)
+			assert len(taken) - len(loaded) < batch_size
+			return row
+
+		load(TresourceData(), stream(), project=project, batch_size=batch_size)
+		assert len(loaded) == len(rows)
+
+	def test_load_query(self):
+		graph = FakeGraph(rows)
+		tree: TresourceData[dict] = TresourceData()
+
+		assert load_query(tree, graph, "Resources | project id, name") == 5
+		assert graph.queries == ["Resources | project id, name"]
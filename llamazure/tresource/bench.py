@@ -0,0 +1,207 @@
+"""
+Benchmark the Tresource implementations
+
+Run with `python -m llamazure.tresource.bench`
+"""
+
+from __future__ import annotations
+
+import gc
+import random
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import click
+
+from llamazure.rid import conv, rid
+from llamazure.tresource.itresource import ITresource, ITresourceData
+from llamazure.tresource.mp import TresourceMP, TresourceMPData
+from llamazure.tresource.tresource import Tresource, TresourceData
+
+
+def gen_hypothesis(n: int, seed: int = 0) -> List[rid.AzObj]:
+	"""
+	Generate resources with the hypothesis strategies used in the tests.
+	These cover odd shapes of resource, but not a realistic distribution. The same seed draws the same resources.
+	"""
+	from hypothesis import HealthCheck, Phase, given, settings
+	from hypothesis import seed as hypothesis_seed
+
+	from llamazure.rid.conftest import st_resource_any
+
+	if n <= 0:
+		return []
+	ress: List[rid.AzObj] = []
+
+	@hypothesis_seed(seed)
+	@settings(max_examples=n, database=None, phases=[Phase.generate], suppress_health_check=list(HealthCheck), deadline=None)
+	@given(st_resource_any)
+	def draw(res: rid.AzObj):
+		ress.append(res)
+
+	draw()
+	return ress[:n]
+
+
+# (type, weight, child types which can be nested under it)
+REALISTIC_TYPES: Sequence[Tuple[str, float, Sequence[str]]] = (
+	("microsoft.compute/virtualmachines", 10, ("extensions",)),
+	("microsoft.compute/disks", 12, ()),
+	("microsoft.network/networkinterfaces", 10, ()),
+	("microsoft.network/virtualnetworks", 3, ("subnets",)),
+	("microsoft.network/networksecuritygroups", 3, ("securityrules",)),
+	("microsoft.storage/storageaccounts", 5, ("blobservices",)),
+	("microsoft.keyvault/vaults", 2, ()),
+	("microsoft.web/sites", 4, ("slots",)),
+	("microsoft.insights/components", 2, ()),
+)
+
+
+def gen_realistic(n: int, seed: int = 0) -> List[rid.AzObj]:
+	"""
+	Generate resources with a roughly realistic shape.
+	There are few subscriptions, resource group sizes are skewed, a mix of resource types, and some nested resources and locks.
+	"""
+	rng = random.Random(seed)
+	n_subs = max(1, n // 2500)
+	n_rgs = max(1, n // 40)
+	subs = [f"/subscriptions/{rng.getrandbits(128):032x}" for _ in range(n_subs)]
+	rgs = [f"{rng.choice(subs)}/resourceGroups/rg-{i}" for i in range(n_rgs)]
+	types, weights, _ = zip(*REALISTIC_TYPES)
+	children = {t: c for t, _, c in REALISTIC_TYPES}
+
+	out: List[rid.AzObj] = []
+	while len(out) < n:
+		rg = rgs[min(int(rng.paretovariate(1.2)) - 1, n_rgs - 1)]  # a few resource groups have most resources
+		res_type = rng.choices(types, weights)[0]
+		provider, t = res_type.split("/")
+		res_id = f"{rg}/providers/{provider}/{t}/{t[:-1]}-{len(out)}"
+		out.append(rid.parse(res_id))
+		if children[res_type] and rng.random() < 0.3:
+			out.append(rid.parse(f"{res_id}/{rng.choice(children[res_type])}/child-{len(out)}"))
+		if rng.random() < 0.02:
+			out.append(rid.parse(f"{res_id}/providers/microsoft.authorization/locks/lock-{len(out)}"))
+	return out[:n]
+
+
+GENERATORS: Dict[str, Callable[[int, int], List[rid.AzObj]]] = {
+	"realistic": gen_realistic,
+	"hypothesis": gen_hypothesis,
+}
+
+
+@dataclass
+class Impl:
+	"""How to benchmark a Tresource implementation"""
+
+	name: str
+	clz: Callable[[], ITresource]
+	conv: Callable[[rid.AzObj], Any] = lambda obj: obj
+
+	def fill(self, tree: ITresource, objs: Sequence[Any]):
+		"""Add the objects one at a time"""
+		if isinstance(tree, ITresourceData):
+			for obj in objs:
+				tree.set_data(obj, None)
+		else:
+			for obj in objs:
+				tree.add(obj)
+
+	def fill_many(self, tree: ITresource, objs: Sequence[Any]):
+		"""Add the objects with the batch API"""
+		if isinstance(tree, ITresourceData):
+			tree.upsert_many((obj, None) for obj in objs)
+		else:
+			tree.upsert_many(objs)
+
+
+IMPLS: Dict[str, Impl] = {
+	i.name: i
+	for i in [
+		Impl("Tresource", Tresource),
+		Impl("TresourceData", TresourceData),
+		Impl("TresourceMP", TresourceMP, conv.rid2mp),
+		Impl("TresourceMPData", TresourceMPData, conv.rid2mp),
+	]
+}
+
+
+@dataclass
+class Result:
+	"""Timings for one implementation at one scale. Times are in seconds"""
+
+	impl: str
+	n: int
+	timings: Dict[str, Optional[float]] = field(default_factory=dict)
+	peak_mib: float = 0.0
+
+
+def timed(f: Callable[[], Any]) -> float:
+	"""Time a function"""
+	start = time.perf_counter()
+	f()
+	return time.perf_counter() - start
+
+
+def bench(impl: Impl, rids: Sequence[rid.AzObj]) -> Result:
+	"""Benchmark one implementation"""
+	objs = [impl.conv(obj) for obj in rids]
+	result = Result(impl.name, len(objs))
+
+	gc.collect()
+	tracemalloc.start()
+	tree = impl.clz()
+	impl.fill(tree, objs)
+	result.peak_mib = tracemalloc.get_traced_memory()[1] / 2**20
+	tracemalloc.stop()
+	del tree
+
+	tree = impl.clz()
+	result.timings["add"] = timed(lambda: impl.fill(tree, objs))
+	result.timings["add_many"] = timed(lambda: impl.fill_many(impl.clz(), objs))
+	result.timings["subs"] = timed(tree.subs)
+	result.timings["rgs_flat"] = timed(tree.rgs_flat)
+	result.timings["res_flat"] = timed(tree.res_flat)
+
+	# only some Tresources support queries
+	sub = next((impl.conv(obj.sub) for obj in rids if isinstance(obj, (rid.ResourceGroup, rid.Resource, rid.SubResource)) and obj.sub), None)
+	rg = next((impl.conv(obj.rg) for obj in rids if isinstance(obj, (rid.Resource, rid.SubResource)) and obj.rg), None)
+	where_subscription = getattr(tree, "where_subscription", None)
+	where_rg = getattr(tree, "where_rg", None)
+	result.timings["where_subscription"] = timed(lambda: where_subscription(sub)) if where_subscription and sub else None
+	result.timings["where_rg"] = timed(lambda: where_rg(rg)) if where_rg and rg else None
+	return result
+
+
+def fmt_table(results: Sequence[Result]) -> str:
+	"""Format results as a markdown table"""
+	ops = list(results[0].timings.keys()) if results else []
+	header = ["impl", "n", *(f"{op} (ms)" for op in ops), "peak (MiB)"]
+	rows = [header, ["---"] * len(header)]
+	for r in results:
+		rows.append([r.impl, str(r.n), *("-" if r.timings[op] is None else f"{r.timings[op] * 1000:.1f}" for op in ops), f"{r.peak_mib:.1f}"])  # type: ignore # checked for None
+	return "\n".join("| " + " | ".join(row) + " |" for row in rows)
+
+
+@click.command()
+@click.option("--scale", "scales", multiple=True, type=int, default=[10**3, 10**4, 10**5, 10**6], help="Number of resources. Can be given multiple times.")
+@click.option(
+	"--impl", "impls", multiple=True, type=click.Choice(list(IMPLS.keys())), default=list(IMPLS.keys()), help="Implementations to benchmark. Can be given multiple times."
+)
+@click.option("--generator", type=click.Choice(list(GENERATORS.keys())), default="realistic", help="How to generate resources.")
+@click.option("--seed", type=int, default=0)
+def main(scales, impls, generator, seed):
+	"""Benchmark Tresource implementations"""
+	results = []
+	for n in scales:
+		rids = GENERATORS[generator](n, seed)
+		for impl in impls:
+			results.append(bench(IMPLS[impl], rids))
+			click.echo(f"done impl={impl} n={n}", err=True)
+	click.echo(fmt_table(results))
+
+
+if __name__ == "__main__":
+	main()  # pylint: disable=no-value-for-parameter
@@ -0,0 +1,29 @@
+"""Smoke test for the Tresource benchmarks"""
+
+from click.testing import CliRunner
+
+from llamazure.tresource.bench import IMPLS, bench, gen_hypothesis, gen_realistic, main
+
+
+class TestBench:
+	def test_realistic_generator(self):
+		ress = gen_realistic(500)
+		assert len(ress) == 500
+		assert gen_realistic(500) == ress  # deterministic for a seed
+
+	def test_hypothesis_generator(self):
+		ress = gen_hypothesis(50)
+		assert len(ress) == 50
+		assert gen_hypothesis(50) == ress  # deterministic for a seed
+		assert gen_hypothesis(50, seed=1) != ress
+
+	def test_bench_all_impls(self):
+		ress = gen_hypothesis(20) + gen_realistic(100)
+		for impl in IMPLS.values():
+			result = bench(impl, ress)
+			assert result.timings["add"] is not None
+
+	def test_cli(self):
+		res = CliRunner().invoke(main, ["--scale", "100", "--impl", "TresourceMPData"])
+		assert res.exit_code == 0, res.output
+		assert "| TresourceMPData | 100 |" in res.output
@@ -0,0 +1,301 @@
+"""Tresources for Materialised Path resources which store numeric data in columns"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+import numpy as np
+
+from llamazure.rid.mp import AzObj, Path, PathResourceGroup, PathSubscription, Resource, ResourceGroup, SubResource, Subscription
+from llamazure.tresource.itresource import ITresourceData
+from llamazure.tresource.merge import ConflictPolicy, take_incoming
+from llamazure.tresource.mp import MPData, in_subtrees, resource_type
+
+Row = Union[float, Mapping[str, float]]  # a single value, or a value for each column
+
+KIND_SUBSCRIPTION, KIND_RG, KIND_RESOURCE, KIND_SUBRESOURCE = range(4)
+
+
+class _Interned:
+	"""Intern strings into ids, so they can be stored in numpy arrays"""
+
+	def __init__(self):
+		self.values: List[str] = []
+		self.ids: Dict[str, int] = {}
+
+	def __call__(self, value: str) -> int:
+		i = self.ids.get(value)
+		if i is None:
+			i = self.ids[value] = len(self.values)
+			self.values.append(value)
+		return i
+
+
+@dataclass(eq=False)
+class TresourceMPColumnar(ITresourceData[AzObj, Row, MPData[Row], Path]):
+	"""
+	Tresource implementation for materialised-path-based resources which stores numeric data in numpy arrays.
+	Each resource is a row in a table. The data for each resource is a value for each of the `columns`.
+	Group-bys and filters on subscription, resource group, and type are vectorised.
+
+	Removing resources leaves a tombstone, which are cleaned up when they make up most of the table.
+	"""
+
+	columns: Tuple[str, ...] = ("value",)
+	dtype: Any = np.float64
+
+	index: Dict[Path, int] = field(default_factory=dict, init=False, repr=False)
+	objs: List[Optional[AzObj]] = field(default_factory=list, init=False, repr=False)
+	data: Dict[str, np.ndarray] = field(init=False, repr=False)
+	alive: np.ndarray = field(init=False, repr=False)
+	has_data: np.ndarray = field(init=False, repr=False)
+	kinds: np.ndarray = field(init=False, repr=False)
+	sub_ids: np.ndarray = field(init=False, repr=False)
+	rg_ids: np.ndarray = field(init=False, repr=False)
+	type_ids: np.ndarray = field(init=False, repr=False)
+	sub_table: _Interned = field(default_factory=_Interned, init=False, repr=False)
+	rg_table: _Interned = field(default_factory=_Interned, init=False, repr=False)
+	type_table: _Interned = field(default_factory=_Interned, init=False, repr=False)
+
+	def __post_init__(self):
+		self.data = {c: np.zeros(0, dtype=self.dtype) for c in self.columns}
+		self.alive = np.zeros(0, dtype=bool)
+		self.has_data = np.zeros(0, dtype=bool)
+		self.kinds = np.zeros(0, dtype=np.int8)
+		self.sub_ids = np.zeros(0, dtype=np.int32)
+		self.rg_ids = np.zeros(0, dtype=np.int32)
+		self.type_ids = np.zeros(0, dtype=np.int32)
+
+	def __len__(self):
+		return len(self.index)
+
+	@property
+	def _n(self) -> int:
+		"""Number of rows in use, including tombstones"""
+		return len(self.objs)
+
+	def _grow(self, n: int):
+		"""Ensure there is capacity for `n` rows"""
+		capacity = len(self.alive)
+		if n <= capacity:
+			return
+		capacity = max(n, 2 * capacity, 16)
+		self.data = {c: np.resize(v, capacity) for c, v in self.data.items()}
+		self.alive = np.resize(self.alive, capacity)
+		self.has_data = np.resize(self.has_data, capacity)
+		self.kinds = np.resize(self.kinds, capacity)
+		self.sub_ids = np.resize(self.sub_ids, capacity)
+		self.rg_ids = np.resize(self.rg_ids, capacity)
+		self.type_ids = np.resize(self.type_ids, capacity)
+
+	def _row_of(self, data: Optional[Row]) -> Optional[Dict[str, float]]:
+		if data is None:
+			return None
+		if isinstance(data, Mapping):
+			return {c: data[c] for c in self.columns}
+		if len(self.columns) != 1:
+			raise ValueError(f"expected a value for each of the columns {self.columns}, got a single value")
+		return {self.columns[0]: data}
+
+	def _get_row(self, i: int) -> Optional[Row]:
+		if not self.has_data[i]:
+			return None
+		if len(self.columns) == 1:
+			return self.data[self.columns[0]][i].item()
+		return {c: v[i].item() for c, v in self.data.items()}
+
+	def _put(self, obj: AzObj, data: Optional[Row]):
+		"""Set the data of an object, adding a row if it isn't present"""
+		row = self._row_of(data)
+		i = self.index.get(obj.path)
+		if i is None:
+			i = self._n
+			self._grow(i + 1)
+			self.index[obj.path] = i
+			self.objs.append(obj)
+			self.alive[i] = True
+			if isinstance(obj, Subscription):
+				self.kinds[i], rg = KIND_SUBSCRIPTION, None
+			elif isinstance(obj, ResourceGroup):
+				self.kinds[i], rg = KIND_RG, obj.path
+			elif isinstance(obj, Resource):
+				self.kinds[i], rg = KIND_RESOURCE, obj.rg
+			elif isinstance(obj, SubResource):
+				self.kinds[i], rg = KIND_SUBRESOURCE, obj.rg
+			else:
+				raise TypeError(f"expected valid subclass of AzObj, found {type(obj)}")
+			self.sub_ids[i] = self.sub_table(obj.sub)
+			self.rg_ids[i] = self.rg_table(rg) if rg else -1
+			self.type_ids[i] = self.type_table(resource_type(obj))
+
+		self.has_data[i] = row is not None
+		for c, v in self.data.items():
+			v[i] = row[c] if row is not None else 0
+
+	def set_data(self, obj: AzObj, data: Row) -> None:
+		"""Add an AzObj to this Tresource"""
+		self._put(obj, data)
+
+	def add(self, obj: MPData[Row]) -> None:
+		self._put(obj.obj, obj.data)
+
+	def add_many(self, mps: Iterable[Tuple[Path, MPData[Row]]]):
+		"""Add an iterable of MP to this Tresource"""
+		for _, node in mps:
+			self._put(node.obj, node.data)
+
+	def nodes(self) -> Iterator[MPData[Row]]:
+		"""All the nodes in this Tresource"""
+		for i in self.index.values():
+			yield MPData(self.objs[i], self._get_row(i))  # type: ignore # only tombstones are None, and they are not in the index
+
+	def merge(self, other: TresourceMPColumnar, conflict: ConflictPolicy = take_incoming) -> TresourceMPColumnar:
+		if other.columns != self.columns:
+			raise ValueError(f"cannot merge Tresources with different columns self={self.columns} other={other.columns}")
+		if len(self) >= len(other):
+			for node in other.nodes():
+				self._merge_row(node.obj, node.data, conflict, incoming_is_other=True)
+		else:
+			mine = list(self.nodes())
+			self.__dict__.update(other.__dict__)  # take the larger storage, then add our rows to it
+			for node in mine:
+				self._merge_row(node.obj, node.data, conflict, incoming_is_other=False)
+		return self
+
+	def _merge_row(self, obj: AzObj, data: Optional[Row], conflict: ConflictPolicy, incoming_is_other: bool):
+		i = self.index.get(obj.path)
+		present = self._get_row(i) if i is not None else None
+		if present is None or data is None:
+			if i is None or data is not None:
+				self._put(obj, data)
+			return
+		existing, incoming = (present, data) if incoming_is_other else (data, present)
+		self._put(obj, conflict(existing, incoming))
+
+	def remove(self, obj: AzObj) -> None:
+		"""
+		Remove an object from this Tresource.
+		Its descendants are kept, since this Tresource does not need parents to be present.
+		"""
+		i = self.index.pop(obj.path, None)
+		if i is not None:
+			self._kill([i])
+
+	def remove_subtree(self, obj: AzObj) -> None:
+		"""
+		Remove an object and all of its descendants from this Tresource.
+		Since this Tresource is not a tree, this must check every resource.
+		"""
+		self.remove_subtrees([obj])
+
+	def remove_subtrees(self, objs: Iterable[AzObj]) -> None:
+		"""Remove many objects and all of their descendants from this Tresource, checking every resource only once"""
+		roots = {obj.path for obj in objs}
+		if roots:
+			self._kill([self.index.pop(path) for path in [path for path in self.index if in_subtrees(path, roots)]])
+
+	def _kill(self, ids: List[int]):
+		if not ids:
+			return
+		self.alive[ids] = False
+		for i in ids:
+			self.objs[i] = None
+		if len(self.index) * 2 < self._n:
+			self.compact()
+
+	def compact(self):
+		"""Remove tombstones"""
+		keep = np.flatnonzero(self.alive[: self._n])
+		self.data = {c: v[keep] for c, v in self.data.items()}
+		self.alive = self.alive[keep]
+		self.has_data = self.has_data[keep]
+		self.kinds = self.kinds[keep]
+		self.sub_ids = self.sub_ids[keep]
+		self.rg_ids = self.rg_ids[keep]
+		self.type_ids = self.type_ids[keep]
+		self.objs = [self.objs[i] for i in keep]
+		self.index = {obj.path: i for i, obj in enumerate(self.objs)}  # type: ignore # we removed the tombstones
+
+	def _live(self) -> np.ndarray:
+		"""Mask of rows which are not tombstones"""
+		return self.alive[: self._n]
+
+	def subs(self) -> FrozenSet[PathSubscription]:
+		return frozenset(self.sub_table.values[i] for i in np.unique(self.sub_ids[: self._n][self._live()]))
+
+	def rgs_flat(self) -> FrozenSet[PathResourceGroup]:
+		"""All resource groups that any resource is contained by"""
+		rg_ids = self.rg_ids[: self._n][self._live()]
+		return frozenset(self.rg_table.values[i] for i in np.unique(rg_ids[rg_ids >= 0]))
+
+	@property
+	def res(self) -> Dict[Path, MPData[Row]]:
+		"""Resources in this Tresource"""
+		return {node.obj.path: node for node in self.nodes()}
+
+	def res_flat(self) -> FrozenSet[Path]:
+		"""All Resources and SubResources"""
+		mask = self._live() & (self.kinds[: self._n] >= KIND_RESOURCE)
+		return frozenset(self.objs[i].path for i in np.flatnonzero(mask))  # type: ignore # live rows are not None
+
+	def filter(self, mask: np.ndarray) -> TresourceMPColumnar:
+		"""Return the rows which match a boolean mask over all rows (for example, `tree.column("cost") > 10`)"""
+		out = TresourceMPColumnar(self.columns, self.dtype)
+		for i in np.flatnonzero(mask[: self._n] & self._live()):
+			out._put(self.objs[i], self._get_row(i))  # type: ignore # live rows are not None
+		return out
+
+	def column(self, name: str) -> np.ndarray:
+		"""The values of a column for all rows, including tombstones. Use this to build masks for `filter`"""
+		return self.data[name][: self._n]
+
+	def where_parent(self, obj: AzObj) -> TresourceMPColumnar:
+		"""Return all objects with this as a parent"""
+		return self.where(obj.path)
+
+	def where(self, parent_path: Path) -> TresourceMPColumnar:
+		"""
+		Return all objects with this as the start of their Resource ID
+		Excludes a complete match. For example, `where("/subscriptions/0")` will not return the subscription itself.
+		"""
+		prefix = parent_path + "/"
+		mask = np.fromiter((obj is not None and obj.path.startswith(prefix) for obj in self.objs), dtype=bool, count=self._n)
+		return self.filter(mask)
+
+	def where_subscription(self, sub: Subscription) -> TresourceMPColumnar:
+		"""Return all objects with this Subscription as a parent"""
+		sub_id = self.sub_table.ids.get(sub.path, -1)
+		return self.filter((self.sub_ids[: self._n] == sub_id) & (self.kinds[: self._n] != KIND_SUBSCRIPTION))
+
+	def where_rg(self, rg: ResourceGroup) -> TresourceMPColumnar:
+		"""Return all objects with this ResourceGroup as a parent"""
+		rg_id = self.rg_table.ids.get(rg.path, -1)
+		return self.filter((self.rg_ids[: self._n] == rg_id) & (self.kinds[: self._n] != KIND_RG))
+
+	def _group_keys(self, by: str) -> Tuple[np.ndarray, List[str]]:
+		if by == "subscription":
+			return self.sub_ids[: self._n], self.sub_table.values
+		if by == "rg":
+			return self.rg_ids[: self._n], self.rg_table.values
+		if by == "type":
+			return self.type_ids[: self._n], self.type_table.values
+		raise ValueError(f"cannot group by {by}, expected one of 'subscription', 'rg', 'type'")
+
+	def sum_by(self, by: str, column: Optional[str] = None) -> Dict[str, float]:
+		"""
+		Sum a column grouped by "subscription", "rg", or "type".
+		Resources without data are not counted.
+		"""
+		keys, table = self._group_keys(by)
+		mask = self._live() & self.has_data[: self._n] & (keys >= 0)
+		values = self.data[column or self.columns[0]][: self._n]
+		sums = np.bincount(keys[mask], weights=values[mask], minlength=len(table))
+		counts = np.bincount(keys[mask], minlength=len(table))
+		return {table[i]: sums[i].item() for i in np.flatnonzero(counts)}
+
+	def count_by(self, by: str) -> Dict[str, int]:
+		"""Count resources grouped by "subscription", "rg", or "type" """
+		keys, table = self._group_keys(by)
+		counts = np.bincount(keys[self._live() & (keys >= 0)], minlength=len(table))
+		return {table[i]: counts[i].item() for i in np.flatnonzero(counts)}
@@ -0,0 +1,146 @@
+"""Test TresourceMPColumnar"""
+
+from typing import Type
+
+import numpy as np
+import pytest
+
+from llamazure.rid import conv, rid
+from llamazure.rid.mp import AzObj, Path
+from llamazure.tresource.columnar import TresourceMPColumnar, resource_type
+from llamazure.tresource.conftest import ABCTestBuildTree, ABCTestMerge, ABCTestQuery, ABCTestRemove, TreeImplSpec
+from llamazure.tresource.merge import keep_existing
+from llamazure.tresource.mp import TresourceMPData
+
+
+class TreeMPColumnarImpl(TreeImplSpec):
+	"""Implementation of TresourceMPColumnar"""
+
+	@property
+	def clz(self) -> Type:
+		return TresourceMPColumnar
+
+	def conv(self, obj: rid.AzObj) -> AzObj:
+		return conv.rid2mp(obj)
+
+	def recover(self, obj_repr: Path) -> rid.AzObj:
+		return rid.parse(obj_repr)
+
+	@property
+	def recurse_implicit(self) -> bool:
+		return False
+
+
+class TestBuildTreeMPColumnar(ABCTestBuildTree):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return TreeMPColumnarImpl()
+
+
+class TestQueryMPColumnar(ABCTestQuery):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return TreeMPColumnarImpl()
+
+
+class TestMergeMPColumnar(ABCTestMerge):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return TreeMPColumnarImpl()
+
+
+class TestRemoveMPColumnar(ABCTestRemove):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return TreeMPColumnarImpl()
+
+
+def mp(rid_str: str) -> AzObj:
+	return conv.rid2mp(rid.parse(rid_str))
+
+
+class TestColumns:
+	"""Test group-bys and filters on columns"""
+
+	vm0 = mp("/subscriptions/s0/resourceGroups/r0/providers/Microsoft.Compute/virtualMachines/vm0")
+	vm1 = mp("/subscriptions/s0/resourceGroups/r1/providers/Microsoft.Compute/virtualMachines/vm1")
+	vm2 = mp("/subscriptions/s1/resourceGroups/r0/providers/Microsoft.Compute/virtualMachines/vm2")
+	disk = mp("/subscriptions/s1/resourceGroups/r0/providers/Microsoft.Compute/disks/d0")
+	subnet = mp("/subscriptions/s1/resourceGroups/r0/providers/Microsoft.Network/virtualNetworks/v0/subnets/sn0")
+
+	def tree(self) -> TresourceMPColumnar:
+		tree = TresourceMPColumnar(columns=("cost", "cores"))
+		tree.set_data(self.vm0, {"cost": 10, "cores": 2})
+		tree.set_data(self.vm1, {"cost": 20, "cores": 4})
+		tree.set_data(self.vm2, {"cost": 40, "cores": 8})
+		tree.set_data(self.disk, {"cost": 1, "cores": 0})
+		return tree
+
+	def test_resource_type(self):
+		assert resource_type(self.vm0) == "microsoft.compute/virtualmachines"
+		assert resource_type(self.subnet) == "microsoft.network/virtualnetworks/subnets"
+
+	def test_sum_by_subscription(self):
+		assert self.tree().sum_by("subscription", "cost") == {"/subscriptions/s0": 30, "/subscriptions/s1": 41}
+
+	def test_sum_by_rg(self):
+		assert self.tree().sum_by("rg", "cores") == {
+			"/subscriptions/s0/resourcegroups/r0": 2,
+			"/subscriptions/s0/resourcegroups/r1": 4,
+			"/subscriptions/s1/resourcegroups/r0": 8,
+		}
+
+	def test_sum_by_type(self):
+		assert self.tree().sum_by("type", "cost") == {"microsoft.compute/virtualmachines": 70, "microsoft.compute/disks": 1}
+
+	def test_count_by_excludes_removed(self):
+		tree = self.tree()
+		tree.remove(self.vm2)
+		assert tree.count_by("type") == {"microsoft.compute/virtualmachines": 2, "microsoft.compute/disks": 1}
+
+	def test_filter(self):
+		tree = self.tree()
+		expensive = tree.filter(tree.column("cost") > 15)
+		assert expensive.res_flat() == {self.vm1.path, self.vm2.path}
+
+	def test_data_roundtrip(self):
+		tree = self.tree()
+		assert tree.res[self.vm1.path].data == {"cost": 20, "cores": 4}
+
+	def test_matches_mp_data(self):
+		"""Test that the columnar Tresource holds the same as a TresourceMPData"""
+		columnar = TresourceMPColumnar()
+		mpdata: TresourceMPData[float] = TresourceMPData()
+		for i, obj in enumerate([self.vm0, self.vm1, self.vm2, self.disk, self.subnet]):
+			columnar.set_data(obj, float(i))
+			mpdata.set_data(obj, float(i))
+
+		assert columnar.res == mpdata.res
+
+	def test_compaction(self):
+		"""Test that removing most resources compacts the table"""
+		tree = TresourceMPColumnar()
+		objs = [mp(f"/subscriptions/s0/resourceGroups/r0/providers/p/t/n{i}") for i in range(100)]
+		for i, obj in enumerate(objs):
+			tree.set_data(obj, i)
+		for obj in objs[:90]:
+			tree.remove(obj)
+
+		assert len(tree.objs) < 100
+		assert tree.sum_by("subscription") == {"/subscriptions/s0": float(np.sum(np.arange(90, 100)))}
+
+	def test_merge_direction(self):
+		small = TresourceMPColumnar()
+		small.set_data(self.vm0, 1)
+		large = TresourceMPColumnar()
+		large.set_data(self.vm0, 2)
+		large.set_data(self.vm1, 3)
+
+		merged = small.merge(large, keep_existing)
+
+		assert merged.res[self.vm0.path].data == 1
+		assert merged.res[self.vm1.path].data == 3
+
+	def test_single_value_needs_single_column(self):
+		with pytest.raises(ValueError):
+			self.tree().set_data(self.vm0, 1)
@@ -1,7 +1,7 @@
 """Test helpers for Tresource"""
 
 import abc
-from typing import FrozenSet, Generic, List, Set, Type, Union
+from typing import Any, FrozenSet, Generic, Iterable, List, Set, Type, Union
 
 import hypothesis
 from hypothesis import given
@@ -190,3 +190,198 @@ class ABCTestQuery(abc.ABC):
 			self.impl.add_to_tree(tree, self.impl.conv(obj), hash(obj))
 
 		assert self.impl.recover_many(tree.where_subscription(self.impl.conv(target[0])).res.keys()) == {target[-1]}
+
+
+class ABCTestTresource(abc.ABC):
+	"""Base for tests which build a Tresource of resources"""
+
+	@property
+	@abc.abstractmethod
+	def impl(self) -> TreeImplSpec:
+		"""The implementation of this tresource"""
+		...
+
+	def build(self, ress: Iterable[rid.AzObj]) -> ITresource:
+		"""Build a Tresource of these resources"""
+		tree = self.impl.clz()
+		for res in ress:
+			self.impl.add_to_tree(tree, self.impl.conv(res), hash(res))
+		return tree
+
+
+class ABCTestMerge(ABCTestTresource):
+	"""Test merging Tresources"""
+
+	@given(lists(st_resource_complex), lists(st_resource_complex))
+	def test_merge_is_union(self, left: List[rid.AzObj], right: List[rid.AzObj]):
+		"""Test that merging 2 Tresources is the same as building one Tresource with everything"""
+		merged = self.build(left).merge(self.build(right))
+		expected = self.build(left + right)
+
+		assert merged.subs() == expected.subs()
+		assert merged.rgs_flat() == expected.rgs_flat()
+		assert merged.res_flat() == expected.res_flat()
+
+	@given(lists(st_resource_complex))
+	def test_merge_overlapping(self, ress: List[rid.AzObj]):
+		"""Test that merging Tresources with the same resources does not duplicate them"""
+		merged = self.build(ress).merge(self.build(ress[: len(ress) // 2]))
+		expected = self.build(ress)
+
+		assert merged.res_flat() == expected.res_flat()
+
+	@given(lists(lists(st_resource_complex, max_size=5), max_size=5))
+	def test_merge_many(self, shards: List[List[rid.AzObj]]):
+		"""Test merging many Tresources at once"""
+		merged = self.impl.clz().merge_many([self.build(shard) for shard in shards])
+		expected = self.build([res for shard in shards for res in shard])
+
+		assert merged.subs() == expected.subs()
+		assert merged.rgs_flat() == expected.rgs_flat()
+		assert merged.res_flat() == expected.res_flat()
+
+
+class ABCTestRemove(ABCTestTresource):
+	"""Test removing resources from Tresources"""
+
+	def upserts(self, tree: ITresource, ress: Iterable[rid.AzObj]) -> list:
+		"""Convert resources into what `upsert_many` takes for this Tresource"""
+		if isinstance(tree, ITresourceData):
+			return [(self.impl.conv(res), hash(res)) for res in ress]
+		return [self.impl.conv(res) for res in ress]
+
+	@staticmethod
+	def is_under(res: rid.AzObj, removed: Set[rid.AzObj]) -> bool:
+		"""Whether a resource or any of its parents were removed"""
+		return any(parent in removed for parent in rid.get_chain(res))
+
+	def kept(self, ress: Iterable[rid.AzObj], removed: Set[rid.AzObj]) -> List[rid.AzObj]:
+		"""The resources which should be left after removing subtrees"""
+		out = [res for res in ress if not self.is_under(res, removed)]
+		if self.impl.recurse_implicit:
+			# implicit parents of a removed resource are not removed with it
+			out.extend(parent for res in removed for parent in rid.get_chain(res)[:-1] if not self.is_under(parent, removed))
+		return out
+
+	@given(lists(st_resource_base))
+	def test_remove(self, ress: List[rid.AzObj]):
+		"""Test removing resources without descendants"""
+		tree = self.build(ress)
+		removed = set(ress[::2])
+
+		for res in removed:
+			tree.remove(self.impl.conv(res))
+
+		expected = self.build(res for res in ress if res not in removed)
+		assert tree.res_flat() == expected.res_flat()
+
+	@given(lists(st_resource_complex))
+	def test_remove_subtree(self, ress: List[rid.AzObj]):
+		"""Test that removing a subtree removes descendants"""
+		tree = self.build(ress)
+		removed = set(ress[::2])
+
+		for res in removed:
+			tree.remove_subtree(self.impl.conv(res))
+
+		expected = self.build(self.kept(ress, removed))
+		assert tree.res_flat() == expected.res_flat()
+
+	@given(lists(st_resource_complex))
+	def test_remove_subtrees(self, ress: List[rid.AzObj]):
+		"""Test that removing many subtrees at once is the same as removing them one at a time"""
+		tree = self.build(ress)
+		removed = set(ress[::2])
+
+		tree.remove_subtrees(self.impl.conv(res) for res in removed)
+
+		expected = self.build(self.kept(ress, removed))
+		assert tree.res_flat() == expected.res_flat()
+
+	def test_remove_keeps_descendants(self):
+		"""Test that `remove` only removes the resource itself"""
+		target = rid.parse_chain("/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n0/providers/p_l0/t_l0/n_l0")
+		tree = self.build([target[-2], target[-1]])
+
+		tree.remove(self.impl.conv(target[-2]))
+
+		assert target[-1] in self.impl.recover_many(tree.res_flat())
+
+	def test_remove_missing(self):
+		"""Test that removing something which isn't present does nothing"""
+		target = rid.parse_chain("/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n0/providers/p_l0/t_l0/n_l0")
+		other = rid.parse("/subscriptions/s1/resourceGroups/r0/providers/p0/t0/n0")
+		tree = self.build([target[-1]])
+		before = tree.res_flat()
+
+		tree.remove(self.impl.conv(other))
+		tree.remove_subtree(self.impl.conv(other))
+
+		assert tree.res_flat() == before
+
+	@given(lists(st_resource_complex), lists(st_resource_complex))
+	def test_apply_changes(self, ress: List[rid.AzObj], added: List[rid.AzObj]):
+		"""Test that applying changes is the same as building with the changes"""
+		tree = self.build(ress)
+		removed = set(ress[::2])
+
+		tree.apply_changes(added=self.upserts(tree, added), removed=[self.impl.conv(res) for res in removed], modified=self.upserts(tree, ress[1::2]))
+
+		expected = self.build(self.kept(ress, removed) + added)
+		assert tree.res_flat() == expected.res_flat()
+
+
+class ABCTestAncestors(abc.ABC):
+	"""Test ancestor and lowest-common-ancestor queries on TresourceData"""
+
+	@property
+	@abc.abstractmethod
+	def impl(self) -> TreeImplSpec:
+		"""The implementation of this tresource"""
+		...
+
+	chain = rid.parse_chain("/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n0/t1/c0/providers/p_l0/t_l0/n_l0")
+	sibling = rid.parse("/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n0/providers/p1/t1/n1")
+	other_sub = rid.parse("/subscriptions/s1/resourceGroups/r0/providers/p0/t0/n0")
+
+	def build(self, ress: Iterable[rid.AzObj]) -> Any:
+		"""Build a Tresource with these resources, with the hash of each resource as its data. The ancestor queries aren't part of ITresourceData"""
+		tree: Any = self.impl.clz()
+		for res in ress:
+			tree.set_data(self.impl.conv(res), hash(res))
+		return tree
+
+	def test_ancestors(self):
+		tree = self.build(self.chain)
+
+		assert [node.data for node in tree.ancestors(self.impl.conv(self.chain[-1]))] == [hash(res) for res in self.chain[:-1]]
+		assert tree.ancestors(self.impl.conv(self.chain[0])) == []
+
+	def test_nearest_ancestor_with_data(self):
+		sub, rg, *_, leaf = self.chain
+		tree = self.build([sub, rg, leaf])
+
+		assert tree.nearest_ancestor_with_data(self.impl.conv(leaf)).data == hash(rg)
+		assert tree.nearest_ancestor_with_data(self.impl.conv(leaf), include_self=True).data == hash(leaf)
+		assert tree.nearest_ancestor_with_data(self.impl.conv(rg)).data == hash(sub)
+		assert tree.nearest_ancestor_with_data(self.impl.conv(sub)) is None
+		assert tree.nearest_ancestor_with_data(self.impl.conv(self.other_sub)) is None
+
+	def test_lca(self):
+		tree = self.build([self.chain[-1], self.sibling])
+		n0 = self.chain[2]
+
+		assert self.impl.recover(tree.lca(self.impl.conv(self.chain[-1]), self.impl.conv(self.sibling))) == n0
+		assert self.impl.recover(tree.lca(self.impl.conv(n0), self.impl.conv(self.chain[-1]))) == n0
+		assert tree.lca(self.impl.conv(self.sibling), self.impl.conv(self.other_sub)) is None
+
+	@given(lists(st_resource_complex), lists(st_resource_complex))
+	def test_bulk_is_same_as_single(self, with_data: List[rid.AzObj], queries: List[rid.AzObj]):
+		"""Test that the bulk query gives the same answers as querying one at a time"""
+		tree = self.build(with_data)
+		queries = queries + with_data
+
+		for include_self in (False, True):
+			bulk = tree.nearest_ancestors_with_data([self.impl.conv(res) for res in queries], include_self=include_self)
+			single = [tree.nearest_ancestor_with_data(self.impl.conv(res), include_self=include_self) for res in queries]
+			assert bulk == single
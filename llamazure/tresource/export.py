@@ -0,0 +1,159 @@
+"""Export Tresources for analytics, streaming rows from a traversal of the tree"""
+
+from __future__ import annotations
+
+import csv
+import dataclasses
+import json
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, TextIO, Tuple, Union
+
+from llamazure.rid import mp, rid
+from llamazure.tresource.mp import TresourceMP, TresourceMPData, resource_type
+from llamazure.tresource.tresource import Node, Tresource, TresourceData
+
+AnyTresource = Union[Tresource, TresourceData, TresourceMP, TresourceMPData]
+
+
+class Row(NamedTuple):
+	"""A row of an export"""
+
+	id: str
+	subscription: str
+	resource_group: str
+	type: str
+	name: str
+	data: Any
+
+
+COLUMNS = Row._fields
+
+
+def row(parent: Optional[Row], obj: Any, path: str, data: Any) -> Row:
+	"""
+	Make the row for a resource from the row of its parent.
+	The type is from `resource_type`, like the `type` column of the Azure Resource Graph.
+	"""
+	sub = parent.subscription if parent else ""
+	if isinstance(obj, (rid.Subscription, mp.Subscription)):
+		return Row(path, obj.uuid, "", resource_type(obj), obj.uuid, data)
+	elif isinstance(obj, (rid.ResourceGroup, mp.ResourceGroup)):
+		return Row(path, sub, obj.name, resource_type(obj), obj.name, data)
+	elif isinstance(obj, (rid.Resource, mp.Resource, rid.SubResource, mp.SubResource)):
+		return Row(path, sub, parent.resource_group if parent else "", resource_type(obj), obj.name, data)
+	else:
+		raise TypeError(f"Expected known subclass of AzObj, got {type(obj)}")
+
+
+def _walk_nodes(root: Node) -> Iterator[Row]:
+	"""Traverse a TresourceData with a stack, so memory is proportional to the depth and not the size of the tree"""
+	stack: List[Tuple[Optional[Row], Iterator[Node]]] = [(None, iter(root.children.values()))]
+	while stack:
+		parent, children = stack[-1]
+		child = next(children, None)
+		if child is None:
+			stack.pop()
+			continue
+		r = row(parent, child.obj, (parent.id if parent else "") + child.obj.slug(), child.data)
+		yield r
+		stack.append((r, iter(child.children.values())))
+
+
+def _walk_dicts(root: Dict) -> Iterator[Row]:
+	"""Traverse a Tresource with a stack, so memory is proportional to the depth and not the size of the tree"""
+	stack: List[Tuple[Optional[Row], Iterator[Tuple[Any, Dict]]]] = [(None, iter(root.items()))]
+	while stack:
+		parent, children = stack[-1]
+		item = next(children, None)
+		if item is None:
+			stack.pop()
+			continue
+		obj, grandchildren = item
+		r = row(parent, obj, (parent.id if parent else "") + obj.slug(), None)
+		yield r
+		stack.append((r, iter(grandchildren.items())))
+
+
+def _mp_row(obj: mp.AzObj, data: Any) -> Row:
+	"""Make the row for a materialised-path resource. Its parents might not be in the Tresource, so we parse them from its path"""
+	parent = None
+	for path, parent_obj in mp.parse_chain(obj.path)[:-1]:
+		parent = row(parent, parent_obj, path, None)
+	return row(parent, obj, obj.path, data)
+
+
+def rows(tree: AnyTresource) -> Iterator[Row]:
+	"""
+	Stream a row for every resource in a Tresource, including implicit parents.
+	Rows are generated as the tree is traversed, so this doesn't copy the Tresource.
+	The Tresource shouldn't be modified during the export; export a `PersistentTresourceData.snapshot()` if it might be.
+	"""
+	if isinstance(tree, TresourceData):
+		return _walk_nodes(tree.resources)
+	elif isinstance(tree, Tresource):
+		return _walk_dicts(tree.resources)
+	elif isinstance(tree, TresourceMPData):
+		return (_mp_row(node.obj, node.data) for node in tree.resources.values())
+	elif isinstance(tree, TresourceMP):
+		return (_mp_row(obj, None) for obj in tree.resources.values())
+	else:
+		raise TypeError(f"Cannot export {type(tree)}")
+
+
+def to_jsonable(data: Any) -> Any:
+	"""Default conversion for data which `json` can't serialise. Dataclasses become dicts and everything else becomes a string"""
+	if dataclasses.is_dataclass(data) and not isinstance(data, type):
+		return dataclasses.asdict(data)
+	return str(data)
+
+
+def write_ndjson(tree: AnyTresource, f: TextIO, default: Callable[[Any], Any] = to_jsonable) -> int:
+	"""
+	Write a Tresource as newline-delimited JSON, one object per resource.
+	The data is embedded as JSON; `default` converts data which `json` can't serialise.
+	Returns the number of rows written.
+	"""
+	n = 0
+	for r in rows(tree):
+		f.write(json.dumps(r._asdict(), default=default))
+		f.write("\n")
+		n += 1
+	return n
+
+
+def write_csv(tree: AnyTresource, f: TextIO, default: Callable[[Any], Any] = to_jsonable) -> int:
+	"""
+	Write a Tresource as CSV with a header, one row per resource.
+	The data column is serialised as JSON, and is empty for resources without data.
+	Returns the number of rows written.
+	"""
+	writer = csv.writer(f)
+	writer.writerow(COLUMNS)
+	n = 0
+	for r in rows(tree):
+		writer.writerow((*r[:-1], "" if r.data is None else json.dumps(r.data, default=default)))
+		n += 1
+	return n
+
+
+def batches(tree: AnyTresource, size: int = 10_000, serialise: Optional[Callable[[Any], Any]] = None) -> Iterator[Dict[str, List[Any]]]:
+	"""
+	Stream a Tresource as batches of columns, with at most `size` rows in each.
+	Each batch is a dict of column name to values, which is what `pyarrow.RecordBatch.from_pydict` and `pandas.DataFrame` take,
+	so you can write Parquet or Arrow without holding the whole export in memory.
+	If given, `serialise` is applied to the data, for example `json.dumps` to store it as a string column.
+	"""
+	batch: List[Row] = []
+	for r in rows(tree):
+		batch.append(r)
+		if len(batch) >= size:
+			yield _columns(batch, serialise)
+			batch = []
+	if batch:
+		yield _columns(batch, serialise)
+
+
+def _columns(batch: List[Row], serialise: Optional[Callable[[Any], Any]]) -> Dict[str, List[Any]]:
+	columns: Dict[str, List[Any]] = {name: list(values) for name, values in zip(COLUMNS, zip(*batch))}
+	if serialise:
+		columns["data"] = [None if d is None else serialise(d) for d in columns["data"]]
+	return columns
@@ -0,0 +1,150 @@
+"""Test exporting Tresources"""
+
+import csv
+import io
+import json
+from dataclasses import dataclass
+from functools import partial
+from typing import List
+
+from hypothesis import given
+from hypothesis.strategies import lists
+
+from llamazure.rid import conv, rid
+from llamazure.rid.conftest import st_resource_any
+from llamazure.rid.rid import AzObj
+from llamazure.tresource.export import COLUMNS, batches, rows, to_jsonable, write_csv, write_ndjson
+from llamazure.tresource.mp import TresourceMP, TresourceMPData, resource_type
+from llamazure.tresource.tresource import Tresource, TresourceData
+
+
+@dataclass
+class Widget:
+	size: int
+
+
+class TestRow:
+	def types(self, tree) -> dict:
+		return {r.id.lower(): r.type for r in rows(tree)}
+
+	def test_types(self):
+		subnet = rid.parse("/subscriptions/s0/resourceGroups/r0/providers/Microsoft.Network/virtualNetworks/v0/subnets/sn0")
+		lock = rid.parse("/subscriptions/s0/resourceGroups/r0/providers/Microsoft.Network/virtualNetworks/v0/providers/Microsoft.Authorization/locks/l0")
+		tree: TresourceData[int] = TresourceData()
+		mp_tree: TresourceMPData[int] = TresourceMPData()
+		for res in [subnet, lock]:
+			tree.set_data(res, 1)
+			mp_tree.set_data(conv.rid2mp(res), 1)
+
+		for types in [self.types(tree), self.types(mp_tree)]:
+			assert types["/subscriptions/s0/resourcegroups/r0/providers/microsoft.network/virtualnetworks/v0/subnets/sn0"] == "microsoft.network/virtualnetworks/subnets"
+			assert (
+				types["/subscriptions/s0/resourcegroups/r0/providers/microsoft.network/virtualnetworks/v0/providers/microsoft.authorization/locks/l0"]
+				== "microsoft.authorization/locks"
+			)
+		assert self.types(tree)["/subscriptions/s0"] == "microsoft.resources/subscriptions"
+		assert self.types(tree)["/subscriptions/s0/resourcegroups/r0"] == "microsoft.resources/resourcegroups"
+
+	def test_columns(self):
+		res = rid.parse("/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n0")
+		tree: TresourceData[int] = TresourceData()
+		tree.set_data(res, 1)
+
+		r = [r for r in rows(tree) if r.name == "n0"][0]
+		assert r.subscription == "s0"
+		assert r.resource_group == "r0"
+		assert r.type == "p0/t0"
+		assert r.data == 1
+
+
+class TestRows:
+	"""Test that rows are generated for every resource"""
+
+	@given(lists(st_resource_any))
+	def test_ids_match_serialised(self, ress: List[AzObj]):
+		tree: TresourceData[int] = TresourceData()
+		plain = Tresource()
+		for res in ress:
+			tree.set_data(res, 1)
+			plain.add(res)
+
+		expected = {rid.serialise(res).lower() for res in ress}
+		exported = {r.id.lower(): r for r in rows(tree)}
+		assert expected <= set(exported)
+		assert all(exported[i].data == 1 for i in expected)
+		assert {r.id.lower() for r in rows(plain)} == set(exported)
+
+	@given(lists(st_resource_any))
+	def test_mp_matches(self, ress: List[AzObj]):
+		mp_tree: TresourceMPData[int] = TresourceMPData()
+		mp_plain = TresourceMP()
+		for res in ress:
+			mp_tree.set_data(conv.rid2mp(res), 1)
+			mp_plain.add(conv.rid2mp(res))
+
+		expected = {rid.serialise(res).lower() for res in ress}
+		assert {r.id for r in rows(mp_tree)} == expected
+		assert {r.id for r in rows(mp_plain)} == expected
+
+	@given(lists(st_resource_any))
+	def test_rid_and_mp_types_match(self, ress: List[AzObj]):
+		"""Test that the rid and mp Tresources export the same types, which are the types from `resource_type`"""
+		tree: TresourceData[int] = TresourceData()
+		mp_tree: TresourceMPData[int] = TresourceMPData()
+		for res in ress:
+			tree.set_data(res, 1)
+			mp_tree.set_data(conv.rid2mp(res), 1)
+
+		types = {r.id.lower(): r.type for r in rows(tree)}
+		assert all(types[r.id] == r.type for r in rows(mp_tree))  # the rid Tresource also has implicit parents
+		assert all(types[rid.serialise(res).lower()] == resource_type(conv.rid2mp(res)) for res in ress)
+
+	def test_streams(self):
+		"""Test that rows are generated lazily"""
+		tree: TresourceData[int] = TresourceData()
+		tree.set_data(rid.parse("/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n0"), 1)
+
+		it = rows(tree)
+		assert next(it).id == "/subscriptions/s0"
+		tree.set_data(rid.parse("/subscriptions/s0/resourceGroups/r1"), 2)  # unvisited parts of the tree are read as we go
+
+
+class TestWriters:
+	def tree(self) -> TresourceData:
+		tree: TresourceData = TresourceData()
+		tree.set_data(rid.parse("/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n0"), {"tags": {"env": "prod"}})
+		tree.set_data(rid.parse("/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n1"), Widget(3))
+		return tree
+
+	def test_ndjson(self):
+		f = io.StringIO()
+		n = write_ndjson(self.tree(), f)
+
+		lines = [json.loads(line) for line in f.getvalue().splitlines()]
+		assert n == len(lines) == 4
+		by_name = {line["name"]: line for line in lines}
+		assert by_name["n0"]["data"] == {"tags": {"env": "prod"}}
+		assert by_name["n1"]["data"] == {"size": 3}
+		assert by_name["r0"]["data"] is None
+		assert by_name["n0"]["type"] == "p0/t0"
+
+	def test_csv(self):
+		f = io.StringIO()
+		n = write_csv(self.tree(), f)
+
+		f.seek(0)
+		reader = csv.DictReader(f)
+		assert tuple(reader.fieldnames or ()) == COLUMNS
+		lines = list(reader)
+		assert n == len(lines) == 4
+		by_name = {line["name"]: line for line in lines}
+		assert json.loads(by_name["n0"]["data"]) == {"tags": {"env": "prod"}}
+		assert by_name["r0"]["data"] == ""
+		assert by_name["n1"]["resource_group"] == "r0"
+
+	def test_batches(self):
+		exported = list(batches(self.tree(), size=3, serialise=partial(json.dumps, default=to_jsonable)))
+
+		assert [len(b["id"]) for b in exported] == [3, 1]
+		assert set(exported[0].keys()) == set(COLUMNS)
+		assert all(d is None or isinstance(d, str) for b in exported for d in b["data"])
@@ -0,0 +1,154 @@
+"""Attributes which resources inherit from their parents, like tags or locks"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Generic, Iterable, Iterator, Optional, Sequence, Tuple, TypeVar
+
+from llamazure.rid.rid import AzObj, get_chain
+from llamazure.tresource.merge import ConflictPolicy, take_incoming
+from llamazure.tresource.tresource import Node, T, TresourceData
+
+A = TypeVar("A")
+
+Key = Tuple[str, ...]  # the slugs from the root to a Node
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class Inheritable(Generic[T, A]):
+	"""
+	An attribute which is inherited down a Tresource.
+	The effective value of a resource is `combine(effective value of its parent, own value)`.
+	"""
+
+	own: Callable[[T], Optional[A]]
+	"""Get the resource's own value from its data. Return None if it doesn't set one"""
+	combine: Callable[[A, A], A]
+	"""Combine the value inherited from the parent with the resource's own value"""
+	default: A
+	"""The value inherited by the top of the Tresource"""
+
+
+@dataclass
+class InheritedTresourceData(TresourceData[T]):
+	"""
+	A TresourceData which computes the effective value of inherited attributes.
+	For example, the effective tags of a resource are its tags merged with the tags of its resource group and subscription.
+
+	Effective values are computed lazily from the top down and memoised for each Node.
+	Changing a resource forgets only the memoised values in its subtree.
+	"""
+
+	attributes: Dict[str, Inheritable[T, Any]] = field(default_factory=dict)
+	_memo: Dict[str, Dict[Key, Any]] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+	def define(self, name: str, attribute: Inheritable[T, Any]):
+		"""Define an inherited attribute"""
+		self.attributes[name] = attribute
+		self._memo.pop(name, None)
+
+	def effective(self, obj: AzObj, name: str) -> Any:
+		"""
+		Get the effective value of an inherited attribute for a resource.
+		A resource which isn't in the Tresource has the value it would inherit from its deepest ancestor which is.
+		"""
+		return self._effective_chain(get_chain(obj), name)
+
+	def _effective_chain(self, chain: Sequence[AzObj], name: str) -> Any:
+		attribute = self.attributes[name]
+		memo = self._memo.setdefault(name, {})
+
+		value = attribute.default
+		key: Key = ()
+		node = self.resources
+		for i in chain:
+			key = (*key, i.slug())
+			child = node.children.get(key[-1])
+			if child is None:
+				break
+			node = child
+			memoised = memo.get(key, _MISSING)
+			if memoised is _MISSING:
+				value = self._apply(attribute, value, node)
+				memo[key] = value
+			else:
+				value = memoised
+		return value
+
+	@staticmethod
+	def _apply(attribute: Inheritable[T, Any], inherited: Any, node: Node[T]) -> Any:
+		own = attribute.own(node.data) if node.data is not None else None
+		return inherited if own is None else attribute.combine(inherited, own)
+
+	def effective_all(self, name: str) -> Iterator[Tuple[AzObj, Any]]:
+		"""Get the effective value of an inherited attribute for every resource, computing them in one pass from the top down"""
+		attribute = self.attributes[name]
+		memo = self._memo.setdefault(name, {})
+
+		def recurse(node: Node[T], key: Key, inherited: Any) -> Iterator[Tuple[AzObj, Any]]:
+			for slug, child in node.children.items():
+				child_key = (*key, slug)
+				value = memo.get(child_key, _MISSING)
+				if value is _MISSING:
+					value = memo[child_key] = self._apply(attribute, inherited, child)
+				yield child.obj, value
+				yield from recurse(child, child_key, value)
+
+		yield from recurse(self.resources, (), attribute.default)
+
+	def _forget(self, chain: Sequence[AzObj]):
+		"""
+		Forget the memoised values for a Node and its subtree.
+		A value is only memoised after its parent's value is, so we can stop at any Node without a memoised value.
+		"""
+		node: Optional[Node[T]] = self.resources
+		key: Key = ()
+		for i in chain:
+			key = (*key, i.slug())
+			node = node.children.get(key[-1])  # type: ignore # node is not None in the loop
+			if node is None:
+				return
+
+		def recurse(memo: Dict[Key, Any], node: Node[T], key: Key):
+			if memo.pop(key, _MISSING) is _MISSING:
+				return
+			for slug, child in node.children.items():
+				recurse(memo, child, (*key, slug))
+
+		for memo in self._memo.values():
+			recurse(memo, node, key)  # type: ignore # checked in the loop
+
+	def set_data_chain(self, chain: Sequence[AzObj], data: T):
+		self._forget(chain)
+		super().set_data_chain(chain, data)
+
+	def add_node_chain(self, chain: Sequence[AzObj], node: Node[T]):
+		self._forget((*chain, node.obj))
+		super().add_node_chain(chain, node)
+
+	def set_data_many(self, items: Iterable[Tuple[AzObj, T]]):
+		items = list(items)
+		for obj, _ in items:
+			self._forget(get_chain(obj))
+		super().set_data_many(items)
+
+	def add_many(self, nodes: Iterable[Node[T]]):
+		nodes = list(nodes)
+		for node in nodes:
+			self._forget(get_chain(node.obj))
+		super().add_many(nodes)
+
+	def remove(self, obj: AzObj) -> None:
+		self._forget(get_chain(obj))
+		super().remove(obj)
+
+	def remove_subtree(self, obj: AzObj) -> None:
+		self._forget(get_chain(obj))
+		super().remove_subtree(obj)
+
+	def merge(self, other: TresourceData[T], conflict: ConflictPolicy = take_incoming) -> InheritedTresourceData[T]:
+		"""Merge another Tresource into this one. This forgets all memoised values"""
+		self._memo.clear()
+		super().merge(other, conflict)
+		return self
@@ -0,0 +1,140 @@
+"""Test inherited attributes"""
+
+from typing import Dict, Type
+
+from llamazure.rid import rid
+from llamazure.rid.rid import AzObj, parse_chain
+from llamazure.tresource.conftest import ABCTestBuildTree, ABCTestRemove, TreeImplSpec
+from llamazure.tresource.inherit import Inheritable, InheritedTresourceData
+from llamazure.tresource.tresource import Node, T
+
+
+class InheritedDataTreeImpl(TreeImplSpec[AzObj, Node[T], AzObj]):
+	"""Implementation of InheritedTresourceData"""
+
+	@property
+	def clz(self) -> Type:
+		return InheritedTresourceData
+
+	def conv(self, obj: rid.AzObj) -> AzObj:
+		return obj
+
+	def recover(self, obj_repr: AzObj) -> rid.AzObj:
+		return obj_repr
+
+	@property
+	def recurse_implicit(self) -> bool:
+		return True
+
+
+class TestBuildInheritedDataTree(ABCTestBuildTree):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return InheritedDataTreeImpl()
+
+
+class TestRemoveInheritedDataTree(ABCTestRemove):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return InheritedDataTreeImpl()
+
+
+class CountingCombine:
+	"""Merge tags, counting how many times we were called"""
+
+	def __init__(self):
+		self.calls = 0
+
+	def __call__(self, inherited: Dict, own: Dict) -> Dict:
+		self.calls += 1
+		return {**inherited, **own}
+
+
+class TestInherit:
+	"""Test computing inherited attributes"""
+
+	sub, rg, vnet, subnet = parse_chain("/subscriptions/s0/resourceGroups/r0/providers/Microsoft.Network/virtualNetworks/v0/subnets/sn0")
+	other_rg_res = parse_chain("/subscriptions/s0/resourceGroups/r1/providers/Microsoft.Network/virtualNetworks/v1")[-1]
+
+	def tree(self):
+		combine = CountingCombine()
+		tree: InheritedTresourceData[Dict] = InheritedTresourceData()
+		tree.define("tags", Inheritable(lambda d: d.get("tags"), combine, {}))
+		tree.set_data(self.sub, {"tags": {"env": "prod", "owner": "a"}})
+		tree.set_data(self.rg, {"tags": {"owner": "b"}})
+		tree.set_data(self.vnet, {})
+		tree.set_data(self.subnet, {"tags": {"tier": "web"}})
+		tree.set_data(self.other_rg_res, {"tags": {"tier": "db"}})
+		return tree, combine
+
+	def test_effective(self):
+		tree, _ = self.tree()
+		assert tree.effective(self.subnet, "tags") == {"env": "prod", "owner": "b", "tier": "web"}
+		assert tree.effective(self.vnet, "tags") == {"env": "prod", "owner": "b"}
+		assert tree.effective(self.other_rg_res, "tags") == {"env": "prod", "owner": "a", "tier": "db"}
+
+	def test_implicit_nodes_inherit(self):
+		tree: InheritedTresourceData[Dict] = InheritedTresourceData()
+		tree.define("tags", Inheritable(lambda d: d.get("tags"), lambda a, b: {**a, **b}, {}))
+		tree.set_data(self.sub, {"tags": {"env": "prod"}})
+		tree.set_data(self.subnet, {})
+
+		assert tree.effective(self.vnet, "tags") == {"env": "prod"}
+
+	def test_missing_resource_inherits(self):
+		"""Test that a resource which isn't in the Tresource gets the value of its deepest ancestor which is"""
+		tree, _ = self.tree()
+		missing_res = parse_chain("/subscriptions/s0/resourceGroups/r0/providers/Microsoft.Network/virtualNetworks/v9")[-1]
+		missing_rg_res = parse_chain("/subscriptions/s0/resourceGroups/r9/providers/p/t/n1")[-1]
+		missing_sub_res = parse_chain("/subscriptions/s9/resourceGroups/r0/providers/p/t/n1")[-1]
+
+		assert tree.effective(missing_res, "tags") == {"env": "prod", "owner": "b"}
+		assert tree.effective(missing_rg_res, "tags") == {"env": "prod", "owner": "a"}
+		assert tree.effective(missing_sub_res, "tags") == {}
+
+	def test_memoised(self):
+		tree, combine = self.tree()
+		tree.effective(self.subnet, "tags")
+		calls = combine.calls
+
+		tree.effective(self.subnet, "tags")
+		tree.effective(self.vnet, "tags")
+
+		assert combine.calls == calls
+
+	def test_ancestor_change_invalidates_subtree(self):
+		tree, combine = self.tree()
+		tree.effective(self.subnet, "tags")
+		tree.effective(self.other_rg_res, "tags")
+
+		tree.set_data(self.rg, {"tags": {"owner": "c"}})
+		calls = combine.calls
+
+		assert tree.effective(self.subnet, "tags")["owner"] == "c"
+		assert combine.calls == calls + 2  # the rg and the subnet; the vnet has no tags of its own
+		tree.effective(self.other_rg_res, "tags")
+		assert combine.calls == calls + 2  # the other rg was not invalidated
+
+	def test_set_data_many_invalidates(self):
+		tree, _ = self.tree()
+		tree.effective(self.subnet, "tags")
+
+		tree.set_data_many([(self.rg, {"tags": {"owner": "c"}}), (self.vnet, {"tags": {"tier": "app"}})])
+
+		assert tree.effective(self.subnet, "tags") == {"env": "prod", "owner": "c", "tier": "web"}
+
+	def test_remove_invalidates(self):
+		tree, _ = self.tree()
+		tree.effective(self.subnet, "tags")
+
+		tree.remove(self.rg)
+
+		assert tree.effective(self.subnet, "tags") == {"env": "prod", "owner": "a", "tier": "web"}
+
+	def test_effective_all(self):
+		tree, _ = self.tree()
+		effective = dict(tree.effective_all("tags"))
+
+		assert effective[self.subnet] == tree.effective(self.subnet, "tags")
+		assert effective[self.sub] == {"env": "prod", "owner": "a"}
+		assert len(effective) == 6
@@ -3,11 +3,14 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import FrozenSet, Generic, Optional, TypeVar
+from typing import Any, FrozenSet, Generic, Iterable, Optional, Tuple, TypeVar
+
+from llamazure.tresource.merge import ConflictPolicy, take_incoming
 
 AzObjT = TypeVar("AzObjT")  # Your AzObj type
 ObjT = TypeVar("ObjT")  # The type of thing your Tresource stores. Usually an AzObj class or a Node class
 ObjReprT = TypeVar("ObjReprT")  # The type that your tresource uses to represent resources for membership
+TresourceT = TypeVar("TresourceT", bound="ITresource")
 
 
 class ITresource(Generic[ObjT, ObjReprT], ABC):
@@ -33,6 +36,58 @@ class ITresource(Generic[ObjT, ObjReprT], ABC):
 		"""Resturn all explicit resources in this tresource"""
 		...
 
+	@abstractmethod
+	def merge(self: TresourceT, other: TresourceT) -> TresourceT:
+		"""
+		Merge another Tresource into this one.
+		This takes time proportional to the smaller of the Tresources.
+		To do that, structure is moved from `other` into this Tresource, so `other` should not be used afterwards.
+		"""
+		...
+
+	def merge_many(self: TresourceT, others: Iterable[TresourceT]) -> TresourceT:
+		"""Merge many Tresources into this one"""
+		for other in others:
+			self.merge(other)
+		return self
+
+	@abstractmethod
+	def remove(self, obj: Any) -> None:
+		"""
+		Remove an AzObj from this Tresource.
+		Its descendants are kept. Removing an object which is not present does nothing.
+		"""
+		...
+
+	@abstractmethod
+	def remove_subtree(self, obj: Any) -> None:
+		"""
+		Remove an AzObj and all of its descendants from this Tresource.
+		Removing an object which is not present does nothing.
+		"""
+		...
+
+	def remove_subtrees(self, objs: Iterable[Any]) -> None:
+		"""Remove many AzObjs and all of their descendants from this Tresource"""
+		for obj in objs:
+			self.remove_subtree(obj)
+
+	def upsert_many(self, objs: Iterable[Any]) -> None:
+		"""Add many objects, replacing them if they are present"""
+		for obj in objs:
+			self.add(obj)
+
+	def apply_changes(self, added: Iterable[Any] = (), removed: Iterable[Any] = (), modified: Iterable[Any] = ()) -> None:
+		"""
+		Apply a batch of changes, such as the changes since the last refresh.
+		`added` and `modified` are whatever `upsert_many` takes; for Tresources with data, these are pairs of (AzObj, data).
+		Removed objects are removed with their descendants, since deleting a resource in Azure deletes its children.
+		Removals are applied first, so an object which was removed and then recreated is kept.
+		"""
+		self.remove_subtrees(removed)
+		self.upsert_many(added)
+		self.upsert_many(modified)
+
 
 DataT = TypeVar("DataT")  # The type of Data you want to store
 
@@ -45,6 +100,7 @@ class INode(Generic[AzObjT, DataT], ABC):
 
 
 NodeT = TypeVar("NodeT", bound=INode)
+TresourceDataT = TypeVar("TresourceDataT", bound="ITresourceData")
 
 
 class ITresourceData(Generic[AzObjT, DataT, NodeT, ObjReprT], ITresource[NodeT, ObjReprT]):
@@ -54,3 +110,46 @@ class ITresourceData(Generic[AzObjT, DataT, NodeT, ObjReprT], ITresource[NodeT,
 	def set_data(self, obj: AzObjT, data: DataT) -> None:
 		"""Create a node with data."""
 		...
+
+	@abstractmethod
+	def merge(self: TresourceDataT, other: TresourceDataT, conflict: ConflictPolicy = take_incoming) -> TresourceDataT:  # type: ignore[override]
+		"""
+		Merge another Tresource into this one.
+		If both have data for the same resource, the `conflict` policy decides which data is kept.
+		This takes time proportional to the smaller of the Tresources.
+		To do that, structure is moved from `other` into this Tresource, so `other` should not be used afterwards.
+		"""
+		...
+
+	def merge_many(self: TresourceDataT, others: Iterable[TresourceDataT], conflict: ConflictPolicy = take_incoming) -> TresourceDataT:  # type: ignore[override]
+		"""Merge many Tresources into this one"""
+		for other in others:
+			self.merge(other, conflict)
+		return self
+
+	@abstractmethod
+	def remove(self, obj: AzObjT) -> None:
+		"""
+		Remove the data for an AzObj from this Tresource.
+		Its descendants are kept. If it has descendants, it is kept as a node without data.
+		Removing an object which is not present does nothing.
+		"""
+		...
+
+	@abstractmethod
+	def remove_subtree(self, obj: AzObjT) -> None:
+		"""
+		Remove an AzObj and all of its descendants from this Tresource.
+		Removing an object which is not present does nothing.
+		"""
+		...
+
+	def remove_subtrees(self, objs: Iterable[AzObjT]) -> None:
+		"""Remove many AzObjs and all of their descendants from this Tresource"""
+		for obj in objs:
+			self.remove_subtree(obj)
+
+	def upsert_many(self, items: Iterable[Tuple[AzObjT, DataT]]) -> None:
+		"""Set the data of many objects, replacing it if they are present"""
+		for obj, data in items:
+			self.set_data(obj, data)
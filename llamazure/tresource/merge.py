@@ -0,0 +1,83 @@
+"""Merge Tresources which were built independently"""
+
+from __future__ import annotations
+
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Callable, Iterable, Optional, TypeVar
+
+if TYPE_CHECKING:
+	from llamazure.tresource.itresource import ITresource
+
+T = TypeVar("T")
+
+ConflictPolicy = Callable[[T, T], T]
+"""
+Decide what data a node should have when both Tresources being merged have data for it.
+Called as `policy(existing, incoming)`, where `existing` is the data in the Tresource being merged into.
+It is only called if both sides have data; if only one side has data, that data is used.
+"""
+
+
+class MergeConflict(ValueError):
+	"""Both Tresources being merged had different data for the same resource"""
+
+	def __init__(self, existing, incoming):
+		super().__init__(f"conflicting data when merging Tresources: existing={existing!r} incoming={incoming!r}")
+		self.existing = existing
+		self.incoming = incoming
+
+
+def take_incoming(existing: T, incoming: T) -> T:
+	"""Conflict policy: the data from the Tresource being merged in wins. This is the same as repeated `set_data`"""
+	return incoming
+
+
+def keep_existing(existing: T, incoming: T) -> T:
+	"""Conflict policy: the data already in the Tresource wins"""
+	return existing
+
+
+def raise_on_conflict(existing: T, incoming: T) -> T:
+	"""Conflict policy: raise a `MergeConflict` if the data differs"""
+	if existing != incoming:
+		raise MergeConflict(existing, incoming)
+	return existing
+
+
+def resolve(existing: Optional[T], incoming: Optional[T], conflict: ConflictPolicy) -> Optional[T]:
+	"""Resolve the data for a node which might be present in both Tresources"""
+	if incoming is None:
+		return existing
+	if existing is None:
+		return incoming
+	return conflict(existing, incoming)
+
+
+ShardT = TypeVar("ShardT")
+TresourceT = TypeVar("TresourceT", bound="ITresource")
+
+
+def build_sharded(build: Callable[[ShardT], TresourceT], shards: Iterable[ShardT], executor: Optional[Executor] = None, max_workers: Optional[int] = None) -> TresourceT:
+	"""
+	Build a Tresource for each shard in parallel and merge them together.
+	For example, you could shard by subscription and have `build` load all the resources in one subscription.
+
+	By default, shards are built in a `ProcessPoolExecutor`, so `build` and the shards must be picklable.
+	Trees are merged as soon as they are built, so merging overlaps with building the remaining shards.
+	The order of merging is therefore not deterministic, so shards should not have conflicting data for the same resource.
+	"""
+	owns_executor = executor is None
+	pool = executor or ProcessPoolExecutor(max_workers=max_workers)
+	try:
+		futures = [pool.submit(build, shard) for shard in shards]
+		out: Optional[TresourceT] = None
+		for future in as_completed(futures):
+			tree = future.result()
+			out = tree if out is None else out.merge(tree)
+	finally:
+		if owns_executor:
+			pool.shutdown()
+
+	if out is None:
+		raise ValueError("no shards to build")
+	return out
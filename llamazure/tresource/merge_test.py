@@ -0,0 +1,42 @@
+"""Test merging Tresources"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import pytest
+
+from llamazure.rid import rid
+from llamazure.tresource.merge import build_sharded
+from llamazure.tresource.tresource import TresourceData
+
+shards = [[f"/subscriptions/s{s}/resourceGroups/r{r}/providers/p0/t0/n{n}" for r in range(3) for n in range(3)] for s in range(4)]
+
+
+def build_shard(rids: List[str]) -> TresourceData[str]:
+	"""Build a TresourceData for a shard. Module-level so that it can be pickled"""
+	tree: TresourceData[str] = TresourceData()
+	for rid_str in rids:
+		tree.set_data(rid.parse(rid_str), rid_str)
+	return tree
+
+
+class TestBuildSharded:
+	"""Test building Tresources in parallel"""
+
+	def test_build_sharded_processes(self):
+		tree = build_sharded(build_shard, shards, max_workers=2)
+		expected = build_shard([r for shard in shards for r in shard])
+
+		assert tree.subs() == expected.subs()
+		assert tree.res_flat() == expected.res_flat()
+
+	def test_build_sharded_executor(self):
+		with ThreadPoolExecutor(2) as executor:
+			tree = build_sharded(build_shard, shards, executor=executor)
+		expected = build_shard([r for shard in shards for r in shard])
+
+		assert tree.res_flat() == expected.res_flat()
+
+	def test_build_no_shards(self):
+		with pytest.raises(ValueError):
+			build_sharded(build_shard, [], executor=ThreadPoolExecutor(1))
@@ -3,10 +3,12 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import Dict, FrozenSet, Generic, Iterable, Optional, Tuple, TypeVar, Union
+from typing import AbstractSet, Dict, FrozenSet, Generic, Iterable, List, Optional, Tuple, TypeVar, Union
 
-from llamazure.rid.mp import MP, AzObj, Path, PathResource, PathResourceGroup, PathSubResource, PathSubscription, Resource, ResourceGroup, SubResource, Subscription
+from llamazure.rid import rid
+from llamazure.rid.mp import MP, AzObj, Path, PathResource, PathResourceGroup, PathSubResource, PathSubscription, Resource, ResourceGroup, SubResource, Subscription, parse_chain
 from llamazure.tresource.itresource import INode, ITresource, ITresourceData
+from llamazure.tresource.merge import ConflictPolicy, resolve, take_incoming
 
 
 @dataclass
@@ -23,6 +25,31 @@ class TresourceMP(ITresource[AzObj, Path]):
 		"""Add an iterable of MP to this Tresource"""
 		self.resources.update(dict(mps))
 
+	def merge(self, other: TresourceMP) -> TresourceMP:
+		if len(self.resources) < len(other.resources):
+			other.resources.update(self.resources)
+			self.resources = other.resources
+		else:
+			self.resources.update(other.resources)
+		return self
+
+	def remove(self, obj: AzObj) -> None:
+		self.resources.pop(obj.path, None)
+
+	def remove_subtree(self, obj: AzObj) -> None:
+		"""
+		Remove an object and all of its descendants from this Tresource.
+		Since this Tresource is not a tree, this must check every resource.
+		"""
+		self.remove_subtrees([obj])
+
+	def remove_subtrees(self, objs: Iterable[AzObj]) -> None:
+		"""Remove many objects and all of their descendants from this Tresource, checking every resource only once"""
+		roots = {obj.path for obj in objs}
+		if roots:
+			for path in [path for path in self.resources if in_subtrees(path, roots)]:
+				del self.resources[path]
+
 	def subs(self):
 		return frozenset(obj.sub for obj in self.resources.values())
 
@@ -72,6 +99,42 @@ class TresourceMP(ITresource[AzObj, Path]):
 T = TypeVar("T")
 
 
+TYPE_SUBSCRIPTION = "microsoft.resources/subscriptions"
+TYPE_RG = "microsoft.resources/resourcegroups"
+
+
+def resource_type(obj: Union[AzObj, rid.AzObj]) -> str:
+	"""
+	The type of a resource, like the `type` column of the Azure Resource Graph.
+	For example, "microsoft.network/virtualnetworks/subnets". This also takes `rid` resources
+	"""
+	if isinstance(obj, (Subscription, rid.Subscription)):
+		return TYPE_SUBSCRIPTION
+	if isinstance(obj, (ResourceGroup, rid.ResourceGroup)):
+		return TYPE_RG
+	path = rid.serialise(obj) if isinstance(obj, rid.AzObj) else obj.path
+	i = path.rfind("/providers/")
+	if i == -1:
+		return obj.res_type.lower()  # type: ignore # a SubResource of something that isn't a resource
+	provider, *rest = path[i + len("/providers/") :].split("/")
+	return "/".join([provider, *rest[::2]])
+
+
+def in_subtrees(path: Path, roots: AbstractSet[Path]) -> bool:
+	"""Whether a path is one of the roots or a descendant of one of them"""
+	end = len(path)
+	while end > 0:
+		if path[:end] in roots:
+			return True
+		end = path.rfind("/", 0, end)
+	return False
+
+
+def ancestor_paths(path: Path) -> List[Path]:
+	"""The paths of a resource and its ancestors, from the top down. These are the prefixes of its path which are resources"""
+	return [p for p, _ in parse_chain(path)]
+
+
 @dataclass
 class MPData(INode[AzObj, T]):
 	"""Node class for MP"""
@@ -104,6 +167,95 @@ class TresourceMPData(Generic[T], ITresourceData[AzObj, T, MPData[T], Path]):
 		"""Add an iterable of MP to this Tresource"""
 		self.resources.update(dict(mps))
 
+	def merge(self, other: TresourceMPData[T], conflict: ConflictPolicy = take_incoming) -> TresourceMPData[T]:
+		existing, incoming = self.resources, other.resources
+		if len(existing) >= len(incoming):
+			for path, node in incoming.items():
+				mine = existing.get(path)
+				existing[path] = node if mine is None else MPData(mine.obj, resolve(mine.data, node.data, conflict))
+		else:
+			for path, node in existing.items():
+				theirs = incoming.get(path)
+				incoming[path] = node if theirs is None else MPData(node.obj, resolve(node.data, theirs.data, conflict))
+			self.resources = incoming
+		return self
+
+	def remove(self, obj: AzObj) -> None:
+		"""
+		Remove an object from this Tresource.
+		Its descendants are kept, since this Tresource does not need parents to be present.
+		"""
+		self.resources.pop(obj.path, None)
+
+	def remove_subtree(self, obj: AzObj) -> None:
+		"""
+		Remove an object and all of its descendants from this Tresource.
+		Since this Tresource is not a tree, this must check every resource.
+		"""
+		self.remove_subtrees([obj])
+
+	def remove_subtrees(self, objs: Iterable[AzObj]) -> None:
+		"""Remove many objects and all of their descendants from this Tresource, checking every resource only once"""
+		roots = {obj.path for obj in objs}
+		if roots:
+			for path in [path for path in self.resources if in_subtrees(path, roots)]:
+				del self.resources[path]
+
+	def ancestors(self, obj: AzObj) -> List[MPData[T]]:
+		"""
+		The nodes of the ancestors of a resource in this Tresource, from the top down.
+		Ancestors which aren't in this Tresource are skipped. This takes time proportional to the depth of the resource.
+		"""
+		return [self.resources[p] for p in ancestor_paths(obj.path)[:-1] if p in self.resources]
+
+	def nearest_ancestor_with_data(self, obj: AzObj, include_self: bool = False) -> Optional[MPData[T]]:
+		"""
+		The node of the nearest ancestor of a resource which has data, or None if none of them do.
+		This is useful for finding which scope a setting, like an RBAC assignment or a policy, applies from.
+		"""
+		paths = ancestor_paths(obj.path)
+		for p in reversed(paths if include_self else paths[:-1]):
+			node = self.resources.get(p)
+			if node is not None and node.data is not None:
+				return node
+		return None
+
+	def nearest_ancestors_with_data(self, objs: Iterable[AzObj], include_self: bool = False) -> List[Optional[MPData[T]]]:
+		"""
+		Find the nearest ancestor with data for many resources, in the same order as the resources.
+		The answer for each ancestor is memoised, so resources which share ancestors only look them up once.
+		"""
+		memo: Dict[Path, Optional[MPData[T]]] = {}  # the nearest node with data at or above a path
+		out = []
+		for obj in objs:
+			paths = ancestor_paths(obj.path)
+			if not include_self:
+				paths = paths[:-1]
+			known = len(paths)
+			while known and paths[known - 1] not in memo:
+				known -= 1
+			found = memo[paths[known - 1]] if known else None
+			for p in paths[known:]:
+				node = self.resources.get(p)
+				if node is not None and node.data is not None:
+					found = node
+				memo[p] = found
+			out.append(found)
+		return out
+
+	@staticmethod
+	def lca(a: AzObj, b: AzObj) -> Optional[Path]:
+		"""
+		The path of the lowest common ancestor of 2 resources, or None if they don't have one, for example if they are in different subscriptions.
+		A resource counts as its own ancestor, so if `a` contains `b` this is `a`.
+		"""
+		common = None
+		for i, j in zip(ancestor_paths(a.path), ancestor_paths(b.path)):
+			if i != j:
+				break
+			common = i
+		return common
+
 	def subs(self) -> FrozenSet[PathSubscription]:
 		return frozenset(obj.obj.sub for obj in self.resources.values())
 
@@ -2,9 +2,12 @@
 
 from typing import Type
 
+import pytest
+
 from llamazure.rid import conv, rid
 from llamazure.rid.mp import AzObj, Path
-from llamazure.tresource.conftest import ABCTestBuildTree, ABCTestQuery, TreeImplSpec
+from llamazure.tresource.conftest import ABCTestAncestors, ABCTestBuildTree, ABCTestMerge, ABCTestQuery, ABCTestRemove, TreeImplSpec
+from llamazure.tresource.merge import MergeConflict, keep_existing, raise_on_conflict
 from llamazure.tresource.mp import TresourceMP, TresourceMPData
 
 
@@ -72,3 +75,90 @@ class TestQueryMPData(ABCTestQuery):
 	@property
 	def impl(self) -> TreeImplSpec:
 		return TreeMPDataImpl()
+
+
+class TestMergeMP(ABCTestMerge):
+	"""Test merging MP Tresources"""
+
+	@property
+	def impl(self) -> TreeImplSpec:
+		return TreeMPImpl()
+
+
+class TestMergeMPData(ABCTestMerge):
+	"""Test merging MP Data Tresources"""
+
+	@property
+	def impl(self) -> TreeImplSpec:
+		return TreeMPDataImpl()
+
+
+class TestMergeMPDataConflicts:
+	"""Test the conflict policies when merging MP Data Tresources"""
+
+	res = conv.rid2mp(rid.parse("/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n0"))
+	other_res = conv.rid2mp(rid.parse("/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n1"))
+
+	def trees(self):
+		existing: TresourceMPData[int] = TresourceMPData()
+		existing.set_data(self.res, 0)
+		incoming: TresourceMPData[int] = TresourceMPData()
+		incoming.set_data(self.res, 1)
+		incoming.set_data(self.other_res, 2)
+		return existing, incoming
+
+	def test_take_incoming(self):
+		existing, incoming = self.trees()
+		merged = existing.merge(incoming)
+		assert merged.resources[self.res.path].data == 1
+		assert merged.resources[self.other_res.path].data == 2
+
+	def test_keep_existing(self):
+		existing, incoming = self.trees()
+		merged = existing.merge(incoming, keep_existing)
+		assert merged.resources[self.res.path].data == 0
+
+	def test_keep_existing_when_existing_is_larger(self):
+		"""Merging moves the smaller tree into the larger one, which must not change which side wins"""
+		existing, incoming = self.trees()
+		incoming.merge(existing, keep_existing)
+		assert incoming.resources[self.res.path].data == 1
+
+	def test_raise_on_conflict(self):
+		existing, incoming = self.trees()
+		with pytest.raises(MergeConflict):
+			existing.merge(incoming, raise_on_conflict)
+
+
+class TestRemoveMP(ABCTestRemove):
+	"""Test removing from MP Tresources"""
+
+	@property
+	def impl(self) -> TreeImplSpec:
+		return TreeMPImpl()
+
+
+class TestRemoveMPData(ABCTestRemove):
+	"""Test removing from MP Data Tresources"""
+
+	@property
+	def impl(self) -> TreeImplSpec:
+		return TreeMPDataImpl()
+
+	def test_remove_subtree_does_not_remove_siblings_with_same_prefix(self):
+		"""Test that removing a resource does not remove siblings whose name starts with its name"""
+		tree: TresourceMPData[int] = TresourceMPData()
+		res = conv.rid2mp(rid.parse("/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n1"))
+		sibling = conv.rid2mp(rid.parse("/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n10"))
+		tree.set_data(res, 0)
+		tree.set_data(sibling, 1)
+
+		tree.remove_subtree(res)
+
+		assert set(tree.resources.keys()) == {sibling.path}
+
+
+class TestAncestorsMPData(ABCTestAncestors):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return TreeMPDataImpl()
@@ -0,0 +1,192 @@
+"""TresourceData with cheap immutable snapshots"""
+
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from llamazure.rid.rid import AzObj, get_chain
+from llamazure.tresource.merge import ConflictPolicy, resolve, take_incoming
+from llamazure.tresource.tresource import Node, T, TresourceData, move_cursor
+
+
+@dataclass
+class CowNode(Node[T]):
+	"""A Node which knows which PersistentTresourceData created it, and in which generation"""
+
+	gen: int = 0
+	owner: Optional[object] = field(default=None, repr=False, compare=False)  # the identity of the Tresource which may modify this Node in place
+
+
+@dataclass
+class TresourceDataSnapshot(TresourceData[T]):
+	"""An immutable view of a PersistentTresourceData at a point in time"""
+
+	def set_data_chain(self, chain: Sequence[AzObj], data: T):
+		raise TypeError("Tresource snapshots are immutable")
+
+	def add_node_chain(self, chain: Sequence[AzObj], node: Node[T]):
+		raise TypeError("Tresource snapshots are immutable")
+
+	def set_data_many(self, items: Iterable[Tuple[AzObj, T]]):
+		raise TypeError("Tresource snapshots are immutable")
+
+	def add_many(self, nodes: Iterable[Node[T]]):
+		raise TypeError("Tresource snapshots are immutable")
+
+	def remove(self, obj: AzObj) -> None:
+		raise TypeError("Tresource snapshots are immutable")
+
+	def remove_subtree(self, obj: AzObj) -> None:
+		raise TypeError("Tresource snapshots are immutable")
+
+	def merge(self, other: TresourceData[T], conflict: ConflictPolicy = take_incoming) -> TresourceDataSnapshot[T]:
+		raise TypeError("Tresource snapshots are immutable")
+
+
+@dataclass
+class PersistentTresourceData(TresourceData[T]):
+	"""
+	A TresourceData which can take immutable snapshots in O(1).
+
+	Nodes are shared between the Tresource and its snapshots.
+	After a snapshot, a write copies only the Nodes on the path from the root to the Node it modifies.
+	Writes which happen before the next snapshot modify those copies in place.
+	Snapshots are never modified, so readers of a snapshot never need a lock and never see a half-applied write.
+
+	Writes and snapshots are serialised with a lock.
+	Nodes passed to `add` or moved in by `merge` become part of snapshots, so they should not be modified afterwards.
+	"""
+
+	resources: Node[T] = field(default_factory=lambda: CowNode(None, None))  # type: ignore # This node is just to make recursion easier, we can contain its grossness
+	_gen: int = field(default=0, init=False, repr=False, compare=False)
+	_owner: object = field(default_factory=object, init=False, repr=False, compare=False)  # generations are only comparable within one Tresource
+	_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+	def snapshot(self) -> TresourceDataSnapshot[T]:
+		"""Take an immutable snapshot of this Tresource"""
+		with self._lock:
+			self._gen += 1
+			return TresourceDataSnapshot(self.resources)
+
+	def _own(self, node: Node[T]) -> CowNode[T]:
+		"""Get a version of this node which can be modified, copying it if it might be in a snapshot"""
+		if isinstance(node, CowNode) and node.owner is self._owner and node.gen == self._gen:
+			return node
+		return CowNode(node.obj, node.data, dict(node.children), self._gen, self._owner)
+
+	def _own_child(self, ref: CowNode[T], obj: AzObj) -> CowNode[T]:
+		"""Get a modifiable version of a child of an owned Node, creating it if it is missing"""
+		slug = obj.slug()
+		child = ref.children.get(slug)
+		owned = CowNode(obj, None, gen=self._gen, owner=self._owner) if child is None else self._own(child)
+		ref.children[slug] = owned
+		return owned
+
+	def _own_path(self, chain: Sequence[AzObj], create: bool) -> Optional[List[CowNode[T]]]:
+		"""
+		Get modifiable versions of the Nodes from the root to the end of the chain.
+		Missing Nodes are created if `create`; otherwise, returns None if a Node is missing.
+		The new root is not published, so nothing is visible until the caller assigns `self.resources`.
+		"""
+		ref = self._own(self.resources)
+		path = [ref]
+		for i in chain:
+			if not create and i.slug() not in ref.children:
+				return None
+			ref = self._own_child(ref, i)
+			path.append(ref)
+		return path
+
+	def set_data_chain(self, chain: Sequence[AzObj], data: T):
+		with self._lock:
+			path = self._own_path(chain, create=True)
+			assert path is not None  # we create missing nodes
+			path[-1].data = data
+			self.resources = path[0]
+
+	def add_node_chain(self, chain: Sequence[AzObj], node: Node[T]):
+		with self._lock:
+			path = self._own_path(chain, create=True)
+			assert path is not None  # we create missing nodes
+			path[-1].children[node.obj.slug()] = node
+			self.resources = path[0]
+
+	def set_data_many(self, items: Iterable[Tuple[AzObj, T]]):
+		"""
+		Set the data of many resources, taking the lock once.
+		Like `TresourceData.set_data_many`, this keeps a cursor on the path to the last resource set.
+		Nodes are only copied once per snapshot, so a path shared by many resources is copied once.
+		"""
+		with self._lock:
+			root = self._own(self.resources)
+			path: List[Tuple[AzObj, CowNode[T]]] = []
+			for obj, data in items:
+				node = self._own_child(move_cursor(path, root, obj, self._own_child), obj)
+				node.data = data
+				path.append((obj, node))
+			self.resources = root
+
+	def add_many(self, nodes: Iterable[Node[T]]):
+		"""
+		Add many nodes, taking the lock once.
+		Like `TresourceData.add_many`, this keeps a cursor on the path to the parent of the last node added.
+		"""
+		with self._lock:
+			root = self._own(self.resources)
+			path: List[Tuple[AzObj, CowNode[T]]] = []
+			for node in nodes:
+				# the added node isn't on the cursor, since it isn't owned. It is only copied if something is added under it
+				parent = move_cursor(path, root, node.obj, self._own_child)
+				parent.children[node.obj.slug()] = node
+			self.resources = root
+
+	def remove(self, obj: AzObj) -> None:
+		with self._lock:
+			path = self._own_path(get_chain(obj)[:-1], create=False)
+			if path is None:
+				return
+			parent = path[-1]
+			slug = obj.slug()
+			node = parent.children.get(slug)
+			if node is None:
+				return
+			if node.children:
+				owned = self._own(node)
+				owned.data = None
+				parent.children[slug] = owned
+			else:
+				del parent.children[slug]
+			self.resources = path[0]
+
+	def remove_subtree(self, obj: AzObj) -> None:
+		with self._lock:
+			path = self._own_path(get_chain(obj)[:-1], create=False)
+			if path is None or obj.slug() not in path[-1].children:
+				return
+			del path[-1].children[obj.slug()]
+			self.resources = path[0]
+
+	def _merge_children(self, parent: CowNode[T], incoming: Node[T], conflict: ConflictPolicy):
+		"""Merge the children of a Node into an owned Node. Subtrees which are only in `incoming` are moved in without copying"""
+		for slug, theirs in incoming.children.items():
+			mine = parent.children.get(slug)
+			if mine is None:
+				parent.children[slug] = theirs
+			else:
+				owned = self._own(mine)
+				owned.data = resolve(owned.data, theirs.data, conflict)
+				self._merge_children(owned, theirs, conflict)
+				parent.children[slug] = owned
+
+	def merge(self, other: TresourceData[T], conflict: ConflictPolicy = take_incoming) -> PersistentTresourceData[T]:
+		"""
+		Merge another Tresource into this one.
+		This copies Nodes which are in both Tresources, so it takes time proportional to the overlap of the Tresources.
+		"""
+		with self._lock:
+			root = self._own(self.resources)
+			self._merge_children(root, other.resources, conflict)
+			self.resources = root
+		return self
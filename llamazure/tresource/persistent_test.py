@@ -0,0 +1,191 @@
+"""Test TresourceData with snapshots"""
+
+import threading
+from typing import Type
+
+import pytest
+
+from llamazure.rid import rid
+from llamazure.rid.rid import AzObj, parse_chain
+from llamazure.tresource.conftest import ABCTestBuildTree, ABCTestMerge, ABCTestRemove, TreeImplSpec
+from llamazure.tresource.persistent import PersistentTresourceData
+from llamazure.tresource.tresource import Node, T
+
+
+class PersistentDataTreeImpl(TreeImplSpec[AzObj, Node[T], AzObj]):
+	"""Implementation of PersistentTresourceData"""
+
+	@property
+	def clz(self) -> Type:
+		return PersistentTresourceData
+
+	def conv(self, obj: rid.AzObj) -> AzObj:
+		return obj
+
+	def recover(self, obj_repr: AzObj) -> rid.AzObj:
+		return obj_repr
+
+	@property
+	def recurse_implicit(self) -> bool:
+		return True
+
+
+class TestBuildPersistentDataTree(ABCTestBuildTree):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return PersistentDataTreeImpl()
+
+
+class TestMergePersistentDataTree(ABCTestMerge):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return PersistentDataTreeImpl()
+
+
+class TestRemovePersistentDataTree(ABCTestRemove):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return PersistentDataTreeImpl()
+
+
+class TestSnapshot:
+	"""Test that snapshots are isolated from later writes"""
+
+	chain = parse_chain("/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n0/providers/p_l0/t_l0/n_l0")
+	other_rg_res = parse_chain("/subscriptions/s0/resourceGroups/r1/providers/p0/t0/n0")[-1]
+
+	def tree(self) -> PersistentTresourceData[int]:
+		tree: PersistentTresourceData[int] = PersistentTresourceData()
+		tree.set_data(self.chain[-2], 0)
+		tree.set_data(self.other_rg_res, 1)
+		return tree
+
+	def test_snapshot_does_not_see_writes(self):
+		tree = self.tree()
+		snapshot = tree.snapshot()
+		before = snapshot.res_flat()
+
+		tree.set_data(self.chain[-1], 2)
+		tree.remove_subtree(self.other_rg_res)
+
+		assert snapshot.res_flat() == before
+		assert self.chain[-1] in tree.res_flat()
+		assert self.other_rg_res not in tree.res_flat()
+
+	def test_snapshot_does_not_see_batch_writes(self):
+		tree = self.tree()
+		snapshot = tree.snapshot()
+		before = snapshot.res_flat()
+
+		tree.set_data_many([(self.chain[-1], 2), (self.chain[-2], 10)])
+
+		assert snapshot.res_flat() == before
+		assert self.chain[-1] in tree.res_flat()
+
+	def test_snapshot_does_not_see_data_changes(self):
+		tree = self.tree()
+		snapshot = tree.snapshot()
+
+		tree.set_data(self.chain[-2], 10)
+
+		assert snapshot.resources.children["/subscriptions/s0"].children["/resourcegroups/r0"].children["/providers/p0/t0/n0"].data == 0
+		assert tree.resources.children["/subscriptions/s0"].children["/resourcegroups/r0"].children["/providers/p0/t0/n0"].data == 10
+
+	def test_writes_share_structure(self):
+		"""Test that a write only copies the path to the Node it modifies"""
+		tree = self.tree()
+		snapshot = tree.snapshot()
+
+		tree.set_data(self.chain[-2], 10)
+
+		old_sub = snapshot.resources.children["/subscriptions/s0"]
+		new_sub = tree.resources.children["/subscriptions/s0"]
+		assert old_sub is not new_sub
+		assert old_sub.children["/resourcegroups/r1"] is new_sub.children["/resourcegroups/r1"]
+
+	def test_writes_without_snapshot_are_in_place(self):
+		tree = self.tree()
+		root = tree.resources
+
+		tree.set_data(self.chain[-1], 2)
+
+		assert tree.resources is root
+
+	def test_merged_nodes_are_not_owned(self):
+		"""Test that Nodes moved in from another Tresource are copied before they are written, so the other Tresource's snapshots don't change"""
+		other = self.tree()
+		other_snapshot = other.snapshot()
+		tree: PersistentTresourceData[int] = PersistentTresourceData()
+		tree.merge(other)
+
+		tree.set_data(self.chain[-2], 99)
+		tree.set_data(self.chain[-1], 2)
+
+		r0 = other_snapshot.resources.children["/subscriptions/s0"].children["/resourcegroups/r0"]
+		assert r0.children["/providers/p0/t0/n0"].data == 0
+		assert not r0.children["/providers/p0/t0/n0"].children
+		assert tree.resources.children["/subscriptions/s0"].children["/resourcegroups/r0"].children["/providers/p0/t0/n0"].data == 99
+
+	def test_batch_reuses_the_walk(self):
+		"""Test that a batch of writes walks from the root only when it leaves the path to the last write"""
+		tree = self.tree()
+		tree.snapshot()
+		ress = [rid.parse(f"/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n{i}") for i in range(10)]
+		calls = 0
+		own_child = tree._own_child
+
+		def counting(ref, obj):
+			nonlocal calls
+			calls += 1
+			return own_child(ref, obj)
+
+		tree._own_child = counting  # type: ignore
+		tree.set_data_many((res, i) for i, res in enumerate(ress))
+
+		assert calls == 2 + len(ress)  # the subscription and resource group, and then each resource
+		assert tree.snapshot().res_flat() >= set(ress)
+
+	def test_batch_add_under_added_node(self):
+		"""Test that a node added in a batch is copied before something is added under it, so the node given is not modified"""
+		tree = self.tree()
+		snapshot = tree.snapshot()
+		before = snapshot.res_flat()
+		added = Node(self.chain[-2], 5)
+
+		tree.add_many([added, Node(self.chain[-1], 6)])
+
+		assert not added.children
+		assert snapshot.res_flat() == before
+		assert {self.chain[-2], self.chain[-1]} <= tree.res_flat()
+
+	def test_snapshot_is_immutable(self):
+		snapshot = self.tree().snapshot()
+
+		with pytest.raises(TypeError):
+			snapshot.set_data(self.chain[-1], 2)
+		with pytest.raises(TypeError):
+			snapshot.remove(self.chain[-2])
+		with pytest.raises(TypeError):
+			snapshot.set_data_many([(self.chain[-1], 2)])
+
+	def test_concurrent_readers(self):
+		"""Test that readers of snapshots always see complete writes"""
+		tree: PersistentTresourceData[int] = PersistentTresourceData()
+		ress = [rid.parse(f"/subscriptions/s0/resourceGroups/r{i % 4}/providers/p0/t0/n{i}") for i in range(2000)]
+		done = threading.Event()
+		sizes = []
+
+		def read():
+			while not done.is_set():
+				snapshot = tree.snapshot()
+				sizes.append((len(snapshot.res_flat()), len(snapshot.res_flat())))
+
+		reader = threading.Thread(target=read)
+		reader.start()
+		for res in ress:
+			tree.set_data(res, 0)
+		done.set()
+		reader.join()
+
+		assert all(a == b for a, b in sizes)
+		assert len(tree.res_flat()) == len(ress)
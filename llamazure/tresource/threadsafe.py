@@ -0,0 +1,184 @@
+"""Tresources which can be shared between threads"""
+
+from __future__ import annotations
+
+import threading
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, DefaultDict, Dict, FrozenSet, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from llamazure.rid.rid import AzObj, ResourceGroup, Subscription, get_chain
+from llamazure.tresource.merge import ConflictPolicy, take_incoming
+from llamazure.tresource.tresource import Node, T, Tresource, TresourceData
+
+
+class StripedLocks:
+	"""
+	A fixed number of locks, with keys distributed among them.
+	This lets threads working on different keys proceed in parallel without needing a lock per key.
+	"""
+
+	def __init__(self, stripes: int):
+		self.locks = tuple(threading.Lock() for _ in range(stripes))
+
+	def index(self, key: Hashable) -> int:
+		"""The index of the lock for this key"""
+		return hash(key) % len(self.locks)
+
+	def __call__(self, key: Hashable) -> threading.Lock:
+		"""The lock for this key"""
+		return self.locks[self.index(key)]
+
+	@contextmanager
+	def all(self) -> Iterator[None]:
+		"""Hold all the locks. They are always acquired in the same order, so this can't deadlock with itself"""
+		with ExitStack() as stack:
+			for lock in self.locks:
+				stack.enter_context(lock)
+			yield
+
+
+X = TypeVar("X")
+
+
+def _batch_by_stripe(locks: StripedLocks, items: Iterable[X], obj: Callable[[X], AzObj]) -> Dict[int, List[X]]:
+	"""
+	Group items by the stripe of the root of their resource, so each lock only needs to be taken once.
+	Items keep their order within a batch, so the batch can reuse walks with `add_many` or `set_data_many`.
+	"""
+	batches: DefaultDict[int, List[X]] = defaultdict(list)
+	for item in items:
+		batches[locks.index(get_chain(obj(item))[0])].append(item)
+	return batches
+
+
+@dataclass
+class ConcurrentTresource(Tresource):
+	"""
+	A Tresource which can be filled by many threads at once.
+	Writers lock only the subscription they are writing to, using striped locks.
+	Readers lock the whole Tresource.
+	"""
+
+	stripes: int = 64
+	_locks: StripedLocks = field(init=False, repr=False, compare=False)
+
+	def __post_init__(self):
+		self._locks = StripedLocks(self.stripes)
+
+	def add(self, obj: AzObj):
+		self.add_chain(get_chain(obj))
+
+	def add_chain(self, chain: Sequence[AzObj]):
+		with self._locks(chain[0]):
+			super().add_chain(chain)
+
+	def add_many(self, objs: Iterable[AzObj]):
+		"""Add many resources, taking each lock only once"""
+		for i, batch in _batch_by_stripe(self._locks, objs, lambda obj: obj).items():
+			with self._locks.locks[i]:
+				super().add_many(batch)
+
+	def remove(self, obj: AzObj) -> None:
+		with self._locks(get_chain(obj)[0]):
+			super().remove(obj)
+
+	def remove_subtree(self, obj: AzObj) -> None:
+		with self._locks(get_chain(obj)[0]):
+			super().remove_subtree(obj)
+
+	def merge(self, other: Tresource) -> ConcurrentTresource:
+		with self._locks.all():
+			super().merge(other)
+		return self
+
+	def subs(self) -> FrozenSet[Subscription]:
+		with self._locks.all():
+			return super().subs()
+
+	@property
+	def rgs(self) -> Dict[Subscription, List[ResourceGroup]]:
+		"""Resourcegroups grouped by subscription"""
+		with self._locks.all():
+			return super().rgs
+
+	def rgs_flat(self) -> FrozenSet[ResourceGroup]:
+		with self._locks.all():
+			return super().rgs_flat()
+
+	def res_flat(self) -> FrozenSet[AzObj]:
+		with self._locks.all():
+			return super().res_flat()
+
+
+@dataclass
+class ConcurrentTresourceData(TresourceData[T]):
+	"""
+	A TresourceData which can be filled by many threads at once.
+	Writers lock only the subscription they are writing to, using striped locks.
+	Readers lock the whole Tresource.
+	"""
+
+	stripes: int = 64
+	_locks: StripedLocks = field(init=False, repr=False, compare=False)
+
+	def __post_init__(self):
+		self._locks = StripedLocks(self.stripes)
+
+	def set_data_chain(self, chain: Sequence[AzObj], data: T):
+		with self._locks(chain[0]):
+			super().set_data_chain(chain, data)
+
+	def set_data_many(self, items: Iterable[Tuple[AzObj, T]]):
+		"""Set the data of many resources, taking each lock only once"""
+		for i, batch in _batch_by_stripe(self._locks, items, lambda item: item[0]).items():
+			with self._locks.locks[i]:
+				super().set_data_many(batch)
+
+	def add_node_chain(self, chain: Sequence[AzObj], node: Node[T]):
+		with self._locks(chain[0] if chain else node.obj):
+			super().add_node_chain(chain, node)
+
+	def add_many(self, nodes: Iterable[Node[T]]):
+		"""Add many nodes, taking each lock only once"""
+		for i, batch in _batch_by_stripe(self._locks, nodes, lambda node: node.obj).items():
+			with self._locks.locks[i]:
+				super().add_many(batch)
+
+	def remove(self, obj: AzObj) -> None:
+		with self._locks(get_chain(obj)[0]):
+			super().remove(obj)
+
+	def remove_subtree(self, obj: AzObj) -> None:
+		with self._locks(get_chain(obj)[0]):
+			super().remove_subtree(obj)
+
+	def merge(self, other: TresourceData[T], conflict: ConflictPolicy = take_incoming) -> ConcurrentTresourceData[T]:
+		with self._locks.all():
+			super().merge(other, conflict)
+		return self
+
+	def subs(self) -> FrozenSet[Subscription]:
+		with self._locks.all():
+			return super().subs()
+
+	def rgs_flat(self) -> FrozenSet[ResourceGroup]:
+		with self._locks.all():
+			return super().rgs_flat()
+
+	def res_flat(self) -> FrozenSet[AzObj]:
+		with self._locks.all():
+			return super().res_flat()
+
+	def ancestors(self, obj: AzObj) -> List[Node[T]]:
+		with self._locks(get_chain(obj)[0]):
+			return super().ancestors(obj)
+
+	def nearest_ancestor_with_data(self, obj: AzObj, include_self: bool = False) -> Optional[Node[T]]:
+		with self._locks(get_chain(obj)[0]):
+			return super().nearest_ancestor_with_data(obj, include_self)
+
+	def nearest_ancestors_with_data(self, objs: Iterable[AzObj], include_self: bool = False) -> List[Optional[Node[T]]]:
+		with self._locks.all():
+			return super().nearest_ancestors_with_data(objs, include_self)
@@ -0,0 +1,164 @@
+"""Test Tresources which can be shared between threads"""
+
+import threading
+from typing import Callable, List, Type
+
+from llamazure.rid import rid
+from llamazure.rid.rid import AzObj
+from llamazure.tresource.conftest import ABCTestAncestors, ABCTestBuildTree, ABCTestMerge, ABCTestRemove, TreeImplSpec
+from llamazure.tresource.itresource import ITresource
+from llamazure.tresource.threadsafe import ConcurrentTresource, ConcurrentTresourceData
+from llamazure.tresource.tresource import Node, T, Tresource, TresourceData
+
+
+class ConcurrentTreeImpl(TreeImplSpec[AzObj, AzObj, AzObj]):
+	"""Implementation of ConcurrentTresource"""
+
+	@property
+	def clz(self) -> Type[ITresource]:
+		return ConcurrentTresource
+
+	def conv(self, obj: rid.AzObj) -> AzObj:
+		return obj
+
+	def recover(self, obj_repr: AzObj) -> rid.AzObj:
+		return obj_repr
+
+	@property
+	def recurse_implicit(self) -> bool:
+		return True
+
+
+class ConcurrentDataTreeImpl(TreeImplSpec[AzObj, Node[T], AzObj]):
+	"""Implementation of ConcurrentTresourceData"""
+
+	@property
+	def clz(self) -> Type:
+		return ConcurrentTresourceData
+
+	def conv(self, obj: rid.AzObj) -> AzObj:
+		return obj
+
+	def recover(self, obj_repr: AzObj) -> rid.AzObj:
+		return obj_repr
+
+	@property
+	def recurse_implicit(self) -> bool:
+		return True
+
+
+class TestBuildConcurrentTree(ABCTestBuildTree):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return ConcurrentTreeImpl()
+
+
+class TestMergeConcurrentTree(ABCTestMerge):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return ConcurrentTreeImpl()
+
+
+class TestRemoveConcurrentTree(ABCTestRemove):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return ConcurrentTreeImpl()
+
+
+class TestBuildConcurrentDataTree(ABCTestBuildTree):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return ConcurrentDataTreeImpl()
+
+
+class TestMergeConcurrentDataTree(ABCTestMerge):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return ConcurrentDataTreeImpl()
+
+
+class TestRemoveConcurrentDataTree(ABCTestRemove):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return ConcurrentDataTreeImpl()
+
+
+class TestAncestorsConcurrentDataTree(ABCTestAncestors):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return ConcurrentDataTreeImpl()
+
+
+def run_threads(n: int, target: Callable[[int], None]):
+	"""Run `target` in `n` threads which all start at the same time"""
+	barrier = threading.Barrier(n)
+	errors: List[BaseException] = []
+
+	def run(i: int):
+		barrier.wait()
+		try:
+			target(i)
+		except BaseException as e:  # pylint: disable=broad-exception-caught  # we re-raise in the main thread
+			errors.append(e)
+
+	threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+	for t in threads:
+		t.start()
+	for t in threads:
+		t.join()
+	if errors:
+		raise errors[0]
+
+
+class TestStress:
+	"""Fill Tresources from many threads and check that nothing is lost"""
+
+	n_threads = 8
+	# every thread writes to every subscription, so threads contend for the same subtrees
+	ress = [rid.parse(f"/subscriptions/s{s}/resourceGroups/r{r}/providers/p0/t0/n{n}/t1/c{c}") for s in range(4) for r in range(4) for n in range(8) for c in range(4)]
+
+	def shard(self, i: int) -> List[AzObj]:
+		return self.ress[i :: self.n_threads]
+
+	def test_concurrent_tresource(self):
+		tree = ConcurrentTresource(stripes=2)
+		expected = Tresource()
+		for res in self.ress:
+			expected.add(res)
+
+		def load(i: int):
+			for j, res in enumerate(self.shard(i)):
+				tree.add(res)
+				if j % 16 == 0:
+					tree.res_flat()  # readers must not see a dict changing size
+
+		run_threads(self.n_threads, load)
+
+		assert tree.resources == expected.resources
+		assert tree.res_flat() == expected.res_flat()
+
+	def test_concurrent_tresource_data(self):
+		tree: ConcurrentTresourceData[str] = ConcurrentTresourceData(stripes=2)
+		expected: TresourceData[str] = TresourceData()
+		for res in self.ress:
+			expected.set_data(res, rid.serialise(res))
+
+		def load(i: int):
+			for j, res in enumerate(self.shard(i)):
+				tree.set_data(res, rid.serialise(res))
+				if j % 16 == 0:
+					tree.res_flat()
+
+		run_threads(self.n_threads, load)
+
+		assert tree.resources == expected.resources
+
+	def test_concurrent_batches(self):
+		tree: ConcurrentTresourceData[str] = ConcurrentTresourceData()
+		expected: TresourceData[str] = TresourceData()
+		for res in self.ress:
+			expected.set_data(res, rid.serialise(res))
+
+		run_threads(self.n_threads, lambda i: tree.set_data_many((res, rid.serialise(res)) for res in self.shard(i)))
+
+		assert tree.resources == expected.resources
@@ -4,10 +4,12 @@ from __future__ import annotations
 
 from collections import defaultdict
 from dataclasses import dataclass, field
-from typing import DefaultDict, Dict, FrozenSet, Generic, Iterable, List, Optional, Sequence, TypeVar
+from operator import getitem
+from typing import Any, Callable, DefaultDict, Dict, FrozenSet, Generic, Iterable, List, Optional, Sequence, Tuple, TypeVar
 
 from llamazure.rid.rid import AzObj, Resource, ResourceGroup, SubResource, Subscription, get_chain
 from llamazure.tresource.itresource import INode, ITresource, ITresourceData
+from llamazure.tresource.merge import ConflictPolicy, resolve, take_incoming
 
 
 def recursive_default_dict():
@@ -15,6 +17,56 @@ def recursive_default_dict():
 	return defaultdict(recursive_default_dict)
 
 
+def merge_nested_dicts(a: Dict, b: Dict) -> Dict:
+	"""
+	Merge 2 nested dicts, like those in a Tresource.
+	Entries from the smaller dict are moved into the larger, and the larger dict is returned.
+	"""
+	if len(a) < len(b):
+		a, b = b, a
+	for k, v in b.items():
+		if k in a:
+			a[k] = merge_nested_dicts(a[k], v)
+		else:
+			a[k] = v
+	return a
+
+
+def parent_of(obj: AzObj) -> Optional[AzObj]:
+	"""The parent of a resource in a Tresource, or None if it is at the top"""
+	if isinstance(obj, Resource) or isinstance(obj, SubResource):
+		return obj.parent or obj.rg or obj.sub
+	elif isinstance(obj, ResourceGroup):
+		return obj.sub
+	else:
+		return None
+
+
+R = TypeVar("R")
+
+
+def move_cursor(path: List[Tuple[AzObj, R]], root: R, obj: AzObj, child: Callable[[R, AzObj], R]) -> R:
+	"""
+	Move a cursor to the parent of a resource and return the parent's container.
+	The cursor is the path from the root to the last resource added, as pairs of a resource and its container.
+	If the parent is on the path, we reuse the walk already done; otherwise we walk from the root with `child`.
+	The caller should append the resource to the path.
+	"""
+	parent = parent_of(obj)
+	while path:
+		top, ref = path[-1]
+		if top is parent or (type(top) is type(parent) and top == parent):  # checking the type first is much cheaper than comparing different types of resources
+			return ref
+		path.pop()
+	if parent is None:
+		return root
+	ref = root
+	for i in get_chain(parent):
+		ref = child(ref, i)
+		path.append((i, ref))
+	return ref
+
+
 @dataclass
 class Tresource(ITresource[AzObj, AzObj]):
 	"""A tree of Azure resources"""
@@ -40,6 +92,47 @@ class Tresource(ITresource[AzObj, AzObj]):
 		for i in chain:
 			ref = ref[i]
 
+	def add_many(self, objs: Iterable[AzObj]):
+		"""
+		Add many resources to the tree.
+		This keeps a cursor on the path to the last resource added, so a resource whose parent is on that path is added without walking from the root.
+		This is fastest when resources are grouped by their parents, for example by being sorted by resource ID.
+		"""
+		path: List[Tuple[AzObj, Dict]] = []
+		for obj in objs:
+			parent = move_cursor(path, self.resources, obj, getitem)
+			path.append((obj, parent[obj]))
+
+	def upsert_many(self, objs: Iterable[Any]) -> None:
+		self.add_many(objs)
+
+	def merge(self, other: Tresource) -> Tresource:
+		self.resources = merge_nested_dicts(self.resources, other.resources)  # type: ignore # the nested dicts are all recursive_default_dicts
+		return self
+
+	def _find_parent(self, chain: Sequence[AzObj]) -> Optional[Dict]:
+		"""Find the dict containing the last element of the chain, without creating missing elements"""
+		ref: Dict = self.resources
+		for i in chain[:-1]:
+			if i not in ref:
+				return None
+			ref = ref[i]
+		return ref
+
+	def remove(self, obj: AzObj) -> None:
+		"""
+		Remove an object from this Tresource.
+		Since a Tresource only stores the hierarchy, an object which has descendants is implied by them and is kept.
+		"""
+		parent = self._find_parent(get_chain(obj))
+		if parent is not None and obj in parent and not parent[obj]:
+			del parent[obj]
+
+	def remove_subtree(self, obj: AzObj) -> None:
+		parent = self._find_parent(get_chain(obj))
+		if parent is not None:
+			parent.pop(obj, None)
+
 	def subs(self) -> FrozenSet[Subscription]:
 		return frozenset(self.resources.keys())
 
@@ -100,7 +193,7 @@ class Node(INode[AzObj, T]):
 
 	def add_child(self, child: Node[T]):
 		"""Add a child to this node"""
-		self.children[Node.obj.slug()] = child
+		self.children[child.obj.slug()] = child
 
 	def add_children(self, children: Iterable[Node[T]]):
 		"""Add multiple children to this node"""
@@ -108,6 +201,30 @@ class Node(INode[AzObj, T]):
 			self.add_child(child)
 
 
+def merge_nodes(existing: Node[T], incoming: Node[T], conflict: ConflictPolicy) -> Node[T]:
+	"""Merge 2 Nodes for the same resource. The `existing` Node is updated and returned"""
+	existing.data = resolve(existing.data, incoming.data, conflict)
+	existing.children = merge_node_children(existing.children, incoming.children, conflict)
+	return existing
+
+
+def merge_node_children(existing: Dict[str, Node[T]], incoming: Dict[str, Node[T]], conflict: ConflictPolicy) -> Dict[str, Node[T]]:
+	"""
+	Merge the children of 2 Nodes.
+	Entries from the smaller dict are moved into the larger, and the larger dict is returned.
+	"""
+	if len(existing) >= len(incoming):
+		for slug, node in incoming.items():
+			mine = existing.get(slug)
+			existing[slug] = node if mine is None else merge_nodes(mine, node, conflict)
+		return existing
+	else:
+		for slug, node in existing.items():
+			theirs = incoming.get(slug)
+			incoming[slug] = node if theirs is None else merge_nodes(node, theirs, conflict)
+		return incoming
+
+
 @dataclass
 class TresourceData(Generic[T], ITresourceData[AzObj, T, Node[T], AzObj]):
 	"""A tree of Azure resources with data attached"""
@@ -129,7 +246,7 @@ class TresourceData(Generic[T], ITresourceData[AzObj, T, Node[T], AzObj]):
 		ref = self.resources
 		for i in chain:
 			slug = i.slug()
-			if i not in ref.children:
+			if slug not in ref.children:
 				ref.children[slug] = ref = Node(i, None)  # multiple assignment is done left-to-right
 			else:
 				ref = ref.children[slug]
@@ -152,13 +269,146 @@ class TresourceData(Generic[T], ITresourceData[AzObj, T, Node[T], AzObj]):
 		ref = self.resources
 		for i in chain:
 			slug = i.slug()
-			if i not in ref.children:
+			if slug not in ref.children:
 				ref.children[slug] = ref = Node(i, None)
 			else:
 				ref = ref.children[slug]
 
 		ref.children[node.obj.slug()] = node
 
+	@staticmethod
+	def _child(ref: Node[T], obj: AzObj) -> Node[T]:
+		"""Get a child Node, creating it if it is missing"""
+		slug = obj.slug()
+		child = ref.children.get(slug)
+		if child is None:
+			child = ref.children[slug] = Node(obj, None)
+		return child
+
+	def set_data_many(self, items: Iterable[Tuple[AzObj, T]]):
+		"""
+		Set the data of many resources.
+		This keeps a cursor on the path to the last resource set, so a resource whose parent is on that path is set without walking from the root.
+		This is fastest when resources are grouped by their parents, for example by being sorted by resource ID.
+		"""
+		path: List[Tuple[AzObj, Node[T]]] = []
+		for obj, data in items:
+			parent = move_cursor(path, self.resources, obj, self._child)
+			slug = obj.slug()
+			node = parent.children.get(slug)
+			if node is None:
+				node = parent.children[slug] = Node(obj, data)
+			else:
+				node.data = data
+			path.append((obj, node))
+
+	def add_many(self, nodes: Iterable[Node[T]]):
+		"""
+		Add many nodes to the tresource.
+		Like `set_data_many`, this reuses the walk to the previous node.
+		"""
+		path: List[Tuple[AzObj, Node[T]]] = []
+		for node in nodes:
+			parent = move_cursor(path, self.resources, node.obj, self._child)
+			parent.children[node.obj.slug()] = node
+			path.append((node.obj, node))
+
+	def upsert_many(self, items: Iterable[Tuple[AzObj, T]]) -> None:
+		self.set_data_many(items)
+
+	def merge(self, other: TresourceData[T], conflict: ConflictPolicy = take_incoming) -> TresourceData[T]:
+		self.resources.children = merge_node_children(self.resources.children, other.resources.children, conflict)
+		return self
+
+	def _find_parent(self, chain: Sequence[AzObj]) -> Optional[Node[T]]:
+		"""Find the Node containing the last element of the chain, without creating missing Nodes"""
+		ref: Optional[Node[T]] = self.resources
+		for i in chain[:-1]:
+			ref = ref.children.get(i.slug())  # type: ignore # ref can only be None when we return
+			if ref is None:
+				return None
+		return ref
+
+	def remove(self, obj: AzObj) -> None:
+		parent = self._find_parent(get_chain(obj))
+		if parent is None:
+			return
+		slug = obj.slug()
+		node = parent.children.get(slug)
+		if node is None:
+			return
+		if node.children:
+			node.data = None
+		else:
+			del parent.children[slug]
+
+	def remove_subtree(self, obj: AzObj) -> None:
+		parent = self._find_parent(get_chain(obj))
+		if parent is not None:
+			parent.children.pop(obj.slug(), None)
+
+	@staticmethod
+	def _find_child(ref: Optional[Node[T]], obj: AzObj) -> Optional[Node[T]]:
+		"""Get a child Node, or None if it or its parent is missing"""
+		return None if ref is None else ref.children.get(obj.slug())
+
+	def _walk(self, chain: Sequence[AzObj]) -> List[Node[T]]:
+		"""The Nodes along a chain, from the top down. This stops at the first missing Node"""
+		out = []
+		ref = self.resources
+		for i in chain:
+			child = ref.children.get(i.slug())
+			if child is None:
+				break
+			out.append(child)
+			ref = child
+		return out
+
+	@staticmethod
+	def _nearest_with_data(nodes: Iterable[Optional[Node[T]]]) -> Optional[Node[T]]:
+		"""The first Node with data, looking from the bottom up"""
+		return next((node for node in nodes if node is not None and node.data is not None), None)
+
+	def ancestors(self, obj: AzObj) -> List[Node[T]]:
+		"""The Nodes of the ancestors of a resource in this Tresource, from the top down. This takes time proportional to the depth of the resource"""
+		return self._walk(get_chain(obj)[:-1])
+
+	def nearest_ancestor_with_data(self, obj: AzObj, include_self: bool = False) -> Optional[Node[T]]:
+		"""
+		The Node of the nearest ancestor of a resource which has data, or None if none of them do.
+		This is useful for finding which scope a setting, like an RBAC assignment or a policy, applies from.
+		"""
+		chain = get_chain(obj)
+		return self._nearest_with_data(reversed(self._walk(chain if include_self else chain[:-1])))
+
+	def nearest_ancestors_with_data(self, objs: Iterable[AzObj], include_self: bool = False) -> List[Optional[Node[T]]]:
+		"""
+		Find the nearest ancestor with data for many resources, in the same order as the resources.
+		Like `set_data_many`, this reuses the walk to the previous resource, so it is fastest when resources are grouped by their parents.
+		"""
+		out = []
+		path: List[Tuple[AzObj, Optional[Node[T]]]] = []
+		for obj in objs:
+			parent = move_cursor(path, self.resources, obj, self._find_child)
+			node = self._find_child(parent, obj)
+			path.append((obj, node))
+			candidates = reversed(path) if include_self else reversed(path[:-1])
+			out.append(self._nearest_with_data(node for _, node in candidates))
+		return out
+
+	@staticmethod
+	def lca(a: AzObj, b: AzObj) -> Optional[AzObj]:
+		"""
+		The lowest common ancestor of 2 resources, or None if they don't have one, for example if they are in different subscriptions.
+		A resource counts as its own ancestor, so if `a` contains `b` this is `a`.
+		"""
+		common = None
+		for i, j in zip(get_chain(a), get_chain(b)):
+			if i is not j and i.slug() != j.slug():  # the prefix so far matches, so the slugs are enough to compare
+				break
+			common = i
+		return common
+
 	def subs(self) -> FrozenSet[Subscription]:
 		return frozenset(x.obj for x in self.resources.children.values() if isinstance(x.obj, Subscription))
 
@@ -2,14 +2,16 @@
 
 from typing import List, Type, Union
 
+import pytest
 from hypothesis import given
 from hypothesis.strategies import lists
 
 from llamazure.rid import rid
 from llamazure.rid.conftest import st_resource_any, st_resource_complex
-from llamazure.rid.rid import AzObj, Resource, SubResource, parse_chain, serialise
-from llamazure.tresource.conftest import ABCTestBuildTree, TreeImplSpec
+from llamazure.rid.rid import AzObj, Resource, SubResource, get_chain, parse_chain, serialise
+from llamazure.tresource.conftest import ABCTestAncestors, ABCTestBuildTree, ABCTestMerge, ABCTestRemove, TreeImplSpec
 from llamazure.tresource.itresource import ITresource
+from llamazure.tresource.merge import MergeConflict, keep_existing, raise_on_conflict
 from llamazure.tresource.tresource import Node, T, Tresource, TresourceData
 
 
@@ -39,6 +41,14 @@ class TestBuildTree(ABCTestBuildTree):
 		return TreeImpl()
 
 
+class TestMergeTree(ABCTestMerge):
+	"""Test merging Tresources"""
+
+	@property
+	def impl(self) -> TreeImplSpec:
+		return TreeImpl()
+
+
 class TestBuildTreeFromChain:
 	"""Test that adding from chain is the same as adding from a terminal AzObj"""
 
@@ -56,6 +66,60 @@ class TestBuildTreeFromChain:
 		assert single_tree.resources == chain_tree.resources
 
 
+class TestAddMany:
+	"""Test that adding in bulk is the same as adding one at a time"""
+
+	@given(lists(st_resource_any))
+	def test_add_many(self, ress: List[AzObj]):
+		single_tree = Tresource()
+		for res in ress:
+			single_tree.add(res)
+
+		bulk_tree = Tresource()
+		bulk_tree.add_many(ress)
+
+		assert single_tree.resources == bulk_tree.resources
+
+	@given(lists(st_resource_any))
+	def test_set_data_many(self, ress: List[AzObj]):
+		single_tree: TresourceData[int] = TresourceData()
+		for i, res in enumerate(ress):
+			single_tree.set_data(res, i)
+
+		bulk_tree: TresourceData[int] = TresourceData()
+		bulk_tree.set_data_many((res, i) for i, res in enumerate(ress))
+
+		assert single_tree.resources == bulk_tree.resources
+
+	@given(lists(st_resource_complex))
+	def test_add_many_nodes(self, ress: List[AzObj]):
+		single_tree: TresourceData[int] = TresourceData()
+		for i, res in enumerate(ress):
+			single_tree.add(Node(res, i))
+
+		bulk_tree: TresourceData[int] = TresourceData()
+		bulk_tree.add_many(Node(res, i) for i, res in enumerate(ress))
+
+		assert single_tree.resources == bulk_tree.resources
+
+	def test_shared_parents(self):
+		"""Test reusing the walk for resources which share parent objects, including moving back up the tree"""
+		rg = rid.Subscription("s0").rg("r0")
+		ress: List[AzObj] = []
+		for n in range(3):
+			res = rg.resource("p0", "t0", f"n{n}")
+			ress.extend([res, res.subresource("t1", "c0"), res.subresource("t1", "c1").resource("p_l0", "t_l0", "l0")])
+		ress.append(rid.Subscription("s0").rg("r1"))
+
+		single_tree: TresourceData[int] = TresourceData()
+		for i, res in enumerate(ress):
+			single_tree.set_data(res, i)
+		bulk_tree: TresourceData[int] = TresourceData()
+		bulk_tree.set_data_many((res, i) for i, res in enumerate(ress))
+
+		assert single_tree.resources == bulk_tree.resources
+
+
 class DataTreeImpl(TreeImplSpec[AzObj, Node[T], AzObj]):
 	"""Test building a TresourceData"""
 
@@ -96,3 +160,95 @@ class TestNodesDataTree:
 			verifier.set_data(res, data)
 
 		assert verifier.res_flat() == tree.res_flat()
+
+
+class TestMergeDataTree(ABCTestMerge):
+	"""Test merging TresourceData"""
+
+	@property
+	def impl(self) -> TreeImplSpec:
+		return DataTreeImpl()
+
+
+class TestMergeDataTreeConflicts:
+	"""Test the conflict policies when merging TresourceData"""
+
+	res = parse_chain("/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n0")[-1]
+	other_res = parse_chain("/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n1")[-1]
+
+	def trees(self):
+		existing: TresourceData[int] = TresourceData()
+		existing.set_data(self.res, 0)
+		incoming: TresourceData[int] = TresourceData()
+		incoming.set_data(self.res, 1)
+		incoming.set_data(self.other_res, 2)
+		return existing, incoming
+
+	@staticmethod
+	def data_of(tree: TresourceData[int], res: AzObj):
+		node = tree.resources
+		for obj in get_chain(res):
+			node = node.children[obj.slug()]
+		return node.data
+
+	def test_take_incoming(self):
+		existing, incoming = self.trees()
+		merged = existing.merge(incoming)
+		assert self.data_of(merged, self.res) == 1
+		assert self.data_of(merged, self.other_res) == 2
+
+	def test_keep_existing(self):
+		existing, incoming = self.trees()
+		merged = existing.merge(incoming, keep_existing)
+		assert self.data_of(merged, self.res) == 0
+		assert self.data_of(merged, self.other_res) == 2
+
+	def test_raise_on_conflict(self):
+		existing, incoming = self.trees()
+		with pytest.raises(MergeConflict):
+			existing.merge(incoming, raise_on_conflict)
+
+	def test_missing_data_is_not_a_conflict(self):
+		"""Implicit nodes have no data, so they should never conflict"""
+		existing: TresourceData[int] = TresourceData()
+		existing.set_data(self.res.rg, 3)
+		incoming: TresourceData[int] = TresourceData()
+		incoming.set_data(self.other_res, 2)
+
+		merged = existing.merge(incoming, raise_on_conflict)
+		assert self.data_of(merged, self.res.rg) == 3
+		assert self.data_of(merged, self.other_res) == 2
+
+
+class TestRemoveTree(ABCTestRemove):
+	"""Test removing from Tresources"""
+
+	@property
+	def impl(self) -> TreeImplSpec:
+		return TreeImpl()
+
+
+class TestRemoveDataTree(ABCTestRemove):
+	"""Test removing from TresourceData"""
+
+	@property
+	def impl(self) -> TreeImplSpec:
+		return DataTreeImpl()
+
+	def test_remove_keeps_node_without_data(self):
+		"""Test that removing a resource with descendants keeps its Node but removes its data"""
+		target = parse_chain("/subscriptions/s0/resourceGroups/r0/providers/p0/t0/n0/providers/p_l0/t_l0/n_l0")
+		tree: TresourceData[int] = TresourceData()
+		tree.set_data(target[-2], 0)
+		tree.set_data(target[-1], 1)
+
+		tree.remove(target[-2])
+
+		assert TestMergeDataTreeConflicts.data_of(tree, target[-2]) is None
+		assert TestMergeDataTreeConflicts.data_of(tree, target[-1]) == 1
+
+
+class TestAncestorsDataTree(ABCTestAncestors):
+	@property
+	def impl(self) -> TreeImplSpec:
+		return DataTreeImpl()